@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+import metrics
+import math
+import threading
+import time
+
+"""
+Admission control for running programs.
+
+At most maxRunning programs run at the same time, and up to maxQueued more wait for their turn, in order,
+for at most maxWait seconds. Past that, runs are rejected right away with Overloaded instead of piling up
+until they all time out, so the ones that are admitted still finish in time.
+"""
+
+# weight of the last run in the moving averages of the run and wait times
+SMOOTHING = 0.1
+
+class Overloaded(Exception):
+    def __init__(self, retryAfter):
+        super().__init__("Too many programs waiting to run")
+        # seconds the client should wait before retrying
+        self.retryAfter = retryAfter
+
+class AdmissionControl():
+    def __init__(self, maxRunning=16, maxQueued=64, maxWait=10):
+        self.maxRunning = max(maxRunning, 1)
+        self.maxQueued = maxQueued
+        self.maxWait = maxWait
+
+        self.condition = threading.Condition()
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+
+        self.averageRunTime = 0.0
+        self.averageWaitTime = 0.0
+
+    @contextmanager
+    def slot(self, maxWait=None):
+        # waits for a slot to run a program, raises Overloaded if the queue is full or the wait is too long
+        self.acquire(maxWait)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def acquire(self, maxWait=None):
+        # maxWait can only shorten the wait, e.g. for a run that has to start before a deadline
+        maxWait = self.maxWait if maxWait == None else min(maxWait, self.maxWait)
+        start = time.monotonic()
+        with self.condition:
+            # new runs can't skip the ones already waiting
+            if self.queued > 0 or self.running >= self.maxRunning:
+                if self.queued >= self.maxQueued:
+                    self._reject()
+
+                self.queued += 1
+                try:
+                    deadline = start + maxWait
+                    while self.running >= self.maxRunning:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject()
+                        self.condition.wait(remaining)
+                finally:
+                    self.queued -= 1
+
+            self.running += 1
+            waitTime = time.monotonic() - start
+            self.averageWaitTime += SMOOTHING * (waitTime - self.averageWaitTime)
+
+        metrics.QUEUE_WAIT_SECONDS.observe(waitTime, metrics.endpoint.get())
+        metrics.record("queue_wait", waitTime)
+
+    def release(self, runTime=0.0):
+        with self.condition:
+            self.running -= 1
+            self.averageRunTime += SMOOTHING * (runTime - self.averageRunTime)
+            self.condition.notify()
+
+    def check(self):
+        # rejects right away when the queue is full, before doing any work for a request
+        with self.condition:
+            if self.queued >= self.maxQueued and self.running >= self.maxRunning:
+                self._reject()
+
+    def retryAfter(self):
+        # time for the queue to drain at the current run time, in whole seconds
+        drainTime = (self.queued + 1) * self.averageRunTime / self.maxRunning
+        return max(1, min(math.ceil(drainTime), math.ceil(self.maxWait)))
+
+    def isFull(self):
+        with self.condition:
+            return self.queued >= self.maxQueued and self.running >= self.maxRunning
+
+    def stats(self):
+        with self.condition:
+            return {
+                'running': self.running,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'maxRunning': self.maxRunning,
+                'maxQueued': self.maxQueued,
+                'averageWaitTime': self.averageWaitTime,
+                'averageRunTime': self.averageRunTime
+            }
+
+    def _reject(self):
+        # called with the condition held
+        self.rejected += 1
+        metrics.REJECTED_RUNS.inc(metrics.endpoint.get())
+        raise Overloaded(self.retryAfter())
@@ -1,10 +1,21 @@
-from compiler import Compiler
-from compiler.parser import Parser
-from flask import Flask, request, jsonify
+from compiler.global_types import NodeTypes
+from compiler.code_generator import STEP_BUDGET_MARKER
+from compile_cache import CompileCache, CompiledProgram
+from harness import build_test_main, build_batched_main, new_marker, split_batched_output, validate_test_case
+from sandbox import Sandbox, parse_spim_output
+from simulator import Simulator
+from jobs import JobQueue, QueueFull
+from sessions import SessionStore, SessionNotFound
+from admission import AdmissionControl, Overloaded
+import metrics
+from flask import Flask, Response, request, jsonify, stream_with_context
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 import subprocess
+import contextvars
+import hashlib
+import json
 import os
-import shutil
-import tempfile
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,8 +24,133 @@ PORT = int(os.getenv('PORT', 3001))
 TIMEOUT = int(os.getenv('TIMEOUT', 10))
 DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'
 WHITELIST = os.getenv('WHITELIST', '0.0.0.0').split(',')
+BATCH_TEST_CASES = os.getenv('BATCH_TEST_CASES', 'true').lower() == 'true'
+COMPILE_CACHE_ENTRIES = int(os.getenv('COMPILE_CACHE_ENTRIES', 1024))
+COMPILE_CACHE_BYTES = int(os.getenv('COMPILE_CACHE_BYTES', 64 * 1024 * 1024))
+# errors kept for each program and returned by the endpoints, 0 to keep all of them
+MAX_ERRORS = int(os.getenv('MAX_ERRORS', 100))
+# levels statements, and expressions, can be nested in each other in a program, deeper programs get a syntax error
+MAX_NESTING = int(os.getenv('MAX_NESTING', 1000))
+# documents open for /checkSyntax sessions, evicted after being idle for CHECK_SESSION_IDLE_TIMEOUT seconds
+CHECK_SESSIONS = int(os.getenv('CHECK_SESSIONS', 256))
+CHECK_SESSIONS_BYTES = int(os.getenv('CHECK_SESSIONS_BYTES', 16 * 1024 * 1024))
+CHECK_SESSION_IDLE_TIMEOUT = float(os.getenv('CHECK_SESSION_IDLE_TIMEOUT', 300))
+# SQLite file where session documents are shared between worker processes, set by gunicorn.conf.py when there are several
+CHECK_SESSION_STORE = os.getenv('CHECK_SESSION_STORE', '')
+SPIM_POOL_SIZE = int(os.getenv('SPIM_POOL_SIZE', 4))
+SPIM_POOL_MAX_RUNS = int(os.getenv('SPIM_POOL_MAX_RUNS', 100))
+# default for MAX_RUNNING_PROGRAMS, the programs running at the same time across all requests
+MAX_SPIM_PROCESSES = int(os.getenv('MAX_SPIM_PROCESSES', os.cpu_count() or 4))
+TEST_CASE_PARALLELISM = int(os.getenv('TEST_CASE_PARALLELISM', os.cpu_count() or 4))
+BATCH_PARALLELISM = int(os.getenv('BATCH_PARALLELISM', os.cpu_count() or 4))
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 1000))
+# seconds a batch can take, requests can ask for less
+BATCH_TIME_BUDGET = float(os.getenv('BATCH_TIME_BUDGET', 60))
+# 'spim' runs programs with spim in a sandbox, 'simulator' runs them in-process with limits on steps and memory
+EXECUTION_BACKEND = os.getenv('EXECUTION_BACKEND', 'spim').lower()
+# the simulator runs a few million instructions per second in Python, see simulator.py
+SIMULATOR_MAX_STEPS = int(os.getenv('SIMULATOR_MAX_STEPS', 2_000_000))
+SIMULATOR_MAX_MEMORY = int(os.getenv('SIMULATOR_MAX_MEMORY', 64 * 1024 * 1024))
+# programs are stopped once they write more than this, and their outputs are marked as truncated
+MAX_OUTPUT_BYTES = int(os.getenv('MAX_OUTPUT_BYTES', 4 * 1024 * 1024))
+MAX_OUTPUT_LINES = int(os.getenv('MAX_OUTPUT_LINES', 100_000))
+# loop iterations and function calls a program can make before it's stopped, 0 for no limit, requests can set their own
+STEP_BUDGET = int(os.getenv('STEP_BUDGET', 0))
+MAX_STEP_BUDGET = 2**31 - 1
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 1000))
+JOB_RETENTION = int(os.getenv('JOB_RETENTION', 600))
+# SQLite file where jobs are shared between worker processes, set by gunicorn.conf.py when there are several
+JOB_STORE = os.getenv('JOB_STORE', '')
+JOB_MAX_WAIT = int(os.getenv('JOB_MAX_WAIT', 30))
+# set by gunicorn.conf.py to the number of workers, which share the caps on spim processes and running programs
+SERVER_PROCESSES = max(int(os.getenv('SERVER_PROCESSES', 1)), 1)
+# programs running at the same time, and programs waiting to run for at most RUN_QUEUE_MAX_WAIT seconds
+MAX_RUNNING_PROGRAMS = int(os.getenv('MAX_RUNNING_PROGRAMS', MAX_SPIM_PROCESSES))
+RUN_QUEUE_SIZE = int(os.getenv('RUN_QUEUE_SIZE', 4 * MAX_RUNNING_PROGRAMS))
+RUN_QUEUE_MAX_WAIT = float(os.getenv('RUN_QUEUE_MAX_WAIT', TIMEOUT))
+# requests taking longer than this many seconds are logged with the duration of each stage, 0 to not log them
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', 5))
+
+def per_process(limit):
+    # share of a server-wide limit for each worker process, rounded up so it's never 0 if the limit isn't
+    return -(-limit // SERVER_PROCESSES)
 
 app = Flask(__name__)
+compile_cache = CompileCache(COMPILE_CACHE_ENTRIES, COMPILE_CACHE_BYTES, MAX_ERRORS, MAX_NESTING)
+check_sessions = SessionStore(CHECK_SESSIONS, CHECK_SESSIONS_BYTES, CHECK_SESSION_IDLE_TIMEOUT, MAX_ERRORS, MAX_NESTING,
+    storePath=CHECK_SESSION_STORE)
+job_queue = JobQueue(JOB_WORKERS, JOB_MAX_PENDING, JOB_RETENTION, storePath=JOB_STORE)
+admission = AdmissionControl(per_process(MAX_RUNNING_PROGRAMS), per_process(RUN_QUEUE_SIZE), RUN_QUEUE_MAX_WAIT)
+if EXECUTION_BACKEND == 'simulator':
+    backend = Simulator(SIMULATOR_MAX_STEPS, SIMULATOR_MAX_MEMORY, MAX_OUTPUT_BYTES, MAX_OUTPUT_LINES)
+else:
+    backend = Sandbox(
+        TIMEOUT, DEBUG,
+        per_process(SPIM_POOL_SIZE),
+        SPIM_POOL_MAX_RUNS,
+        MAX_OUTPUT_BYTES,
+        MAX_OUTPUT_LINES
+    )
+
+# test cases that are run one by one share this pool, which bounds how many run at the same time across requests
+test_case_executor = ThreadPoolExecutor(max_workers=TEST_CASE_PARALLELISM, thread_name_prefix="test_case")
+# the same for the items of /runCompileBatch requests
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_PARALLELISM, thread_name_prefix="batch")
+
+metrics.registry.register(metrics.CallbackGauge(
+    "compile_cache", "Counters and size of the compile cache", ["stat"],
+    lambda: {(key,): value for key, value in compile_cache.stats().items()}
+))
+metrics.registry.register(metrics.CallbackGauge(
+    "check_sessions", "Documents open for /checkSyntax sessions, their size and evictions", ["stat"],
+    lambda: {(key,): value for key, value in check_sessions.stats().items()}
+))
+metrics.registry.register(metrics.CallbackGauge(
+    "jobs", "Jobs waiting or running, and finished jobs kept", ["stat"],
+    lambda: {(key,): value for key, value in job_queue.stats().items()}
+))
+metrics.registry.register(metrics.CallbackGauge(
+    "run_queue", "Programs running and waiting to run, and the average wait and run times", ["stat"],
+    lambda: {(key,): value for key, value in admission.stats().items()}
+))
+
+@app.before_request
+def set_metrics_endpoint():
+    # stages timed while serving the request are labeled with its endpoint, and summed in its timings
+    metrics.endpoint.set(request.endpoint or 'none')
+    metrics.requestTimings.set(metrics.RequestTimings())
+
+@app.after_request
+def count_request(response):
+    metrics.REQUESTS.inc(request.endpoint or 'none', response.status_code)
+    
+    timings = metrics.requestTimings.get()
+    if timings != None:
+        # streamed responses only have the stages that ran before the first record
+        response.headers['Server-Timing'] = timings.serverTiming()
+        if SLOW_REQUEST_THRESHOLD > 0 and timings.total() >= SLOW_REQUEST_THRESHOLD:
+            log_slow_request(response, timings)
+    return response
+
+def log_slow_request(response, timings : metrics.RequestTimings):
+    # enough to reproduce the request offline: which program it was, how big, and where the time went
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
+    program = data.get('program')
+    
+    entry = {
+        'event': 'slow_request',
+        'endpoint': request.endpoint or 'none',
+        'status': response.status_code,
+        'duration': round(timings.total(), 6),
+        'programHash': hashlib.sha256(program.encode()).hexdigest() if isinstance(program, str) else None,
+        'programSize': len(program) if isinstance(program, str) else 0,
+        'testCases': len(data['testCases']) if isinstance(data.get('testCases'), list) else 0,
+        'items': len(data['items']) if isinstance(data.get('items'), list) else 0,
+        'stages': {name: round(duration, 6) for name, duration in timings.stages().items()}
+    }
+    print(json.dumps(entry), flush=True)
 
 @app.before_request
 def limit_remote_addr():
@@ -24,6 +160,30 @@ def limit_remote_addr():
     if request.remote_addr not in WHITELIST:
         return jsonify({'error': 'Access denied'}), 403
 
+def get_step_budget(data):
+    # returns the step budget of the request, or None if it's not valid
+    stepBudget = data.get('stepBudget', STEP_BUDGET)
+    if isinstance(stepBudget, bool) or not isinstance(stepBudget, int) or not 0 <= stepBudget <= MAX_STEP_BUDGET:
+        return None
+    return stepBudget
+
+def split_step_budget_marker(stdout):
+    # returns the output without the marker written when the program runs out of steps, and whether it was written
+    marker = STEP_BUDGET_MARKER.encode() + b"\n"
+    if stdout.endswith(marker):
+        return stdout[:-len(marker)], True
+    return stdout, False
+
+def overloaded_response(returnDict, error : Overloaded):
+    returnDict['error'] = 'Too many programs waiting to run, try again later'
+    returnDict['retryAfter'] = error.retryAfter
+    return returnDict, 429
+
+def retry_after_header(returnDict):
+    if 'retryAfter' in returnDict:
+        return {'Retry-After': str(returnDict['retryAfter'])}
+    return {}
+
 @app.route('/')
 def index():
     return "Hello World! This is the MIPS Compiler API."
@@ -33,143 +193,228 @@ This endpoint compiles a C- program into MIPS assembly code and runs it using th
 It expects a JSON payload with the following structure:
 {
     "program": "C- program as a string",
-    "inputs": ["input1", "input2", ...]  # optional, inputs to be passed to the program
+    "inputs": ["input1", "input2", ...],  # optional, inputs to be passed to the program
+    "stepBudget": 100000  # optional, loop iterations and function calls before the program is stopped
 }
 
+If the program doesn't compile, the first lexer, syntax or type error is returned, in this order, and programs with
+syntax errors aren't type checked. "errors" has the errors found, with their type, message, line and column.
+The compiler stops at the first error, unless "allErrors" is true, and then "errors" has every error found,
+up to MAX_ERRORS. "errorsTruncated" is set if there were more, or the compiler stopped at the first one.
 If the number of inputs is not what the program expects, it will default the missing inputs to 0.
+If the program runs out of steps, it returns 408 with the error "Step budget exceeded" and the outputs written until then.
+If the program writes more than MAX_OUTPUT_LINES lines or MAX_OUTPUT_BYTES bytes, it's stopped, and the outputs
+written until then are returned with "truncated" set.
+
+When too many programs are waiting to run, it returns 429 with a Retry-After header.
 """
-@app.route('/runCompile', methods=['POST'])
-def run_compile():
-    returnDict = {'outputs': [], 'error': '', 'message': '', 'line': -1, 'column': -1}
+def compile_and_run(data, deadline=None):
+    returnDict = {'outputs': [], 'error': '', 'message': '', 'line': -1, 'column': -1, 'truncated': False}
     
-    data = request.get_json()
     program = data.get('program', '')
     inputs = data.get('inputs', [])
+    stepBudget = get_step_budget(data)
     
     if not program:
-        return jsonify({'error': 'No program provided'}), 400
+        return {'error': 'No program provided'}, 400
+    
+    if stepBudget == None:
+        return {'error': f'The step budget must be an integer between 0 and {MAX_STEP_BUDGET}'}, 400
         
     # Limit number of inputs
     if len(inputs) > 100:
-        return jsonify({'error': 'Too many inputs provided'}), 400
+        return {'error': 'Too many inputs provided'}, 400
     
     # Validate each input
     for i, inp in enumerate(inputs):
         if len(str(inp)) > 1000:
-            return jsonify({'error': f'Input {i} is too long'}), 400
+            return {'error': f'Input {i} is too long'}, 400
+    
+    if deadline != None and time.monotonic() >= deadline:
+        return skipped_response()
     
-    # make temporary directory for file 
-    sandbox_dir = tempfile.mkdtemp(prefix="sandbox_", dir="/tmp")
+    # reject right away when the run queue is full, before compiling
+    try:
+        admission.check()
+    except Overloaded as e:
+        return overloaded_response(returnDict, e)
     
     # compile the program 
     try:
-        try:
-            # run the compiler 
-            compiler = Compiler(program)
-            
-            if not compiler.isTypingValid(prints=False):
-                returnDict['error'] = 'Type checking failed'
-                returnDict['message'] = compiler.typeChecker.firstErrorMessager
-                return jsonify(returnDict), 400
-                
-            parser = compiler.typeChecker.parser
-            if not parser.isSyntaxValid:
-                returnDict['error'] = 'Syntax error in program'
-                returnDict['message'] = parser.firstErrorMessage
-                returnDict['line'] = parser.lineNumber
-                returnDict['column'] = parser.columnNumber
-                return jsonify(returnDict), 400
-            
-            lexer = parser.lexer
-            if not lexer.isSyntaxValid:
-                returnDict['error'] = 'Lexer syntax error'
-                returnDict['message'] = lexer.firstErrorMessage
-                returnDict['line'] = lexer.errorLine
-                returnDict['column'] = lexer.errorColumn
-                return jsonify(returnDict), 400
-            
-            compiler.compile(f'{sandbox_dir}/output.s')
-            
-        except Exception as e:
-            returnDict['error'] = 'Error compiling program'
-            returnDict['message'] = str(e)
-            return jsonify(returnDict), 400
-            
-        # run the compiled file through a mips emulator in a sandbox
-        input_data = '\n'.join(str(inp) for inp in inputs) + '\n'
-        try:
-            # Create a more restricted sandbox with specific directory bindings
-            commands = [
-                "bwrap",
-                # Bind all necessary system directories
-                "--ro-bind", "/bin", "/bin",
-                "--ro-bind", "/usr", "/usr",
-                "--ro-bind", "/lib", "/lib"
-            ]
-            
-            # prod env needs /lib64, but not in debug mode
-            if not DEBUG:
-                print("Binding /lib64")
-                commands.extend(["--ro-bind", "/lib64", "/lib64"])
-            
-            commands += [
-                "--ro-bind", "/etc", "/etc",
-                # Create necessary system directories  
-                "--tmpfs", "/tmp",
-                "--ro-bind", "/proc", "/proc",
-                "--ro-bind", "/dev", "/dev",
-                # Bind our sandbox directory
-                "--bind", sandbox_dir, sandbox_dir,
-                # Security options - only IPC and UTS, no network or user/pid
-                "--unshare-ipc", 
-                "--unshare-uts",
-                "--die-with-parent",
-                "--new-session",
-                # The actual command
-                "spim", "-file", f"{sandbox_dir}/output.s"
-            ]
-            
-            result = subprocess.run(
-                commands,
-                input=input_data.encode(),
-                capture_output=True,
-                timeout=TIMEOUT
-            )
-        except subprocess.TimeoutExpired:
-            returnDict['error'] = 'Timeout expired while running the compiled file'
-            return jsonify(returnDict), 408
-        except Exception as e:
-            returnDict['error'] = 'Error running the compiled file'
-            returnDict['message'] = str(e)
-            return jsonify(returnDict), 500
+        # run the compiler, or get the result of a previous compilation
+        compiled = compile_cache.getChecked(program, fails_fast(data))
         
-        # if there was an error running the compiled file
-        if result.stderr:
-            stderr_msg = result.stderr.decode()
-            # Don't expose internal paths in error messages
-            stderr_msg = stderr_msg.replace(sandbox_dir, "/sandbox")
-            
-            returnDict['error'] = 'Error running compiled file'
-            returnDict['message'] = stderr_msg
-            return jsonify(returnDict), 500
+        if not compiled.isLexerValid:
+            returnDict['error'] = 'Lexer syntax error'
+            returnDict['message'], returnDict['line'], returnDict['column'] = compiled.lexerError
+            returnDict['errors'], returnDict['errorsTruncated'] = compiled.errors()
+            return returnDict, 400
         
-        # return all program outputs as a list, except for first (spim output) and last (empty string after last new line)
-        output = result.stdout.decode()
+        if not compiled.isSyntaxValid:
+            returnDict['error'] = 'Syntax error in program'
+            returnDict['message'], returnDict['line'], returnDict['column'] = compiled.syntaxError
+            returnDict['errors'], returnDict['errorsTruncated'] = compiled.errors()
+            return returnDict, 400
         
-        # in different environments, the output is different, but what follows 'Loaded' is the actual output
-        output = output[output.find('Loaded'):]  
+        if not compiled.isTypingValid:
+            returnDict['error'] = 'Type checking failed'
+            returnDict['message'], returnDict['line'], returnDict['column'] = compiled.typeError
+            returnDict['errors'], returnDict['errorsTruncated'] = compiled.errors()
+            return returnDict, 400
         
-        # First line is the spim output, last line is empty after last new line
-        output_lines = output.split('\n')[1:-1]
+        assembly = compiled.generateAssembly(stepBudget)
         
-        returnDict['outputs'] = [int(line) for line in output_lines]
-        returnDict['message'] = 'Program executed successfully'
-        return jsonify(returnDict), 200
+    except Exception as e:
+        returnDict['error'] = 'Error compiling program'
+        returnDict['message'] = str(e)
+        return returnDict, 400
         
-    finally:
-        # clean up the sandbox directory, including files
-        shutil.rmtree(sandbox_dir, ignore_errors=True)
+    # run the compiled program through a mips emulator in a sandbox
+    input_data = '\n'.join(str(inp) for inp in inputs) + '\n'
+    try:
+        # with a deadline, neither the wait for a slot nor the run can go past it
+        with admission.slot(None if deadline == None else max(deadline - time.monotonic(), 0)):
+            timeout = None if deadline == None else max(deadline - time.monotonic(), 0)
+            result = backend.run(assembly, input_data.encode(), timeout)
+    except Overloaded as e:
+        if deadline != None and time.monotonic() >= deadline:
+            return skipped_response()
+        return overloaded_response(returnDict, e)
+    except subprocess.TimeoutExpired:
+        if deadline != None and time.monotonic() >= deadline:
+            return skipped_response()
+        returnDict['error'] = 'Timeout expired while running the compiled file'
+        return returnDict, 408
+    except Exception as e:
+        returnDict['error'] = 'Error running the compiled file'
+        returnDict['message'] = str(e)
+        return returnDict, 500
+    
+    # if there was an error running the compiled file
+    if result.stderr:
+        returnDict['error'] = 'Error running compiled file'
+        returnDict['message'] = result.stderr.decode()
+        return returnDict, 500
+    
+    stdout, isOutOfSteps = split_step_budget_marker(result.stdout)
+    if isOutOfSteps:
+        returnDict['error'] = 'Step budget exceeded'
+        returnDict['outputs'] = parse_spim_output(stdout)
+        return returnDict, 408
+    
+    # return all program outputs as a list, except for the spim banner
+    returnDict['outputs'] = parse_spim_output(stdout)
+    returnDict['message'] = 'Program executed successfully'
+    if getattr(result, 'truncated', False):
+        returnDict['truncated'] = True
+        returnDict['message'] = 'Program stopped after exceeding the output limit'
+    return returnDict, 200
+
+@app.route('/runCompile', methods=['POST'])
+def run_compile():
+    returnDict, status = compile_and_run(request.get_json())
+    return jsonify(returnDict), status, retry_after_header(returnDict)
+
+def skipped_response():
+    return {'error': 'Skipped, the time budget of the batch ran out', 'skipped': True}, 504
+
+def compile_program(program):
+    # compiles a program of a batch ahead of its runs, errors are reported by each run
+    try:
+        compiled = compile_cache.get(program, failFast=True)
+        if compiled.checkTyping():
+            compiled.generateAssembly()
+    except Exception:
+        pass
+
+def compile_and_run_batch(data):
+    items = data.get('items', [])
+    timeBudget = data.get('timeBudget', BATCH_TIME_BUDGET)
+    
+    if not isinstance(items, list) or not items:
+        return {'error': 'No items provided'}, 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return {'error': f'Too many items provided, the limit is {BATCH_MAX_ITEMS}'}, 400
+    if isinstance(timeBudget, bool) or not isinstance(timeBudget, (int, float)) or timeBudget <= 0:
+        return {'error': 'The time budget must be a positive number of seconds'}, 400
+    
+    deadline = time.monotonic() + min(timeBudget, BATCH_TIME_BUDGET)
+    results = [None] * len(items)
+    
+    # identical items share their run
+    runs = {}
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[i] = {'error': 'Invalid item', 'status': 400}
+            continue
+        runs.setdefault(json.dumps(item, sort_keys=True), []).append(i)
+    
+    # each program is compiled once before its runs, so runs of the same program don't compile it at the same time
+    programs = {items[indexes[0]].get('program') for indexes in runs.values()}
+    compiles = [
+        batch_executor.submit(contextvars.copy_context().run, compile_program, program)
+        for program in programs if isinstance(program, str) and program
+    ]
+    wait(compiles, timeout=max(deadline - time.monotonic(), 0))
+    
+    futures = {
+        batch_executor.submit(contextvars.copy_context().run, compile_and_run, items[indexes[0]], deadline): indexes
+        for indexes in runs.values()
+    }
+    done, notDone = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+    
+    for future in notDone:
+        # runs that haven't started are cancelled, the ones running stop at the deadline in the background
+        future.cancel()
+        returnDict, status = skipped_response()
+        for i in futures[future]:
+            results[i] = {**returnDict, 'status': status}
+    
+    for future in done:
+        try:
+            returnDict, status = future.result()
+        except Exception as e:
+            returnDict, status = {'error': 'Error running the program', 'message': str(e)}, 500
+        for i in futures[future]:
+            results[i] = {**returnDict, 'status': status}
+    
+    return {'results': results, 'skipped': len([result for result in results if result.get('skipped')])}, 200
 
+"""
+This endpoint runs many programs in a single request, like as many /runCompile requests.
+It expects a JSON payload with the following structure:
+{
+    "items": [{"program": "...", "inputs": [...]}, ...],  # same payloads as /runCompile, at most BATCH_MAX_ITEMS
+    "timeBudget": 30  # optional, seconds the batch can take, at most BATCH_TIME_BUDGET
+}
+
+Each program is compiled once, however many items have it, and identical items are only run once.
+Items run in parallel, up to BATCH_PARALLELISM at the same time across requests.
+
+It returns {"results": [...], "skipped": n}, where each result has the response /runCompile would have given,
+and its status code in "status". Items that haven't finished when the time budget runs out are skipped,
+with "skipped" set in their result.
+
+The time budget is enforced inside the runs as well: an item doesn't start after the deadline, its wait for a run
+slot and its run are cut short at the deadline, so runs left when the response is sent stop right after it
+and release their thread and run slot, instead of holding them for up to TIMEOUT seconds.
+"""
+@app.route('/runCompileBatch', methods=['POST'])
+def run_compile_batch():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON payload'}), 400
+    
+    returnDict, status = compile_and_run_batch(data)
+    return jsonify(returnDict), status
+
+"""
+Checks the syntax of a program without type checking or running it.
+"line", "column" and "error" are the first error found, the first lexer error if there's one.
+The lexer and the parser stop at the first error, unless "allErrors" is true, and then "errors" has every lexer
+and parser error, up to MAX_ERRORS, in the order they're in the program, and "errorsTruncated" is set if there
+were more. Otherwise it only has the first error, with "errorsTruncated" set.
+"""
 @app.route('/checkSyntax', methods=['POST'])
 def check_syntax():
     data = request.get_json()
@@ -186,202 +431,449 @@ def check_syntax():
         return jsonify(returnDict), 400
     
     try:
-        parser = Parser(program)
-        parser.parse()
-        
-        if not parser.lexer.isSyntaxValid:
-            returnDict['error'] = parser.lexer.firstErrorMessage
-            returnDict['line'] = parser.lexer.errorLine
-            returnDict['column'] = parser.lexer.errorColumn
-            return jsonify(returnDict), 200
-        
-        if not parser.isSyntaxValid:
-            returnDict['error'] = parser.firstErrorMessage
-            returnDict['line'] = parser.lineNumber
-            returnDict['column'] = parser.columnNumber
-            return jsonify(returnDict), 200
+        return jsonify(syntax_result(returnDict, compile_cache.get(program, fails_fast(data)))), 200
+
+    except Exception as e:
+        returnDict['error'] = 'Error parsing program'
+        returnDict['message'] = str(e)
+        return jsonify(returnDict), 500
 
-        else:
-            returnDict['isSyntaxCorrect'] = True
-            return jsonify(returnDict), 200
+def fails_fast(data):
+    # programs are only compiled until their first error, unless the request asks for all of them
+    return data.get('allErrors') != True
 
+def syntax_result(returnDict, compiled):
+    # the response of /checkSyntax for a compiled program or a session document, which have the same results
+    returnDict['errors'], returnDict['errorsTruncated'] = compiled.errors()
+    
+    if not compiled.isLexerValid:
+        returnDict['error'], returnDict['line'], returnDict['column'] = compiled.lexerError
+    elif not compiled.isSyntaxValid:
+        returnDict['error'], returnDict['line'], returnDict['column'] = compiled.syntaxError
+    else:
+        returnDict['isSyntaxCorrect'] = True
+    return returnDict
+
+"""
+Sessions for editors that check the syntax of a program as it's edited, without sending the whole program each time.
+
+POST /checkSyntax/sessions opens a session with {"program": "..."}, and returns its id in "session", along with
+the response /checkSyntax would give.
+PATCH /checkSyntax/sessions/<id> applies {"edits": [{"start": 0, "end": 0, "text": "..."}, ...]}, where each edit
+replaces the characters from start to end with text, in order, and returns the response for the edited program.
+Only the top-level declarations an edit touches are lexed and parsed again, see compiler/incremental.py.
+The first error is the one /checkSyntax gives, while the later ones in "errors" can differ, since the parser starts
+again at each declaration instead of recovering through the rest of the program.
+DELETE /checkSyntax/sessions/<id> closes the session.
+
+Sessions that are idle for CHECK_SESSION_IDLE_TIMEOUT seconds, or are the least recently used when there are more
+than CHECK_SESSIONS or they take more than CHECK_SESSIONS_BYTES, are closed, and return 404 like unknown ones.
+With several worker processes, the documents are shared through CHECK_SESSION_STORE, so any worker can edit them.
+"""
+@app.route('/checkSyntax/sessions', methods=['POST'])
+def open_check_session():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('program', ''), str):
+        return jsonify({'error': 'Invalid JSON payload'}), 400
+    
+    returnDict = {'session': '', 'isSyntaxCorrect': False, 'error': '', 'line': -1, 'column': -1, 'message': ""}
+    try:
+        session = check_sessions.open(data.get('program', ''))
     except Exception as e:
         returnDict['error'] = 'Error parsing program'
         returnDict['message'] = str(e)
         return jsonify(returnDict), 500
     
-def int_to_letters(n):
-    result = ''
-    while True:
-        result = chr(ord('a') + (n % 26)) + result
-        n = n // 26 - 1
-        if n < 0:
-            break
-    return result
+    returnDict['session'] = session.id
+    returnDict, status = session_result(returnDict, session)
+    return jsonify(returnDict), 201 if status == 200 else status
 
-@app.route('/performTestCases', methods=['POST'])
-def check_test_cases():
-    data = request.get_json()
-    program = data.get('program', '')
-    function_name = data.get('funName', '')
-    test_cases = data.get('testCases', [])
+@app.route('/checkSyntax/sessions/<session_id>', methods=['PATCH'])
+def edit_check_session(session_id):
+    data = request.get_json(silent=True)
+    edits = data.get('edits') if isinstance(data, dict) else None
+    if not isinstance(edits, list) or not all(is_valid_edit(edit) for edit in edits):
+        return jsonify({'error': 'Expected a list of edits with integer "start" and "end", and a string "text"'}), 400
     
-    returnDict = {'results': []}
-    resultTemplate = {'error': '', 'line': -1, 'column': -1, 'output': 0}
+    returnDict = {'session': session_id, 'isSyntaxCorrect': False, 'error': '', 'line': -1, 'column': -1, 'message': ""}
+    try:
+        session = check_sessions.edit(session_id, [(edit['start'], edit['end'], edit.get('text', '')) for edit in edits])
+    except SessionNotFound:
+        return jsonify({'error': 'Session not found'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        returnDict['error'] = 'Error parsing program'
+        returnDict['message'] = str(e)
+        return jsonify(returnDict), 500
     
-    # check inputs
-    if not program:
-        returnDict['error'] = 'No program provided'
-        return jsonify(returnDict), 400
-    if not function_name:
-        returnDict['error'] = 'No function name provided'
-        return jsonify(returnDict), 400
-    if not test_cases:
-        returnDict['error'] = 'No test cases provided'
-        return jsonify(returnDict), 400
+    returnDict, status = session_result(returnDict, session)
+    return jsonify(returnDict), status
+
+@app.route('/checkSyntax/sessions/<session_id>', methods=['DELETE'])
+def close_check_session(session_id):
+    try:
+        check_sessions.close(session_id)
+    except SessionNotFound:
+        return jsonify({'error': 'Session not found'}), 404
+    return '', 204
+
+def is_valid_edit(edit):
+    return (isinstance(edit, dict) and type(edit.get('start')) == int and type(edit.get('end')) == int
+        and isinstance(edit.get('text', ''), str))
+
+def session_result(returnDict, session):
+    # the parser raises on some programs, which /checkSyntax returns as a 500 as well
+    if session.document.exception != None:
+        returnDict['error'] = 'Error parsing program'
+        returnDict['message'] = session.document.exception
+        return returnDict, 500
+    return syntax_result(returnDict, session.document), 200
     
-    # compile and run each test case, recording the output
-    for test_case in test_cases:
-        resultDict = resultTemplate.copy()
+"""
+Returns the hit and miss counters of the compile cache, along with its size, to be able to tune its limits.
+Each worker process has its own cache, so these are the stats of the worker that answers, whose pid is in "worker".
+"""
+@app.route('/cacheStats', methods=['GET'])
+def cache_stats():
+    return jsonify(dict(compile_cache.stats(), worker=os.getpid())), 200
+
+def run_test_case(program, function_name, test_case, stepBudget=0):
+    resultDict = {'error': '', 'line': -1, 'column': -1, 'output': 0}
+    program_with_main = build_test_main(function_name, test_case) + program
+    
+    try:
+        # run the compiler, or get the result of a previous compilation
+        compiled = compile_cache.getChecked(program_with_main, failFast=True)
+        
+        if not compiled.isLexerValid:
+            resultDict['error'], resultDict['line'], resultDict['column'] = compiled.lexerError
+            return resultDict
         
-        mainFunction = "void main(void) {\n"
-        assignments = ""
+        if not compiled.isSyntaxValid:
+            resultDict['error'], resultDict['line'], resultDict['column'] = compiled.syntaxError
+            return resultDict
         
-        # create the main function with parameters for testing
-        for i, param in enumerate(test_case):
-            param_ID = int_to_letters(i)
-            # for an int
-            if isinstance(param, int):
-                mainFunction += f"int {param_ID};\n"
-                if (param < 0):
-                    assignments += f"{param_ID} = 0-{str(-param)};\n"
-                else:
-                    assignments += f"{param_ID} = {str(param)};\n"
-            
-            # for an array
-            elif isinstance(param, list):
-                mainFunction += f"int {param_ID}[{len(param)}];\n"
-                for i, value in enumerate(param):
-                    if value < 0:
-                        assignments += f"{param_ID}[{i}] = 0-{str(-value)};\n"
-                    else:
-                        assignments += f"{param_ID}[{i}] = {str(value)};\n"
-            else:
-                returnDict['error'] = f'Invalid parameter type in test case {test_case}'
-                return jsonify(returnDict), 400
+        if not compiled.isTypingValid:
+            resultDict['error'], resultDict['line'], resultDict['column'] = compiled.typeError
+            return resultDict
         
-        mainFunction += assignments
-        mainFunction += f"output({function_name}({', '.join(int_to_letters(i) for i in range(len(test_case))) }));\n"
-        mainFunction += "}\n"
-        program_with_main = mainFunction + program
+        assembly = compiled.generateAssembly(stepBudget)
         
-        sandbox_dir = tempfile.mkdtemp(prefix="sandbox_", dir="/tmp")
+    except Exception as e:
+        resultDict['error'] = str(e)
+        return resultDict
+
+    # Overloaded is raised to the caller, which rejects the whole request
+    try:
+        with admission.slot():
+            result = backend.run(assembly)
+    except Overloaded:
+        raise
+    except subprocess.TimeoutExpired:
+        resultDict['error'] = 'Timeout expired while running the compiled file'
+        return resultDict
+    except Exception as e:
+        resultDict['error'] = str(e)
+        return resultDict
+    
+    # if there was an error running the compiled file
+    if result.stderr:
+        resultDict['error'] = result.stderr.decode()
+        return resultDict
+    
+    # the value returned by the function is never written if the output is truncated
+    if getattr(result, 'truncated', False):
+        resultDict['error'] = 'Output limit exceeded'
+        return resultDict
+    
+    if split_step_budget_marker(result.stdout)[1]:
+        resultDict['error'] = 'Step budget exceeded'
+        return resultDict
+    
+    # the last output is the value returned by the function
+    resultDict['output'] = parse_spim_output(result.stdout)[-1]
+    return resultDict
+
+"""
+Runs all test cases with a single compiled program and a single spim run.
+Returns the results of the test cases that finished, in order, so the caller can run the rest one by one.
+If the batched program can't be compiled (e.g. a test case has the wrong types), no results are returned,
+since the per-case run reports errors for each test case.
+"""
+def run_test_cases_batched(program, function_name, test_cases):
+    marker = new_marker(program, function_name, test_cases)
+    program_with_main = build_batched_main(function_name, test_cases, marker) + program
+    
+    try:
+        compiled = compile_cache.get(program_with_main, failFast=True)
+        
+        if not compiled.checkTyping():
+            return []
+        
+        # global variables keep their values between calls, which would make test cases depend on each other
+        if any(node.type == NodeTypes.VarDeclaration for node in compiled.AST.children):
+            return []
+        
+        assembly = compiled.generateAssembly()
+    except Exception:
+        return []
+    
+    # when the server is overloaded, the test cases are not run one by one instead, which would add more load
+    try:
+        with admission.slot():
+            stdout = backend.run(assembly).stdout
+    except Overloaded:
+        raise
+    except subprocess.TimeoutExpired as e:
+        # the test cases that finished before the timeout are still valid
+        stdout = e.stdout or b""
+    except Exception:
+        return []
+    
+    # a runtime error only affects the test case that was running, the finished ones are still valid
+    try:
+        outputs = parse_spim_output(stdout)
+    except ValueError:
+        return []
+    
+    results = []
+    for caseOutputs in split_batched_output(outputs, marker):
+        if not caseOutputs:
+            break
+        results.append({'error': '', 'line': -1, 'column': -1, 'output': caseOutputs[-1]})
+    
+    return results[:len(test_cases)]
+
+"""
+This endpoint runs a function of a C- program with a list of test cases.
+It expects a JSON payload with the following structure:
+{
+    "program": "C- program as a string, without a main function",
+    "funName": "name of the function to test",
+    "testCases": [[param1, param2, ...], ...],  # each param is an int or a list of ints
+    "stepBudget": 100000  # optional, loop iterations and function calls each test case can make
+}
+
+When BATCH_TEST_CASES is enabled, all test cases are run in a single program, and only the test cases that
+could not be completed that way (e.g. after a runtime error or a timeout) are run one by one.
+With a step budget, test cases are always run one by one, so each one gets the whole budget.
+
+With ?stream=ndjson or ?stream=sse, each result is sent as soon as its test case finishes, as a record with
+the index of the test case, followed by a summary record with all the results in order.
+
+When too many programs are waiting to run, it returns 429 with a Retry-After header. If that happens once the results
+are being streamed, the last record is an error record with "retryAfter" and "status" 429, instead of the summary.
+"""
+def check_test_cases_request(data):
+    # returns the error response if the request is not valid or the run queue is full, otherwise None
+    returnDict = {'results': []}
+    
+    if not data.get('program', ''):
+        returnDict['error'] = 'No program provided'
+        return returnDict, 400
+    if not data.get('funName', ''):
+        returnDict['error'] = 'No function name provided'
+        return returnDict, 400
+    if not data.get('testCases', []):
+        returnDict['error'] = 'No test cases provided'
+        return returnDict, 400
+    
+    for test_case in data['testCases']:
+        if not isinstance(test_case, list) or not validate_test_case(test_case):
+            returnDict['error'] = f'Invalid parameter type in test case {test_case}'
+            return returnDict, 400
+    
+    if get_step_budget(data) == None:
+        returnDict['error'] = f'The step budget must be an integer between 0 and {MAX_STEP_BUDGET}'
+        return returnDict, 400
+    
+    try:
+        admission.check()
+    except Overloaded as e:
+        return overloaded_response(returnDict, e)
+    
+    return None
+
+def iter_test_case_results(program, function_name, test_cases, stepBudget=0):
+    # yields the index and the result of each test case as soon as it finishes
+    results = []
+    if BATCH_TEST_CASES and len(test_cases) > 1 and not stepBudget:
+        results = run_test_cases_batched(program, function_name, test_cases)
+    
+    for index, result in enumerate(results):
+        yield index, result
+    
+    # compile and run each remaining test case in parallel
+    remaining = test_cases[len(results):]
+    if len(remaining) == 1:
+        yield len(results), run_test_case(program, function_name, remaining[0], stepBudget)
+        return
+    
+    # each run gets a copy of the context, so its stages are labeled with the endpoint
+    futures = {
+        test_case_executor.submit(contextvars.copy_context().run, run_test_case, program, function_name, test_case, stepBudget): len(results) + i
+        for i, test_case in enumerate(remaining)
+    }
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    except Overloaded:
+        # the request is rejected, so the test cases that haven't started are not run
+        for future in futures:
+            future.cancel()
+        raise
+
+def perform_test_cases(data):
+    error = check_test_cases_request(data)
+    if error != None:
+        return error
+    
+    test_cases = data['testCases']
+    returnDict = {'results': [None] * len(test_cases)}
+    
+    # record the outputs in the order of the test cases
+    try:
+        for index, result in iter_test_case_results(data['program'], data['funName'], test_cases, get_step_budget(data)):
+            returnDict['results'][index] = result
+    except Overloaded as e:
+        return overloaded_response({'results': []}, e)
+    
+    return returnDict, 200
+
+def stream_test_cases(data, stream_format):
+    test_cases = data['testCases']
+    
+    def record(kind, body):
+        if stream_format == 'sse':
+            return f"event: {kind}\ndata: {json.dumps(body)}\n\n"
+        return json.dumps({'type': kind, **body}) + "\n"
+    
+    def generate():
+        results = [None] * len(test_cases)
         try:
-            try:
-                # run the compiler 
-                compiler = Compiler(program_with_main)
-                
-                if not compiler.isTypingValid(prints=False):
-                    resultDict['error'] = compiler.typeChecker.firstErrorMessage
-                    returnDict['results'].append(resultDict)
-                    continue
-                    
-                parser = compiler.typeChecker.parser
-                if not parser.isSyntaxValid:
-                    resultDict['error'] = parser.firstErrorMessage
-                    resultDict['line'] = parser.lineNumber
-                    resultDict['column'] = parser.columnNumber
-                    returnDict['results'].append(resultDict)
-                    continue
-                
-                lexer = parser.lexer
-                if not lexer.isSyntaxValid:
-                    resultDict['error'] = lexer.firstErrorMessage
-                    resultDict['line'] = lexer.errorLine
-                    resultDict['column'] = lexer.errorColumn
-                    returnDict['results'].append(resultDict)
-                    continue
-                
-                compiler.compile(f'{sandbox_dir}/output.s')
-                
-            except Exception as e:
-                resultDict['error'] = str(e)
-                returnDict['results'].append(resultDict)
-                continue
-
-            try:
-                # Create a more restricted sandbox with specific directory bindings
-                commands = [
-                    "bwrap",
-                    # Bind all necessary system directories
-                    "--ro-bind", "/bin", "/bin",
-                    "--ro-bind", "/usr", "/usr",
-                    "--ro-bind", "/lib", "/lib"
-                ]
-                
-                # prod env needs /lib64, but not in debug mode
-                if not DEBUG:
-                    print("Binding /lib64")
-                    commands.extend(["--ro-bind", "/lib64", "/lib64"])
-                
-                commands += [
-                    "--ro-bind", "/etc", "/etc",
-                    # Create necessary system directories  
-                    "--tmpfs", "/tmp",
-                    "--ro-bind", "/proc", "/proc",
-                    "--ro-bind", "/dev", "/dev",
-                    # Bind our sandbox directory
-                    "--bind", sandbox_dir, sandbox_dir,
-                    # Security options - only IPC and UTS, no network or user/pid
-                    "--unshare-ipc", 
-                    "--unshare-uts",
-                    "--die-with-parent",
-                    "--new-session",
-                    # The actual command
-                    "spim", "-file", f"{sandbox_dir}/output.s"
-                ]
-                
-                result = subprocess.run(
-                    commands,
-                    capture_output=True,
-                    timeout=TIMEOUT
-                )
-            except subprocess.TimeoutExpired:
-                resultDict['error'] = 'Timeout expired while running the compiled file'
-                returnDict['results'].append(resultDict)
-                continue
-            
-            except Exception as e:
-                resultDict['error'] = str(e)
-                returnDict['results'].append(resultDict)
-                continue
-            
-            # if there was an error running the compiled file
-            if result.stderr:
-                stderr_msg = result.stderr.decode()
-                # Don't expose internal paths in error messages
-                stderr_msg = stderr_msg.replace(sandbox_dir, "/sandbox")
-                
-                resultDict['error'] = stderr_msg
-                returnDict['results'].append(resultDict)
-                continue
-            
-            # return all program outputs as a list, except for first (spim output) and last (empty string after last new line)
-            output = result.stdout.decode()
-            
-            # in different environments, the output is different, but what follows 'Loaded' is the actual output
-            output = output[output.find('Loaded'):]  
-            
-            # Limit output size to prevent memory exhaustion
-            output_lines = output.split('\n')[1:-1]
-            
-            resultDict['output'] = int(output_lines[-1])
-            returnDict['results'].append(resultDict)
-        finally:
-            # clean up the sandbox directory, including files
-            shutil.rmtree(sandbox_dir, ignore_errors=True)
-    
-    return jsonify(returnDict), 200
+            for index, result in iter_test_case_results(data['program'], data['funName'], test_cases, get_step_budget(data)):
+                results[index] = result
+                yield record('result', {'index': index, **result})
+        except Overloaded as e:
+            # the status was already sent, so the rejection is the last record instead of the summary
+            body, _ = overloaded_response({}, e)
+            yield record('error', {**body, 'status': 429})
+            return
+        
+        errors = sum(1 for result in results if result['error'])
+        yield record('summary', {'total': len(results), 'errors': errors, 'results': results})
+    
+    mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={'Cache-Control': 'no-cache'})
+
+@app.route('/performTestCases', methods=['POST'])
+def check_test_cases():
+    data = request.get_json()
+    
+    stream = request.args.get('stream', '').lower()
+    if stream in ['ndjson', 'sse']:
+        error = check_test_cases_request(data)
+        if error != None:
+            return jsonify(error[0]), error[1], retry_after_header(error[0])
+        return stream_test_cases(data, stream)
+    
+    returnDict, status = perform_test_cases(data)
+    return jsonify(returnDict), status, retry_after_header(returnDict)
+
+"""
+Returns the number of programs running and waiting to run, and the average wait and run times.
+Returns 503 while the run queue is full, so load balancers can send requests to other instances.
+Each worker process has its own run queue, with its share of the limits, so these are the stats of the worker that
+answers, whose pid is in "worker".
+"""
+@app.route('/queueStats', methods=['GET'])
+def queue_stats():
+    return jsonify(dict(admission.stats(), worker=os.getpid())), 503 if admission.isFull() else 200
+
+"""
+Exposes counters and latency histograms of each stage in the Prometheus text format.
+Stages are labeled by endpoint and outcome (ok, syntax_error, type_error, timeout, runtime_error or error).
+Every sample is also labeled with the pid of the worker process that answers, as each worker has its own metrics.
+"""
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+"""
+These endpoints run /runCompile and /performTestCases requests in the background.
+POST /jobs accepts the same payloads, with an optional "type" field ("runCompile" or "performTestCases"),
+otherwise the type is inferred from the presence of "testCases". It returns the id of the job right away.
+
+GET /jobs/<id> returns the status of the job ("queued", "running", "done" or "failed"), and once it's finished,
+the response the endpoint would have given in "result" and "statusCode".
+With ?wait=<seconds>, the request waits for the job to finish, up to JOB_MAX_WAIT seconds.
+"""
+JOB_TYPES = {'runCompile': compile_and_run, 'performTestCases': perform_test_cases}
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON payload'}), 400
+    
+    kind = data.get('type', 'performTestCases' if 'testCases' in data else 'runCompile')
+    if kind not in JOB_TYPES:
+        return jsonify({'error': f'Unknown job type {kind}'}), 400
+    
+    try:
+        job = job_queue.submit(kind, JOB_TYPES[kind], data)
+    except QueueFull:
+        return jsonify({'error': 'Too many jobs waiting to run'}), 429
+    
+    return jsonify(job.toDict()), 202, {'Location': f'/jobs/{job.id}'}
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job == None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    wait = min(request.args.get('wait', 0, type=float), JOB_MAX_WAIT)
+    if wait > 0:
+        job = job_queue.wait(job, wait)
+    
+    return jsonify(job.toDict()), 200
+
+"""
+Compiles a small program that goes through every stage of the compiler, so its modules are loaded and
+initialized before gunicorn forks the workers (see gunicorn.conf.py).
+"""
+WARM_UP_PROGRAM = """
+int values[4];
+
+int sum(int a[], int n) {
+    int i;
+    int total;
+    i = 0;
+    total = 0;
+    while (i < n) {
+        if (a[i] > 0) {
+            total = total + a[i];
+        } else {
+            total = total - a[i];
+        }
+        i = i + 1;
+    }
+    return total;
+}
+
+void main(void) {
+    values[0] = input();
+    output(sum(values, 4) * 2 / 1);
+}
+"""
+
+def warm_up():
+    compiled = CompiledProgram(WARM_UP_PROGRAM)
+    compiled.checkTyping()
+    compiled.generateAssembly()
 
+# development server, production runs with gunicorn.conf.py
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=PORT, debug=DEBUG, ssl_context='adhoc')
\ No newline at end of file
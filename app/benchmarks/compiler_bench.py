@@ -0,0 +1,223 @@
+from compiler.lexer import Lexer
+from compiler.parser import Parser
+from compiler.type_checker import TypeChecker
+from compiler.code_generator import CodeGenerator
+import argparse
+import json
+import math
+import sys
+import time
+import tracemalloc
+
+"""
+Microbenchmark of the stages of the compiler: generates programs of increasing size in several shapes, and times
+the lexer, the parser, the type checker and the code generator separately on each of them.
+
+For each shape and stage it reports the throughput, in tokens per second for the lexer and the parser and in AST
+nodes per second for the other stages, the peak memory, and the exponent of the growth of the time with the size
+of the program, fitted over the sizes. An exponent well above 1 means the stage is superlinear for that shape.
+
+    python -m benchmarks.compiler_bench --scales 1 2 4 8 16 --output compiler_bench.json
+
+Run it from the app directory.
+"""
+
+STAGES = ["lex", "parse", "type_check", "codegen"]
+# exponents above this are reported as superlinear
+SUPERLINEAR_EXPONENT = 1.3
+
+def identifier(number, length=1):
+    # C- identifiers only have letters
+    letters = ""
+    number += 1
+    while number > 0:
+        number, digit = divmod(number - 1, 26)
+        letters = chr(ord("a") + digit) + letters
+    return (letters * (length // len(letters) + 1))[:max(length, len(letters))]
+
+def many_functions(n):
+    functions = [f"int {identifier(i)}(int x) {{ return x + {i}; }}\n" for i in range(n)]
+    calls = "".join(f"    output({identifier(i)}({i}));\n" for i in range(n))
+    return "".join(functions) + "void main(void) {\n" + calls + "}\n"
+
+def deep_nesting(n):
+    # not indented, so the size of the program grows linearly with the depth
+    opening = "".join(f"if (x < {i + 1}) {{\n" for i in range(n))
+    closing = "}\n" * n
+    return "void main(void) {\n    int x;\n    x = input();\n" + opening + "    output(x);\n" + closing + "}\n"
+
+def long_expression(n):
+    terms = " + ".join(f"x * {i % 10}" for i in range(n))
+    return f"void main(void) {{\n    int x;\n    x = input();\n    output({terms});\n}}\n"
+
+def huge_comment(n):
+    comment = "/* " + "comment text without an end marker " * n + " */\n"
+    return comment + "void main(void) {\n    output(1);\n}\n"
+
+def long_identifiers(n):
+    names = [identifier(i, 16 * n) for i in range(8)]
+    declarations = "".join(f"    int {name};\n" for name in names)
+    assignments = "".join(f"    {name} = {i};\n" for i, name in enumerate(names))
+    return "void main(void) {\n" + declarations + assignments + "    output(" + " + ".join(names) + ");\n}\n"
+
+# each shape with the size of its smallest program, which is multiplied by the scales
+SHAPES = {
+    "many_functions": (many_functions, 20),
+    "deep_nesting": (deep_nesting, 4),
+    "long_expression": (long_expression, 20),
+    "huge_comment": (huge_comment, 100),
+    "long_identifiers": (long_identifiers, 4),
+}
+
+def count_tokens(program):
+    # the last token is the end of the file
+    return len(Lexer(program).tokenize()) - 1
+
+def count_nodes(AST):
+    count = 0
+    nodes = [AST]
+    while nodes:
+        node = nodes.pop()
+        count += 1
+        nodes.extend(node.children)
+    return count
+
+def run_stages(program):
+    # runs each stage once, returns the duration of each one
+    durations = {}
+
+    start = time.perf_counter()
+    count_tokens(program)
+    durations["lex"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    AST = Parser(program).parse()
+    durations["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    TypeChecker(program, AST=AST).checkTyping()
+    durations["type_check"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    CodeGenerator(AST, filePath=None).generateCode()
+    durations["codegen"] = time.perf_counter() - start
+
+    return durations, AST
+
+def peak_memory(program):
+    # peak memory of each stage, measured in a separate run since tracing slows the stages down
+    peaks = {}
+    tracemalloc.start()
+    try:
+        stages = [
+            ("lex", lambda: count_tokens(program)),
+            ("parse", lambda: Parser(program).parse()),
+        ]
+        for name, function in stages:
+            tracemalloc.reset_peak()
+            result = function()
+            peaks[name] = tracemalloc.get_traced_memory()[1]
+
+        AST = result
+        tracemalloc.reset_peak()
+        TypeChecker(program, AST=AST).checkTyping()
+        peaks["type_check"] = tracemalloc.get_traced_memory()[1]
+
+        tracemalloc.reset_peak()
+        CodeGenerator(AST, filePath=None).generateCode()
+        peaks["codegen"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def growth_exponent(sizes, durations):
+    # slope of the least squares line of log(duration) against log(size)
+    points = [(math.log(size), math.log(duration)) for size, duration in zip(sizes, durations) if size > 0 and duration > 0]
+    if len(points) < 2:
+        return None
+    meanX = sum(x for x, _ in points) / len(points)
+    meanY = sum(y for _, y in points) / len(points)
+    variance = sum((x - meanX) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+    return sum((x - meanX) * (y - meanY) for x, y in points) / variance
+
+def bench_shape(name, scales, repeat=3, measureMemory=True):
+    generate, base = SHAPES[name]
+    runs = []
+    for scale in scales:
+        program = generate(base * scale)
+        try:
+            # the best of the repetitions is the least disturbed by the rest of the machine
+            samples = [run_stages(program) for _ in range(repeat)]
+        except RecursionError:
+            runs.append({"scale": scale, "characters": len(program), "error": "RecursionError"})
+            continue
+
+        durations = {stage: min(sample[0][stage] for sample in samples) for stage in STAGES}
+        tokens = count_tokens(program)
+        nodes = count_nodes(samples[0][1])
+        run = {
+            "scale": scale,
+            "characters": len(program),
+            "tokens": tokens,
+            "nodes": nodes,
+            "seconds": durations,
+            "throughput": {
+                stage: (tokens if stage in ["lex", "parse"] else nodes) / durations[stage] if durations[stage] > 0 else 0.0
+                for stage in STAGES
+            }
+        }
+        if measureMemory:
+            run["peakBytes"] = peak_memory(program)
+        runs.append(run)
+
+    completed = [run for run in runs if "error" not in run]
+    exponents = {
+        stage: growth_exponent([run["characters"] for run in completed], [run["seconds"][stage] for run in completed])
+        for stage in STAGES
+    }
+    return {"runs": runs, "exponents": exponents}
+
+def print_shape(name, result):
+    print(f"\n{name}")
+    for run in result["runs"]:
+        if "error" in run:
+            print(f"  x{run['scale']:<4} {run['characters']:>9} chars  failed: {run['error']}")
+            continue
+        stages = "  ".join(
+            f"{stage} {run['seconds'][stage] * 1000:8.2f}ms {run['throughput'][stage] / 1000:8.1f}k/s"
+            for stage in STAGES
+        )
+        print(f"  x{run['scale']:<4} {run['characters']:>9} chars  {stages}")
+
+    exponents = []
+    for stage, exponent in result["exponents"].items():
+        if exponent == None:
+            continue
+        flag = " superlinear" if exponent > SUPERLINEAR_EXPONENT else ""
+        exponents.append(f"{stage} {exponent:.2f}{flag}")
+    print("  growth exponents: " + ", ".join(exponents))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmark of the compiler stages")
+    parser.add_argument("--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES))
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="don't measure the peak memory, which takes an extra run")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.shapes:
+        results[name] = bench_shape(name, args.scales, args.repeat, not args.no_memory)
+        print_shape(name, results[name])
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import random
+
+"""
+Programs the benchmarks send to the service, chosen to cover the shapes of real traffic: small valid programs,
+syntax and type errors, recursion, long loops and large arrays of test cases.
+
+Each case is a request: the endpoint it's sent to, its JSON payload and the status code it's expected to get.
+"""
+
+SMALL_VALID = "void main(void) {\n    int x;\n    x = input();\n    output(x * 2 + 1);\n}\n"
+
+SYNTAX_ERROR = "void main(void) {\n    int x\n    x = input();\n    output(x;\n}\n"
+
+TYPE_ERROR = "int f(int a[]) { return a[0]; }\nvoid main(void) {\n    int x;\n    x = f(x);\n    output(y);\n}\n"
+
+RECURSIVE = (
+    "int fib(int n) {\n"
+    "    if (n < 2) { return n; } else { return fib(n - 1) + fib(n - 2); }\n"
+    "}\n"
+    "void main(void) {\n"
+    "    output(fib(input()));\n"
+    "}\n"
+)
+
+LONG_LOOP = (
+    "void main(void) {\n"
+    "    int i;\n"
+    "    int n;\n"
+    "    int total;\n"
+    "    i = 0;\n"
+    "    n = input();\n"
+    "    total = 0;\n"
+    "    while (i < n) {\n"
+    "        total = total + i / 7;\n"
+    "        i = i + 1;\n"
+    "    }\n"
+    "    output(total);\n"
+    "}\n"
+)
+
+SUM = (
+    "int sum(int nums[], int size) {\n"
+    "    int i;\n"
+    "    int total;\n"
+    "    i = 0;\n"
+    "    total = 0;\n"
+    "    while (i < size) {\n"
+    "        total = total + nums[i];\n"
+    "        i = i + 1;\n"
+    "    }\n"
+    "    return total;\n"
+    "}\n"
+)
+
+class Case():
+    def __init__(self, name, endpoint, payload, expectedStatus):
+        self.name = name
+        self.endpoint = endpoint
+        self.payload = payload
+        self.expectedStatus = expectedStatus
+
+def large_test_cases(count, size, seed=0):
+    rng = random.Random(seed)
+    return [[[rng.randint(-1000, 1000) for _ in range(size)], size] for _ in range(count)]
+
+def build_corpus():
+    return [
+        Case("small_valid", "/runCompile", {"program": SMALL_VALID, "inputs": [20]}, 200),
+        Case("syntax_error", "/runCompile", {"program": SYNTAX_ERROR}, 400),
+        Case("type_error", "/runCompile", {"program": TYPE_ERROR}, 400),
+        Case("recursive", "/runCompile", {"program": RECURSIVE, "inputs": [15]}, 200),
+        Case("long_loop", "/runCompile", {"program": LONG_LOOP, "inputs": [20000]}, 200),
+        Case("check_valid", "/checkSyntax", {"program": RECURSIVE}, 200),
+        Case("check_syntax_error", "/checkSyntax", {"program": SYNTAX_ERROR}, 200),
+        Case("test_cases_small", "/performTestCases", {"program": SUM, "funName": "sum", "testCases": large_test_cases(5, 10)}, 200),
+        Case("test_cases_large", "/performTestCases", {"program": SUM, "funName": "sum", "testCases": large_test_cases(50, 200)}, 200),
+    ]
+
+CORPUS = build_corpus()
@@ -0,0 +1,190 @@
+from benchmarks.corpus import CORPUS, Case
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import datetime
+import itertools
+import json
+import math
+import os
+import ssl
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+"""
+Load test of the service: sends the requests of the corpus to a running server from a number of concurrent
+clients, and reports the requests per second and the p50, p95 and p99 latencies of each endpoint.
+
+The results are written as JSON, with the commit they were measured on, so runs can be compared across commits:
+
+    python -m benchmarks.load_test --url https://localhost:3001 --concurrency 16 --duration 30
+    python -m benchmarks.load_test --baseline benchmarks/results/<previous run>.json
+
+Run it from the app directory. With --baseline, it exits with an error if the p95 latency or the throughput of
+an endpoint is more than --max-regression worse than in the baseline.
+"""
+
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def percentile(values, fraction):
+    # nearest-rank percentile of a list of numbers
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[index]
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+class LoadTest():
+    def __init__(self, url, cases : list[Case], concurrency=8, duration=30.0, maxRequests=0, timeout=60.0, verify=False):
+        self.url = url.rstrip("/")
+        self.cases = cases
+        self.concurrency = concurrency
+        self.duration = duration
+        self.maxRequests = maxRequests
+        self.timeout = timeout
+        # the server uses a self-signed certificate unless it's given one
+        self.context = None if verify else ssl._create_unverified_context()
+
+        self.lock = threading.Lock()
+        self.samples : list[tuple[str, str, float, int]] = []
+        self.requests = itertools.count()
+
+    def run(self):
+        start = time.perf_counter()
+        deadline = start + self.duration
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            for _ in range(self.concurrency):
+                executor.submit(self._client, deadline)
+        elapsed = time.perf_counter() - start
+        return self.report(elapsed)
+
+    def _client(self, deadline):
+        # each client sends the cases one after the other, starting at a different one
+        while time.perf_counter() < deadline:
+            number = next(self.requests)
+            if self.maxRequests and number >= self.maxRequests:
+                return
+            case = self.cases[number % len(self.cases)]
+            latency, status = self._send(case)
+            with self.lock:
+                self.samples.append((case.endpoint, case.name, latency, status))
+
+    def _send(self, case : Case):
+        body = json.dumps(case.payload).encode()
+        request = urllib.request.Request(self.url + case.endpoint, body, {"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout, context=self.context) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except Exception:
+            # connection errors and timeouts
+            status = 0
+        return time.perf_counter() - start, status
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint in sorted({sample[0] for sample in self.samples}):
+            samples = [sample for sample in self.samples if sample[0] == endpoint]
+            latencies = [sample[2] for sample in samples]
+            statuses = {}
+            for sample in samples:
+                statuses[str(sample[3])] = statuses.get(str(sample[3]), 0) + 1
+
+            expected = {case.name: case.expectedStatus for case in self.cases}
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "requestsPerSecond": len(samples) / elapsed if elapsed > 0 else 0.0,
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": max(latencies),
+                "statuses": statuses,
+                "unexpected": len([sample for sample in samples if sample[3] != expected[sample[1]]])
+            }
+
+        return {
+            "commit": current_commit(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "url": self.url,
+            "concurrency": self.concurrency,
+            "elapsed": elapsed,
+            "requests": len(self.samples),
+            "endpoints": endpoints
+        }
+
+def compare(baseline, results, maxRegression):
+    # returns the lines of the comparison, and whether an endpoint got worse than allowed
+    lines = []
+    isRegression = False
+    for endpoint, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if previous == None:
+            continue
+        p95Change = current["p95"] / previous["p95"] - 1 if previous["p95"] else 0.0
+        rpsChange = current["requestsPerSecond"] / previous["requestsPerSecond"] - 1 if previous["requestsPerSecond"] else 0.0
+        if p95Change > maxRegression or rpsChange < -maxRegression:
+            isRegression = True
+        lines.append(f"{endpoint:20} p95 {p95Change:+.1%}  req/s {rpsChange:+.1%}")
+    return lines, isRegression
+
+def print_report(results):
+    print(f"{results['requests']} requests in {results['elapsed']:.1f}s at concurrency {results['concurrency']}")
+    for endpoint, stats in results["endpoints"].items():
+        print(
+            f"{endpoint:20} {stats['requestsPerSecond']:8.1f} req/s"
+            f"  p50 {stats['p50'] * 1000:8.1f}ms  p95 {stats['p95'] * 1000:8.1f}ms  p99 {stats['p99'] * 1000:8.1f}ms"
+            f"  unexpected {stats['unexpected']}"
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the compiler service")
+    parser.add_argument("--url", default=f"https://localhost:{os.getenv('PORT', 3001)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to send requests for")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests, 0 for no limit")
+    parser.add_argument("--endpoint", action="append", help="only send requests to this endpoint, can be repeated")
+    parser.add_argument("--verify", action="store_true", help="verify the certificate of the server")
+    parser.add_argument("--output", help="file to write the results to, by default in benchmarks/results")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed fraction of slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    cases = [case for case in CORPUS if not args.endpoint or case.endpoint in args.endpoint]
+    if not cases:
+        parser.error("no cases for the given endpoints")
+
+    results = LoadTest(args.url, cases, args.concurrency, args.duration, args.requests, verify=args.verify).run()
+    print_report(results)
+
+    output = args.output
+    if output == None:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        name = f"load-{results['commit'][:10] or 'unknown'}-{int(time.time())}.json"
+        output = os.path.join(DEFAULT_RESULTS_DIR, name)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            lines, isRegression = compare(json.load(file), results, args.max_regression)
+        print("\n".join(lines))
+        if isRegression:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+from compiler.lexer import Lexer
+from compiler.diagnostics import Diagnostics
+from compiler.parser import Parser, MAX_NESTING
+from compiler.type_checker import TypeChecker
+from compiler.code_generator import CodeGenerator, setStepBudget
+from collections import OrderedDict
+import metrics
+import hashlib
+import threading
+
+"""
+In-memory cache of compiled programs, shared by all endpoints.
+
+Programs are keyed by a fingerprint of their token stream, so resubmitting a program that only changed
+whitespace or comments hits the cache. Since the positions of syntax errors depend on the layout of the program,
+entries with syntax errors are only reused for the exact same source.
+
+The stages are computed lazily: /checkSyntax only needs the parse result, while the other endpoints
+also need the type checking result and the assembly.
+
+The errors of all the stages are collected in the Diagnostics of the lexer, without printing them, and kept
+with the entry so they can all be returned. Type errors have positions too, so entries with type errors
+aren't shared with other layouts either.
+
+Entries compiled to fail fast stop at the first error of any stage, and programs with syntax errors aren't type
+checked. Since they only have the first error, they're only reused for requests that fail fast too, unless the
+program has no errors.
+"""
+
+# rough memory used by the AST and the tokens for each token of the program
+AST_BYTES_PER_TOKEN = 256
+
+class CompileError(Exception):
+    pass
+
+def quiet_lexer(program, maxErrors=0, failFast=False):
+    # lexer that collects up to maxErrors errors instead of printing them
+    return Lexer(program, diagnostics=Diagnostics(program, maxErrors, prints=False), failFast=failFast)
+
+def fingerprint(program, maxErrors=0, failFast=False):
+    # returns the hash of the token stream, the number of tokens in it, and the lexer, so parsing reuses its tokens
+    # when failing fast, the tokens stop at the first lexer error
+    lexer = quiet_lexer(program, maxErrors, failFast)
+    digest = hashlib.sha256()
+
+    with metrics.stage("lex") as stage:
+        tokens = lexer.tokenize()
+        digest.update(tokens.types.tobytes())
+        digest.update("\x00".join(tokens.lexemes()).encode())
+
+        if not lexer.isSyntaxValid:
+            stage.outcome = "syntax_error"
+
+    # the last token is the end of the file
+    return digest.hexdigest(), len(tokens) - 1, lexer
+
+class CompiledProgram():
+    def __init__(self, program : str, tokenCount : int = 0, lexer : Lexer = None, maxNesting : int = MAX_NESTING):
+        self.program = program
+        self.tokenCount = tokenCount
+        self.lexer = lexer if lexer != None else quiet_lexer(program)
+        self.failFast = self.lexer.failFast
+        self.maxNesting = maxNesting
+        self.lock = threading.Lock()
+
+        # parse result, lexer errors are reported separately from parser errors
+        self.isParsed = False
+        self.parser = None
+        self.AST = None
+        self.isLexerValid = True
+        self.lexerError = ("", 0, 0)
+        self.isSyntaxValid = True
+        self.syntaxError = ("", 0, 0)
+
+        # type checking result, None until it's checked
+        self.isTypingValid = None
+        self.typeError = ("", 0, 0)
+
+        # generated assembly, None until it's generated, with and without counting steps
+        self.assembly = None
+        self.budgetedAssembly = None
+
+        # exceptions raised by a stage are cached as well, as their message
+        self.exceptions : dict[str, str] = dict()
+
+        # called with the number of bytes the entry grows by, by the cache that holds it
+        self.onGrow = None
+
+    def parse(self):
+        with self.lock:
+            self._raiseCached("parse")
+            if self.isParsed:
+                return self.AST
+
+            try:
+                with metrics.stage("parse") as stage:
+                    # the "lex" stage already timed the lexing, so this only times the parser
+                    parser = Parser(self.program, lexer=self.lexer, failFast=self.failFast, maxNesting=self.maxNesting)
+                    self.AST = parser.parse()
+                    if not parser.isSyntaxValid or not parser.lexer.isSyntaxValid:
+                        stage.outcome = "syntax_error"
+            except Exception as e:
+                self.exceptions["parse"] = str(e)
+                raise
+
+            self.isLexerValid = parser.lexer.isSyntaxValid
+            self.lexerError = (parser.lexer.firstErrorMessage, parser.lexer.errorLine, parser.lexer.errorColumn)
+            self.isSyntaxValid = parser.isSyntaxValid
+            self.syntaxError = (parser.firstErrorMessage, parser.lineNumber, parser.columnNumber)
+            self.parser = parser
+            self.isParsed = True
+            return self.AST
+
+    def checkTyping(self):
+        # returns None for programs with syntax errors, which aren't type checked
+        AST = self.parse()
+
+        with self.lock:
+            self._raiseCached("typing")
+            if self.isTypingValid != None or not self.isLexerValid or not self.isSyntaxValid:
+                return self.isTypingValid
+
+            try:
+                with metrics.stage("type_check") as stage:
+                    typeChecker = TypeChecker(self.program, AST=AST, parser=self.parser, failFast=self.failFast)
+                    self.isTypingValid = typeChecker.checkTyping()
+                    if not self.isTypingValid:
+                        stage.outcome = "type_error"
+            except Exception as e:
+                self.exceptions["typing"] = str(e)
+                raise
+
+            self.typeError = (typeChecker.firstErrorMessage, typeChecker.errorLine, typeChecker.errorColumn)
+            return self.isTypingValid
+
+    def generateAssembly(self, stepBudget=0):
+        # the assembly with a step budget is generated once, and the budget is set for each run
+        AST = self.parse()
+
+        with self.lock:
+            self._raiseCached("codegen")
+            if stepBudget and self.budgetedAssembly != None:
+                return setStepBudget(self.budgetedAssembly, stepBudget)
+            if not stepBudget and self.assembly != None:
+                return self.assembly
+
+            try:
+                with metrics.stage("codegen"):
+                    assembly = CodeGenerator(AST, filePath=None, stepBudget=stepBudget).generateCode()
+            except Exception as e:
+                self.exceptions["codegen"] = str(e)
+                raise
+
+            if stepBudget:
+                self.budgetedAssembly = assembly
+            else:
+                self.assembly = assembly
+
+        # outside of the lock, since the cache calls the entry with its own lock held
+        if self.onGrow != None:
+            self.onGrow(len(assembly))
+        return assembly
+
+    def errors(self):
+        # all the errors found so far, as dicts, and whether there were more than the ones kept
+        diagnostics = self.lexer.diagnostics
+        return diagnostics.toList(), diagnostics.isTruncated()
+
+    def hasAllErrors(self):
+        # entries that failed fast only have the first error, if they found one
+        return not self.failFast or not self.lexer.diagnostics.isStopped
+
+    def isLayoutIndependent(self):
+        # the result can be shared with programs that only differ in whitespace and comments
+        return (self.isParsed and self.isLexerValid and self.isSyntaxValid and self.isTypingValid != False
+            and not self.exceptions)
+
+    def size(self):
+        return len(self.program) + self.tokenCount * AST_BYTES_PER_TOKEN + len(self.assembly or "") + len(self.budgetedAssembly or "")
+
+    def _raiseCached(self, stage):
+        if stage in self.exceptions:
+            raise CompileError(self.exceptions[stage])
+
+class CompileCache():
+    def __init__(self, maxEntries=1024, maxBytes=64 * 1024 * 1024, maxErrors=0, maxNesting=MAX_NESTING):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        # errors kept for each program, 0 to keep all of them
+        self.maxErrors = maxErrors
+        # levels statements and expressions can be nested in programs
+        self.maxNesting = maxNesting
+
+        self.entries : OrderedDict[str, CompiledProgram] = OrderedDict()
+        # the bytes counted for each entry, and their total
+        self.sizes : dict[str, int] = dict()
+        self.totalBytes = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, program : str, failFast=False) -> CompiledProgram:
+        # returns the compiled program, parsed, either from the cache or newly created
+        # with failFast, it stops at the first error, which is all most endpoints return
+        key, tokenCount, lexer = fingerprint(program, self.maxErrors, failFast)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            isReusable = entry != None and (failFast or entry.hasAllErrors())
+            if isReusable and (entry.program == program or entry.isLayoutIndependent()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = CompiledProgram(program, tokenCount, lexer, self.maxNesting)
+        try:
+            entry.parse()
+        finally:
+            # negative results are cached too
+            self._put(key, entry)
+
+        return entry
+
+    def getChecked(self, program : str, failFast=False) -> CompiledProgram:
+        # returns the compiled program, parsed and type checked if it has no syntax errors
+        entry = self.get(program, failFast)
+        if entry.checkTyping() == False and entry.program != program:
+            # the entry was shared with a program of another layout before its type errors were found, which
+            # makes it layout dependent, so compiling again gives the positions in this program
+            entry = self.get(program, failFast)
+            entry.checkTyping()
+        return entry
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.totalBytes,
+                'maxEntries': self.maxEntries,
+                'maxBytes': self.maxBytes
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.totalBytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def _put(self, key, entry):
+        if self.maxEntries <= 0 or self.maxBytes <= 0:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.totalBytes -= self.sizes[key]
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.sizes[key] = entry.size()
+            self.totalBytes += self.sizes[key]
+
+            # entries grow when their assembly is generated
+            entry.onGrow = lambda grownBy: self._grow(key, entry, grownBy)
+            self._evict()
+
+    def _grow(self, key, entry, grownBy):
+        with self.lock:
+            # the entry may have been evicted, or replaced by one for the same key
+            if self.entries.get(key) is entry:
+                self.sizes[key] += grownBy
+                self.totalBytes += grownBy
+                self._evict()
+
+    def _evict(self):
+        while len(self.entries) > 1 and (len(self.entries) > self.maxEntries or self.totalBytes > self.maxBytes):
+            key, _ = self.entries.popitem(last=False)
+            self.totalBytes -= self.sizes.pop(key)
+            self.evictions += 1
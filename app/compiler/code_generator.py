@@ -2,14 +2,29 @@ from .parser import *
 from compiler.type_checker import *
 from compiler.symbol_table import *
     
+# written as the last line when a program runs out of steps, it can't be confused with the outputs since they're integers
+STEP_BUDGET_MARKER = "step budget exceeded"
+STEP_BUDGET_LABEL = "step_budget"
+
 def codeGen(tree : ASTnode, file : str):
     codeGenerator = CodeGenerator(tree, file)
     codeGenerator.generateCode()
+
+def setStepBudget(assembly : str, stepBudget : int):
+    # changes the budget of assembly generated with a step budget, so it's only generated once for any budget
+    start = assembly.find(f"\t{STEP_BUDGET_LABEL}: .word ")
+    if start == -1:
+        return assembly
+    end = assembly.index("\n", start)
+    return assembly[:start] + f"\t{STEP_BUDGET_LABEL}: .word {stepBudget}" + assembly[end:]
     
 class CodeGenerator():
-    def __init__(self, AST : ASTnode = None, program : str = "", filePath : str = "output.s"):
+    def __init__(self, AST : ASTnode = None, program : str = "", filePath : str = "output.s", stepBudget : int = 0):
         self.filePath = filePath
         
+        # if it's set, loop iterations and function calls are counted, and the program stops after this many
+        self.stepBudget = stepBudget
+        
         parser = Parser(program)
         self.AST = parser.parse() if AST == None else AST
         
@@ -18,6 +33,9 @@ class CodeGenerator():
         self.controlStatementCount = 0
         self.currentFunctionLabel = ""
         
+        # the generated assembly, also kept in memory so it can be used without reading the file
+        self.assembly = ""
+        
     def generateCode(self):
         if self.AST.type != NodeTypes.Program: return False
         
@@ -27,9 +45,15 @@ class CodeGenerator():
         
         if not any(fun for fun in functions if fun.label == "main"):
             self._writeAssemblyToFile("")
-            return
+            return self.assembly
         
         asm = ".data\n\tnewline: .asciiz \"\\n\"\n\t.align 2\n"
+        if self.stepBudget:
+            asm += (
+                f"\t{STEP_BUDGET_LABEL}: .word {self.stepBudget}\n"
+                f"\tstep_budget_message: .asciiz \"{STEP_BUDGET_MARKER}\\n\"\n"
+                "\t.align 2\n"
+            )
         
         # put the global variables in the data segment of the assembly
         heapCalls = ""
@@ -45,7 +69,7 @@ class CodeGenerator():
                     f"   sw $v0, {var.label}\n\n"
                 )
         
-        mainCallCode = self._generateCallerCode(ASTnode(label="main", children=[]))
+        mainCallCode = self._assembly(self._generateCallerCode(ASTnode(label="main", children=[])))
         asm += (
             ".text\n"
             ".globl main\n"
@@ -57,37 +81,64 @@ class CodeGenerator():
             "   syscall\n\n"
         )
         
+        if self.stepBudget:
+            asm += (
+                "step_budget_exceeded:\n"
+                "   la $a0, step_budget_message\n"
+                "   li $v0 4\n"
+                "   syscall\n"
+                "   li $v0 10\n"
+                "   syscall\n\n"
+            )
+        
         for fun in [child for child in self.AST.children if child.type == NodeTypes.FunDeclaration]:
-            asm += self._generateFunctionCode(fun)
+            asm += self._assembly(self._generateFunctionCode(fun))
         
         self._writeAssemblyToFile(asm)
+        return self.assembly
+    
+    def _assembly(self, code):
+        # the code generators yield pieces of assembly, and the nodes whose code goes in between, which are generated
+        # with a stack of the generators in progress instead of recursion, so nested code takes linear time
+        pieces = []
+        generators = [code]
+        while generators:
+            for piece in generators[-1]:
+                if isinstance(piece, str):
+                    pieces.append(piece)
+                else:
+                    generators.append(self._generateStatementCode(piece))
+                    break
+            else:
+                generators.pop()
+        
+        return "".join(pieces)
     
     def _generateCallerCode(self, callNode : ASTnode):
-        asm = ""
         if callNode.label == "output":
-            asm += self._generateStatementCode(callNode.children[0])
-            asm += (
+            yield callNode.children[0]
+            yield (
                 "   li $v0, 1\n"
                 "   syscall\n"
                 "   la $a0, newline\n"
                 "   li $v0 4\n"
                 "   syscall\n"
             )
-            return asm
+            return
         elif callNode.label == "input":
-            asm += (
+            yield (
                 "   li $v0 5\n"
                 "   syscall\n"
                 "   move $a0 $v0\n"
             )
-            return asm
+            return
         
         
         calleeLabel = callNode.label
         bodyVars = self.st.getFunBodyTypes(calleeLabel)
         
         
-        asm += (
+        yield (
             "   sw $fp 0($sp)\n"
             "   addiu $sp $sp -4\n"
         )
@@ -95,45 +146,44 @@ class CodeGenerator():
         for size in bodyVars[::-1]:
             if size != 0:
                 # if it's an array call the heap and store the adress in a0
-                asm += (
+                yield (
                     "   li $v0 9\n"
                     f"   li $a0 {size * 4}\n"
                     "   syscall\n"
                     "   move $a0, $v0\n"
                 )
-            asm += (
+            yield (
                 "   sw $a0 0($sp)\n"
                 "   addiu $sp $sp -4\n"
             )
         
         for param in callNode.children[::-1]:
-            asm += self._generateStatementCode(param)
-            asm += (
+            yield param
+            yield (
                 "   sw $a0 0($sp)\n"
                 "   addiu $sp $sp -4\n"
             )
         
-        asm += f"   jal {calleeLabel}_entry\n"
-        
-        return asm
+        yield f"   jal {calleeLabel}_entry\n"
     
     def _generateFunctionCode(self, function : ASTnode):
         self.st.fill(function)
-        asm = (
+        yield (
             f"{function.label}_entry:\n"
             "   # store the return address after jumping\n"
             "   move $fp $sp\n"
             "   sw $ra 0($sp)\n"
             "   addiu $sp $sp -4\n\n"
         )
+        yield self._stepCode()
         
         self.currentFunctionLabel = function.label
         compoundStatement = next(node for node in function.children if node.type == NodeTypes.CompoundStmt)
         for child in compoundStatement.children:
-            asm += self._generateStatementCode(child)
+            yield child
         self.currentFunctionLabel = ""
         
-        asm += (
+        yield (
             f"{function.label}_exit:\n"
             "\n   # erase logically the AR and jump back to the return address\n"
             f"   lw $ra 4($sp)\n"
@@ -143,48 +193,43 @@ class CodeGenerator():
             "   jr $ra\n\n"
         )
         self.st.pop()
-        return asm
     
     def _generateStatementCode(self, node : ASTnode):
         if node.type == NodeTypes.NUM:
-            return f"   li $a0 {node.label}\n"
+            yield f"   li $a0 {node.label}\n"
         elif node.type == NodeTypes.ID:
-            return self._genID(node)
+            yield from self._genID(node)
         elif node.type == NodeTypes.Assignment:
-            return self._genAssignment(node)
+            yield from self._genAssignment(node)
         elif node.type == NodeTypes.BinaryOp:
-            return self._genBinaryOp(node)
+            yield from self._genBinaryOp(node)
         elif node.type == NodeTypes.Call:
-            return self._generateCallerCode(node)
+            yield from self._generateCallerCode(node)
         elif node.type == NodeTypes.Index:
-            return self._generateStatementCode(node.children[0])
+            yield node.children[0]
         elif node.type in [NodeTypes.Selection, NodeTypes.Iteration]:
-            return self._genControlStatement(node)
+            yield from self._genControlStatement(node)
         elif node.type == NodeTypes.Return:
-            asm = ""
             if len(node.children) != 0:
-                asm = self._generateStatementCode(node.children[0])
-            asm += f"   b {self.currentFunctionLabel}_exit\n"
-            return asm
-        else:
-            return ""
+                yield node.children[0]
+            yield f"   b {self.currentFunctionLabel}_exit\n"
     
     def _genControlStatement(self, node : ASTnode):
         count = str(self.controlStatementCount)
         # while
         if node.type == NodeTypes.Iteration:
-            asm = "\n   # While Statement\n"
+            yield "\n   # While Statement\n"
         
             compoundStatement = next(child for child in node.children if child.type == NodeTypes.Then).children[0]
-            asm += self._controlStatementVariableCode(compoundStatement)
+            yield self._controlStatementVariableCode(compoundStatement)
             
-            asm += f"while_entry_{count}:\n"
+            yield f"while_entry_{count}:\n"
             
             condition = next(child for child in node.children if child.type == NodeTypes.Condition)
             
-            asm += self._generateStatementCode(condition.children[0])
+            yield condition.children[0]
             
-            asm += (
+            yield (
                 "   li $t1 0\n"
                 f"   beq $a0 $t1 while_exit_{count}\n"
             )
@@ -193,10 +238,10 @@ class CodeGenerator():
             for child in compoundStatement.children:
                 if child.type == NodeTypes.Return:
                     if len(child.children) != 0:
-                        asm += self._generateStatementCode(child.children[0])
+                        yield child.children[0]
                         
                     offset = self.st.getControlStatementOffset()
-                    asm += (
+                    yield (
                         f"   addiu $fp $fp {offset}\n"
                         "   move $sp $fp\n"
                         "   addiu $sp $sp -4\n"
@@ -204,15 +249,17 @@ class CodeGenerator():
                     )
                     
                 else:
-                    asm += self._generateStatementCode(child)
+                    yield child
                     
             self.controlStatementCount -= 1
             
-            asm += (
+            # the back edge of the loop counts as a step
+            yield self._stepCode()
+            yield (
                 f"   b while_entry_{count}\n"
                 f"while_exit_{count}:\n"
             )
-            asm += (
+            yield (
                 "   # erase logically the control statement variables\n"
                 f"   addiu $sp $sp {4 * self.st.getCurrentScopeLength() + 8}\n"
                 "   move $fp $sp\n"
@@ -221,12 +268,12 @@ class CodeGenerator():
             self.st.pop()
             
         else: # if
-            asm = "\n   # If Statement\n"
+            yield "\n   # If Statement\n"
             condition = next(child for child in node.children if child.type == NodeTypes.Condition)
             
-            asm += self._generateStatementCode(condition.children[0])
+            yield condition.children[0]
             
-            asm += (
+            yield (
                 "   li $t1 0\n"
                 f"   beq $a0 $t1 false_branch_{count}\n"
                 f"\ntrue_branch_{count}:\n"
@@ -234,16 +281,16 @@ class CodeGenerator():
             
             # fill variables for then, and then the body
             thenCompound = next(child for child in node.children if child.type == NodeTypes.Then).children[0]
-            asm += self._controlStatementVariableCode(thenCompound)
+            yield self._controlStatementVariableCode(thenCompound)
             
             self.controlStatementCount += 1
             for child in thenCompound.children:
                 if child.type == NodeTypes.Return:
                     if len(child.children) != 0:
-                        asm += self._generateStatementCode(child.children[0])
+                        yield child.children[0]
                         
                     offset = self.st.getControlStatementOffset()
-                    asm += (
+                    yield (
                         f"   addiu $fp $fp {offset}\n"
                         "   move $sp $fp\n"
                         "   addiu $sp $sp -4\n"
@@ -251,10 +298,10 @@ class CodeGenerator():
                     )
                     
                 else:
-                    asm += self._generateStatementCode(child)
+                    yield child
             self.controlStatementCount -= 1
             
-            asm += (
+            yield (
                 "   # erase logically the control statement variables\n"
                 f"   addiu $sp $sp {4 * self.st.getCurrentScopeLength() + 8}\n"
                 "   move $fp $sp\n"
@@ -262,23 +309,23 @@ class CodeGenerator():
             )
             self.st.pop()
             
-            asm += f"   b end_if_{count}\n"
+            yield f"   b end_if_{count}\n"
             
             # do the same for the else
-            asm += f"\nfalse_branch_{count}:\n"
+            yield f"\nfalse_branch_{count}:\n"
             elses = [child for child in node.children if child.type == NodeTypes.Else]
             if any(elses):
                 elseCompound = elses[0].children[0]
-                asm += self._controlStatementVariableCode(elseCompound)
+                yield self._controlStatementVariableCode(elseCompound)
                 
                 self.controlStatementCount += 1
                 for child in elseCompound.children:
                     if child.type == NodeTypes.Return:
                         if len(child.children) != 0:
-                            asm += self._generateStatementCode(child.children[0])
+                            yield child.children[0]
                             
                         offset = self.st.getControlStatementOffset()
-                        asm += (
+                        yield (
                             f"   addiu $fp $fp {offset}\n"
                             "   move $sp $fp\n"
                             "   addiu $sp $sp -4\n"
@@ -286,10 +333,10 @@ class CodeGenerator():
                         )
                         
                     else:
-                        asm += self._generateStatementCode(child)
+                        yield child
                 self.controlStatementCount -= 1
                 
-                asm += (
+                yield (
                     "   # erase logically the control statement variables\n"
                     f"   addiu $sp $sp {4 * self.st.getCurrentScopeLength() + 8}\n"
                     "   move $fp $sp\n"
@@ -298,11 +345,23 @@ class CodeGenerator():
                 self.st.pop()
             
             # finish the if
-            asm += f"end_if_{count}:\n"        
+            yield f"end_if_{count}:\n"
         
         self.controlStatementCount += 1
+    
+    def _stepCode(self):
+        if not self.stepBudget:
+            return ""
         
-        return asm
+        # $a0 can hold a value at this point, so the counter is kept in $t2
+        return (
+            "   # stop the program if it's out of steps, otherwise count this one\n"
+            f"   lw $t2, {STEP_BUDGET_LABEL}\n"
+            "   li $t1 0\n"
+            "   beq $t2 $t1 step_budget_exceeded\n"
+            "   addiu $t2 $t2 -1\n"
+            f"   sw $t2, {STEP_BUDGET_LABEL}\n"
+        )
     
     def _controlStatementVariableCode(self, compoundStatement : ASTnode):
         asm = (
@@ -336,56 +395,50 @@ class CodeGenerator():
         return asm
         
     def _genBinaryOp(self, node : ASTnode):
-        asm = ""
         
-        asm += self._generateStatementCode(node.children[0])
+        yield node.children[0]
         
-        asm += (
+        yield (
             "   sw $a0 0($sp)\n"
             "   addiu $sp $sp -4\n"
         )
         
-        asm += self._generateStatementCode(node.children[1])
+        yield node.children[1]
         
-        asm += (
+        yield (
             "   lw $t1 4($sp)\n"
             "   addiu $sp $sp 4\n"
         )
         
         op = node.label
         if op == "+":
-            asm += "   add $a0 $t1 $a0\n"
+            yield "   add $a0 $t1 $a0\n"
         elif op == "-":
-            asm += "   sub $a0 $t1 $a0\n"
+            yield "   sub $a0 $t1 $a0\n"
         elif op == "*":
-            asm += (
+            yield (
                 "   mult $a0 $t1\n"
                 "   mflo $a0\n"
             )
         elif op == "/":
-            asm += (
+            yield (
                 "   div $t1 $a0\n"
                 "   mflo $a0\n"
             )
         elif op == "<=":
-            asm += "   sle $a0 $t1 $a0\n"
+            yield "   sle $a0 $t1 $a0\n"
         elif op == "<":
-            asm += "   slt $a0 $t1 $a0\n"
+            yield "   slt $a0 $t1 $a0\n"
         elif op == ">=":
-            asm += "   sle $a0 $a0 $t1\n"
+            yield "   sle $a0 $a0 $t1\n"
         elif op == ">":
-            asm += "   slt $a0 $a0 $t1\n"
+            yield "   slt $a0 $a0 $t1\n"
         elif op == "==":
-            asm += "   seq $a0 $a0 $t1\n"
+            yield "   seq $a0 $a0 $t1\n"
         elif op == "!=":
-            asm += "   sne $a0 $a0 $t1\n"
-            
-        
-        return asm
-            
+            yield "   sne $a0 $a0 $t1\n"
     
     def _genID(self, node):
-        asm = ""
         
         idLabel = node.label
         symbol = self.st.getSymbol(idLabel)
@@ -394,9 +447,9 @@ class CodeGenerator():
             if symbol.type == Types.Array:
                 if len(node.children) == 1: # global indexed array
                     # get the value of the index in the acc
-                    asm += self._generateStatementCode(node.children[0].children[0])
+                    yield node.children[0].children[0]
                     
-                    asm += (
+                    yield (
                         "   li $t1 4\n"
                         "   mult $a0, $t1\n"
                         "   mflo $a0\n"
@@ -405,12 +458,12 @@ class CodeGenerator():
                         "   lw $a0, ($t0)\n"
                     )
                 else: # global un-indexed array, set the acumulator to the address of the array
-                    asm += (
+                    yield (
                         f"   lw $a0, {idLabel}\n"
                     )
             else:
                 # global int
-                asm += (
+                yield (
                     f"   lw $a0, {idLabel}\n"
                 )
         else:
@@ -421,9 +474,9 @@ class CodeGenerator():
                 if len(node.children) == 1:
                     # local indexed array
                     # get the value of the index in the acc
-                    asm += self._generateStatementCode(node.children[0].children[0])
+                    yield node.children[0].children[0]
                     
-                    asm += (
+                    yield (
                         "   li $t1 4\n"
                         "   mult $a0, $t1\n"
                         "   mflo $a0\n"
@@ -433,20 +486,18 @@ class CodeGenerator():
                     )
                 else:
                     # non-indexed local array
-                    asm += (
+                    yield (
                         f"   lw $a0, {fpOffset}($fp)\n"
                     )
             else:
                 # local int
-                asm += (
+                yield (
                     f"   lw $a0, {fpOffset}($fp)\n"
                 )
-        
-        return asm
-            
+    
     def _genAssignment(self, node : ASTnode):
         # store the right of the expression in the acc
-        asm = self._generateStatementCode(node.children[-1])
+        yield node.children[-1]
         
         assigneeLabel = node.children[0].label
         symbol = self.st.getSymbol(assigneeLabel)
@@ -457,14 +508,14 @@ class CodeGenerator():
                 if len(node.children[0].children) == 1:
                     # global indexed array  
                     # store the right-part in the stack
-                    asm += (
+                    yield (
                         "   sw $a0 0($sp)\n"
                         "   addiu $sp $sp -4\n"
                     )
                     # get the value of the index in the acc
-                    asm += self._generateStatementCode(node.children[0].children[0])
+                    yield node.children[0].children[0]
                     
-                    asm += (
+                    yield (
                         "   li $t1 4\n"
                         "   mult $a0, $t1\n"
                         "   mflo $a0\n"
@@ -476,12 +527,12 @@ class CodeGenerator():
                     )
                 else:
                     # global, not-indexed array -> the acc holds an address to another array
-                    asm += (
+                    yield (
                         f"   sw $a0, {assigneeLabel}\n"
                     )
             else:
                 # global int
-                asm += (
+                yield (
                     f"   sw $a0, {assigneeLabel}\n"
                 )
         else:
@@ -492,14 +543,14 @@ class CodeGenerator():
                 if len(node.children[0].children) == 1:
                     # locally indexed array  
                     # store the right-part in the stack
-                    asm += (
+                    yield (
                         "   sw $a0 0($sp)\n"
                         "   addiu $sp $sp -4\n"
                     )
                     # get the value of the index in the acc
-                    asm += self._generateStatementCode(node.children[0].children[0])
+                    yield node.children[0].children[0]
                     
-                    asm += (
+                    yield (
                         "   li $t1 4\n"
                         "   mult $a0, $t1\n"
                         "   mflo $a0\n"
@@ -511,16 +562,18 @@ class CodeGenerator():
                     )
                 else:
                     # local, not-indexed array -> the acc holds an address to another array
-                    asm += (
+                    yield (
                         f"   sw $a0, {fpOffset}($fp)\n"
                     )
             else:
                 # local int
-                asm += f"   sw $a0, {fpOffset}($fp)\n"
-                
-        
-        return asm
+                yield f"   sw $a0, {fpOffset}($fp)\n"
     
     def _writeAssemblyToFile(self, code: str):
+        self.assembly = code
+        
+        # without a path, the assembly is only kept in memory
+        if self.filePath == None: return
+        
         with open(self.filePath, "w") as f:
             f.write(code)
\ No newline at end of file
@@ -14,4 +14,4 @@ class Compiler():
     def compile(self, path="output.s"):
         codeGenerator = CodeGenerator(self.typeChecker.AST, filePath=path)
         
-        codeGenerator.generateCode()
\ No newline at end of file
+        return codeGenerator.generateCode()
\ No newline at end of file
@@ -0,0 +1,94 @@
+from bisect import bisect_right
+import re
+
+"""
+Errors found by the lexer, the parser and the type checker are collected as Diagnostic records, so the server can
+return all of them at once instead of reading them from stdout.
+
+The line and column of an error are found with a binary search over the offsets where the lines start, which are
+computed the first time an error is reported, so programs without errors don't pay for them. Programs with many
+errors are capped at maxErrors records, while the number of errors past the cap is still counted.
+
+When only the first error is needed, the lexer, the parser and the type checker can fail fast: they stop at the first
+error, and the parser and the type checker raise FirstErrorFound to leave the walk right away.
+
+Programs nested deeper than the nesting limit of the parser get an error at the level past the limit, and the parser
+raises NestingLimitReached to stop there, since the rest of the program can't be parsed.
+"""
+
+class FirstErrorFound(Exception):
+    # stops the parser or the type checker at the first error, when they fail fast
+    pass
+
+class NestingLimitReached(Exception):
+    # stops the parser at a statement or an expression nested deeper than its limit
+    pass
+
+class LineIndex():
+    def __init__(self, program : str):
+        self.program = program
+        self.lineStarts = None
+
+    def position(self, pos : int):
+        # returns the line and column of the character at pos, both starting at 1
+        if self.lineStarts == None:
+            self.lineStarts = [0] + [match.end() for match in re.finditer("\n", self.program)]
+
+        line = bisect_right(self.lineStarts, pos)
+        return line, pos - self.lineStarts[line - 1] + 1
+
+    def line(self, line : int):
+        # returns the text of the line, without its new line
+        start = self.lineStarts[line - 1]
+        end = self.lineStarts[line] - 1 if line < len(self.lineStarts) else len(self.program)
+        return self.program[start:end]
+
+class Diagnostic():
+    def __init__(self, errorType : str, message : str, line : int, column : int):
+        self.errorType = errorType
+        self.message = message
+        self.line = line
+        self.column = column
+
+    def format(self, lineIndex : LineIndex):
+        # the error with the line it's in, and a caret under the column
+        return (
+            f"\n>>> {self.errorType} error found at line "
+            + str(self.line)
+            + ": " + self.message + "\n"
+            + lineIndex.line(self.line) + "\n"
+            + " " * (self.column - 1) + "^\n"
+        )
+
+    def toDict(self):
+        return {'type': self.errorType, 'message': self.message, 'line': self.line, 'column': self.column}
+
+class Diagnostics():
+    def __init__(self, program : str, maxErrors : int = 0, prints : bool = True):
+        # maxErrors is the number of errors kept, 0 to keep all of them
+        # the server doesn't print the errors, the command line compiler does
+        self.lineIndex = LineIndex(program)
+        self.maxErrors = maxErrors
+        self.prints = prints
+
+        self.errors : list[Diagnostic] = []
+        self.errorCount = 0
+        # set when a stage failed fast, so the rest of the program wasn't checked for more errors
+        self.isStopped = False
+
+    def report(self, errorType : str, message : str, pos : int):
+        # records the error at pos, and returns it
+        line, column = self.lineIndex.position(pos)
+        diagnostic = Diagnostic(errorType, message, line, column)
+
+        self.errorCount += 1
+        if self.maxErrors <= 0 or len(self.errors) < self.maxErrors:
+            self.errors.append(diagnostic)
+        return diagnostic
+
+    def isTruncated(self):
+        return self.errorCount > len(self.errors) or (self.isStopped and self.errorCount > 0)
+
+    def toList(self):
+        # the errors in the order they're in the program, lexer errors are all found before the parser starts
+        return [diagnostic.toDict() for diagnostic in sorted(self.errors, key=lambda d: (d.line, d.column))]
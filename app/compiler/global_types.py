@@ -1,4 +1,5 @@
-from enum import Enum
+from enum import Enum, IntEnum
+from sys import intern
 
 class TokenType(Enum):
     # Reserved words
@@ -62,43 +63,56 @@ STATEMENT_STARTERS = [TokenType.SEMICOLON, TokenType.ID, TokenType.LPAR, TokenTy
 EXPRESSION_STMT_STARTERS = [TokenType.SEMICOLON, TokenType.ID, TokenType.LPAR, TokenType.NUM]
 EXPRESSION_STARTERS = [TokenType.ID, TokenType.LPAR, TokenType.NUM]
 RELOP = [TokenType.LETHEQ, TokenType.LETH, TokenType.BITH, TokenType.BITHEQ, TokenType.EQ, TokenType.NEQ]
+ADDOP = [TokenType.PLUS, TokenType.MINUS]
+MULOP = [TokenType.TIMES, TokenType.OVER]
 
-class NodeTypes(Enum):
-    Program = "Program"
+"""
+kinds of the nodes of the AST, integers so they can index tuples and are compared as ints
+"""
+class NodeTypes(IntEnum):
+    Program = 0
     
-    ID = "ID"
-    NUM = "NUM"
-    VarDeclaration = "VarDeclaration"
+    ID = 1
+    NUM = 2
+    VarDeclaration = 3
     
-    FunDeclaration = "FunDeclaration"
-    Param = "Param"
+    FunDeclaration = 4
+    Param = 5
     
-    CompoundStmt = "CompoundStmt"
+    CompoundStmt = 6
 
-    Selection = "Selection"
-    Condition = "Condition"
-    Then = "Then"
-    Else = "Else"
+    Selection = 7
+    Condition = 8
+    Then = 9
+    Else = 10
     
-    Iteration = "Iteration"
+    Iteration = 11
     
-    Return = "Return"
+    Return = 12
     
     # Expressions related to an ID
-    Index = "Index"
-    Assignment = "Assignment"
-    Var = "Var"
-    Call = "Call"
-    Args = "Args"
+    Index = 13
+    Assignment = 14
+    Var = 15
+    Call = 16
+    Args = 17
     
-    BinaryOp = "BinaryOp"
+    BinaryOp = 18
     
 
+# children of the nodes that don't have any, shared by all of them
+NO_CHILDREN = ()
+
 class ASTnode():
+    # fixed slots instead of a dict per node, programs and generated test harnesses have many nodes
+    __slots__ = ("type", "label", "children", "pos", "isArrayParam", "arraySize", "returnType", "isIdIndexed")
+
     def __init__(self, type = None, label = "", children = None, pos = 0, isArrayParam = False, arraySize = 0, returnType = None, isIdIndexed = False):
         self.type : NodeTypes = type
-        self.label : str = label
-        self.children : list[ASTnode] = children if children != None else []
+        # interned, so an ID used many times keeps a single copy of its name
+        self.label : str = intern(label)
+        # a node the parser appends children to is given a list, the others share an empty tuple
+        self.children : list[ASTnode] = children if children != None else NO_CHILDREN
         self.pos : int = pos
         
         # special attributes used in some cases
@@ -106,6 +120,7 @@ class ASTnode():
         self.arraySize : int = arraySize
         self.returnType : Types = returnType
         self.isIdIndexed : bool = isIdIndexed
+
 class Types(Enum):
     Int = "Int"
     Void = "Void"
@@ -0,0 +1,238 @@
+from compiler.global_types import *
+from compiler.diagnostics import Diagnostic, Diagnostics
+from compiler.lexer import Lexer, CHARACTER_CLASSES, TOKEN_CHARACTERS, TOKEN_CODES, END_CLASS, OTHER_CLASS, ERROR_CODE
+from compiler.parser import Parser, MAX_NESTING
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, compress
+
+"""
+Checks the syntax of a document that's edited a little at a time, like a program open in an editor.
+
+The document is split into segments, each one a top-level declaration with the white space and comments before it.
+A segment ends after a ';' or a '}' that's not inside braces, followed by a character the lexer accepts after them,
+so the lexer is back in its first state at the start of every segment, and each segment can be lexed on its own.
+When the document is edited, only the segments the edit touches are lexed and parsed again, and split again.
+If they don't end at the end of a segment anymore, like after opening a brace or a comment, the next segments
+are added to them until they do.
+
+Each segment is parsed on its own, which gives the same first error as parsing the whole document, since the
+segments before it parse to complete declarations. After an error, the parser starts again at the next segment
+instead of recovering through the rest of the document, so the later errors can differ from the ones /checkSyntax
+reports for the whole program.
+
+The work for an edit in Python is lexing and parsing the segments it touches, and moving the errors of the
+segments that have them to their position in the document. The lengths, line counts and error counts of the segments
+are kept in lists, so finding the segments of an edit and the lines they start at is done with built-ins.
+"""
+
+SEMICOLON_CODE = TOKEN_CODES[TokenType.SEMICOLON]
+LKEY_CODE = TOKEN_CODES[TokenType.LKEY]
+RKEY_CODE = TOKEN_CODES[TokenType.RKEY]
+DECLARATION_CODES = (TOKEN_CODES[TokenType.INT], TOKEN_CODES[TokenType.VOID])
+
+# characters a segment can start with, the lexer accepts them after a ';' or a '}' like the end of the program
+SEGMENT_START_CLASSES = set(TOKEN_CHARACTERS) - {END_CLASS}
+
+# rough memory used by a segment, besides its text
+SEGMENT_BYTES = 512
+
+class Segment():
+    def __init__(self, text : str, isFirst : bool, maxErrors : int = 0, lexer : Lexer = None, maxNesting : int = MAX_NESTING):
+        self.text = text
+        self.isFirst = isFirst
+
+        # to find where the next segment starts
+        self.newLines = text.count("\n")
+        self.lastLineLength = len(text) - text.rfind("\n") - 1
+
+        # the lexer errors are reported first, then the parser errors
+        self.lexer = lexer if lexer != None else Lexer(text, diagnostics=Diagnostics(text, maxErrors, prints=False))
+        tokens = self.lexer.tokenize()
+        self.lexerErrorCount = self.lexer.diagnostics.errorCount
+        self.lexerError = (self.lexer.firstErrorMessage, self.lexer.errorLine, self.lexer.errorColumn)
+        self.syntaxError = ("", 0, 0)
+        self.isParsingStopped = False
+        # message of an exception raised by the parser, which stops it like for the whole program
+        self.exception = None
+
+        first = 0
+        while tokens.types[first] == ERROR_CODE:
+            first += 1
+
+        # the first declaration is parsed even if it doesn't start with a type, like in Parser._program,
+        # while after a declaration, anything else is the end of the program
+        if isFirst or tokens.types[first] in DECLARATION_CODES:
+            parser = Parser(text, lexer=self.lexer, maxNesting=maxNesting)
+            try:
+                parser.parse()
+            except Exception as e:
+                self.exception = str(e)
+            self.syntaxError = (parser.firstErrorMessage, parser.lineNumber, parser.columnNumber)
+            self.isParsingStopped = self.exception != None or parser.token != TokenType.ENDFILE
+        elif first < len(tokens) - 1:
+            message = "Program finished prematurely"
+            self.syntaxError = (message, *self.lexer.printErrorLine(message, tokens.ends[first] - 1))
+            self.isParsingStopped = True
+
+    def diagnostics(self):
+        # the errors kept, lexer errors first, with their positions in the segment
+        return self.lexer.diagnostics.errors
+
+    def syntaxErrorCount(self):
+        return self.lexer.diagnostics.errorCount - self.lexerErrorCount
+
+class IncrementalDocument():
+    def __init__(self, program : str, maxErrors : int = 0, maxNesting : int = MAX_NESTING):
+        # maxErrors is the number of errors kept, 0 to keep all of them
+        self.maxErrors = maxErrors
+        self.maxNesting = maxNesting
+        self.length = len(program)
+        self.segments : list[Segment] = []
+
+        # for each segment, its length, its number of new lines, its number of errors, and if it stops the parser
+        self.lengths : list[int] = []
+        self.newLineCounts : list[int] = []
+        self.errorCounts : list[int] = []
+        self.stopsParsing : list[bool] = []
+
+        self._parseSegments(0, -1, program)
+
+    def edit(self, start : int, end : int, text : str):
+        # replaces the characters from start to end with text
+        if not 0 <= start <= end <= self.length:
+            raise ValueError(f"The edit from {start} to {end} is outside of the document, of length {self.length}")
+
+        # the segments touching the edit, including the ones that end where it starts or start where it ends
+        starts = list(accumulate(self.lengths[:-1], initial=0))
+        first = max(bisect_left(starts, start) - 1, 0)
+        last = bisect_right(starts, end) - 1
+
+        regionStart = starts[first]
+        region = "".join(segment.text for segment in self.segments[first:last + 1])
+        region = region[:start - regionStart] + text + region[end - regionStart:]
+
+        self.length += len(text) - (end - start)
+        self._parseSegments(first, last, region)
+
+    def text(self):
+        return "".join(segment.text for segment in self.segments)
+
+    def size(self):
+        return self.length + len(self.segments) * SEGMENT_BYTES
+
+    def errors(self):
+        # all the errors found, as dicts, and whether there were more than the ones kept
+        errors = sorted(self.errorList, key=lambda d: (d.line, d.column))
+        return [diagnostic.toDict() for diagnostic in errors], self.errorCount > len(self.errorList)
+
+    def _parseSegments(self, first, last, region):
+        # replaces the segments from first to last with the ones region is split into
+        while True:
+            nextCharacter = self.segments[last + 1].text[:1] if last + 1 < len(self.segments) else ""
+            lexer = Lexer(region, diagnostics=Diagnostics(region, self.maxErrors, prints=False))
+            boundaries = self._boundaries(region, lexer.tokenize(), nextCharacter)
+
+            if not nextCharacter or (boundaries and boundaries[-1] == len(region)):
+                break
+
+            # the next segments are lexed differently now, twice as many are added each time so it doesn't take
+            # quadratic time when an unclosed comment or brace goes to the end of the document
+            added = self.segments[last + 1:last + 1 + max(last - first + 1, 1)]
+            region += "".join(segment.text for segment in added)
+            last += len(added)
+
+        if boundaries and boundaries[-1] == len(region):
+            boundaries.pop()
+        if not boundaries:
+            segments = [Segment(region, first == 0, self.maxErrors, lexer, self.maxNesting)]
+        else:
+            starts = [0] + boundaries
+            ends = boundaries + [len(region)]
+            segments = [
+                Segment(region[segmentStart:segmentEnd], first == 0 and segmentStart == 0, self.maxErrors, maxNesting=self.maxNesting)
+                for segmentStart, segmentEnd in zip(starts, ends)
+            ]
+
+        self.segments[first:last + 1] = segments
+        self.lengths[first:last + 1] = [len(segment.text) for segment in segments]
+        self.newLineCounts[first:last + 1] = [segment.newLines for segment in segments]
+        self.errorCounts[first:last + 1] = [segment.lexer.diagnostics.errorCount for segment in segments]
+        self.stopsParsing[first:last + 1] = [segment.isParsingStopped for segment in segments]
+        self._summarize()
+
+    def _boundaries(self, region, tokens, nextCharacter):
+        # offsets where segments end: after a ';' or a '}' outside of braces, followed by a character that can start one
+        types = tokens.types
+        ends = tokens.ends
+        boundaries = []
+        depth = 0
+
+        for index in range(len(types) - 1):
+            code = types[index]
+            if code == LKEY_CODE:
+                depth += 1
+            elif code == RKEY_CODE and depth > 0:
+                depth -= 1
+
+            if depth == 0 and (code == SEMICOLON_CODE or code == RKEY_CODE):
+                end = ends[index]
+                character = region[end] if end < len(region) else nextCharacter
+                if CHARACTER_CLASSES.get(character, OTHER_CLASS) in SEGMENT_START_CLASSES:
+                    boundaries.append(end)
+
+        return boundaries
+
+    def _summarize(self):
+        # the errors of the segments, with their lines and columns in the document
+        lexerErrors, syntaxErrors = [], []
+        lexerErrorCount, syntaxErrorCount = 0, 0
+        self.lexerError = self.syntaxError = ("", 0, 0)
+
+        # the parser stops at the first segment that stops it, the segments after it only have lexer errors
+        stop = self.stopsParsing.index(True) if True in self.stopsParsing else len(self.segments) - 1
+        self.exception = self.segments[stop].exception
+        lineStarts = list(accumulate(self.newLineCounts, initial=1))
+
+        for index in compress(range(len(self.segments)), self.errorCounts):
+            segment = self.segments[index]
+            line, column = lineStarts[index], self._startColumn(index)
+
+            moved = [self._moveDiagnostic(diagnostic, line, column) for diagnostic in segment.diagnostics()]
+            if segment.lexerErrorCount and not lexerErrorCount:
+                self.lexerError = self._moveError(segment.lexerError, line, column)
+            lexerErrors += moved[:segment.lexerErrorCount]
+            lexerErrorCount += segment.lexerErrorCount
+
+            if index <= stop and segment.syntaxErrorCount():
+                if not syntaxErrorCount:
+                    self.syntaxError = self._moveError(segment.syntaxError, line, column)
+                syntaxErrors += moved[segment.lexerErrorCount:]
+                syntaxErrorCount += segment.syntaxErrorCount()
+
+        self.isLexerValid = lexerErrorCount == 0
+        self.isSyntaxValid = syntaxErrorCount == 0
+
+        # like Diagnostics, the lexer errors are kept before the parser errors
+        self.errorList = lexerErrors + syntaxErrors
+        self.errorCount = lexerErrorCount + syntaxErrorCount
+        if self.maxErrors > 0:
+            self.errorList = self.errorList[:self.maxErrors]
+
+    def _startColumn(self, index):
+        # column where the segment starts, after the last new line of the segments before it
+        column = 1
+        while index > 0:
+            index -= 1
+            if self.newLineCounts[index]:
+                return column + self.segments[index].lastLineLength
+            column += self.lengths[index]
+        return column
+
+    def _moveDiagnostic(self, diagnostic : Diagnostic, line : int, column : int):
+        # from the position in the segment, which starts at line and column, to the position in the document
+        message, line, column = self._moveError((diagnostic.message, diagnostic.line, diagnostic.column), line, column)
+        return Diagnostic(diagnostic.errorType, message, line, column)
+
+    def _moveError(self, error, line : int, column : int):
+        message, errorLine, errorColumn = error
+        return (message, errorLine + line - 1, errorColumn + column - 1 if errorLine == 1 else errorColumn)
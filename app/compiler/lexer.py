@@ -1,77 +1,308 @@
 from compiler.global_types import *
+from compiler.diagnostics import Diagnostics
+from array import array
+from itertools import accumulate
+from operator import itemgetter, sub
+import re
+
+"""
+The lexer is a DFA driven by a transition table: each character is mapped to its class once, and the next state
+is read from the row of the current state at the column of that class.
+
+States 0 to 14 are not final, states from 15 are final and return a token without consuming the current character,
+except COMMENT_END, which goes back to state 0. A transition to ERROR_TRANSITION reports an error for the current
+character and skips it.
+
+Most programs have no lexical errors, so they are first tokenized with TOKEN_PATTERN, a regular expression that
+only matches the tokens the DFA would return, followed by the characters the DFA accepts after them. If it can't
+match the whole program, or the program has a '$', which the DFA reads as the end of the file, the program is lexed with the
+DFA instead, so the tokens, error messages and positions are always the ones of the DFA.
+
+Either way, the program is lexed once into a TokenBuffer, which the parser walks by index.
+"""
+
+# classes of characters, the columns of the transition table
+(LETTER_CLASS, NUMBER_CLASS, SPACE_CLASS, END_CLASS, SYMBOL_CLASS, STAR_CLASS, SLASH_CLASS,
+ LESS_CLASS, GREATER_CLASS, EQUAL_CLASS, BANG_CLASS, OTHER_CLASS) = range(12)
+
+CHARACTER_CLASSES = {
+    **{c: LETTER_CLASS for c in LETTER},
+    **{c: NUMBER_CLASS for c in NUMBER},
+    **{c: SPACE_CLASS for c in WHITE_SPACE - {"$"}},
+    **{c: SYMBOL_CLASS for c in SIMPLE_SYM - {"*"}},
+    "$": END_CLASS, "*": STAR_CLASS, "/": SLASH_CLASS, "<": LESS_CLASS, ">": GREATER_CLASS, "=": EQUAL_CLASS, "!": BANG_CLASS
+}
+
+# characters that can end an ID or a number: white space, operators and special symbols
+DELIMITERS = (SPACE_CLASS, END_CLASS, SYMBOL_CLASS, STAR_CLASS, SLASH_CLASS, LESS_CLASS, GREATER_CLASS, EQUAL_CLASS)
+# characters that can follow a symbol
+TOKEN_CHARACTERS = DELIMITERS + (LETTER_CLASS, NUMBER_CLASS)
+
+FIRST_FINAL_STATE = 15
+COMMENT_END = 19
+# after all the final states, so the loop only has to check for final states
+ERROR_TRANSITION = 29
+
+# tokens of the final states whose lexeme is always the same
+FINAL_STATE_TOKENS = {
+    18: (TokenType.OVER, "/"),
+    20: (TokenType.LETH, "<"),
+    21: (TokenType.LETHEQ, "<="),
+    22: (TokenType.BITH, ">"),
+    23: (TokenType.BITHEQ, ">="),
+    24: (TokenType.ASSIGN, "="),
+    25: (TokenType.EQ, "=="),
+    26: (TokenType.NEQ, "!="),
+    27: (TokenType.ENDFILE, "$"),
+    28: (TokenType.ERROR, "")
+}
+RESERVED_WORD_TOKENS = {word: TokenType(word) for word in RESERVED_WORDS}
+SIMPLE_SYMBOL_TOKENS = {symbol: TokenType(symbol) for symbol in SIMPLE_SYM}
+
+OPERATOR_TOKENS = {symbol: TokenType(symbol) for symbol in SIMPLE_SYM | OPERATORS}
+
+# characters that end an ID or a number, and characters that can follow a symbol
+_DELIMITER = r"[ \t\n$+\-*/<>=;,()\[\]{}]"
+_TOKEN_CHARACTER = r"[ \t\n$+\-*/<>=;,()\[\]{}A-Za-z0-9]"
+
+# each match is a token with the white space and comments before it, in its second group
+TOKEN_PATTERN = re.compile(
+    r"((?:[ \t\n]+"
+    # like the DFA, a '*' followed by another '*' doesn't end the comment
+    r"|/\*[^*$]*(?:\*[^/$][^*$]*)*\*/)*"
+    rf"([A-Za-z]+(?={_DELIMITER})"
+    rf"|[0-9]+(?={_DELIMITER})"
+    rf"|(?:<=|>=|==|!=|/(?!\*)|[<>=+\-*;,()\[\]{{}}])(?={_TOKEN_CHARACTER})"
+    r"|\$\Z))"
+)
+
+# tokens are stored as their index in TOKEN_TYPES
+TOKEN_TYPES = tuple(TokenType)
+TOKEN_CODES = {token: code for code, token in enumerate(TOKEN_TYPES)}
+ENDFILE_CODE = TOKEN_CODES[TokenType.ENDFILE]
+ERROR_CODE = TOKEN_CODES[TokenType.ERROR]
+
+class _TokenCodes(dict):
+    # code of the token of each lexeme, IDs and numbers are added when they're first seen
+    def __missing__(self, lexeme):
+        code = self[lexeme] = TOKEN_CODES[TokenType.NUM if lexeme[0] in NUMBER else TokenType.ID]
+        return code
+
+FIXED_TOKEN_CODES = {lexeme: TOKEN_CODES[token] for lexeme, token in {**RESERVED_WORD_TOKENS, **OPERATOR_TOKENS}.items()}
+FIXED_TOKEN_CODES["$"] = ENDFILE_CODE
+
+class TokenBuffer():
+    """
+    The tokens of a program in parallel arrays: the code of each token, and where it starts and ends in the program.
+    Errors of the lexer are ERROR tokens with nothing in between, and the last token is always ENDFILE.
+    """
+    def __init__(self, program : str, types : array, starts : array, ends : array):
+        self.program = program
+        self.types = types
+        self.starts = starts
+        self.ends = ends
+    
+    def __len__(self):
+        return len(self.types)
+    
+    def token(self, index : int) -> TokenType:
+        return TOKEN_TYPES[self.types[index]]
+    
+    def lexeme(self, index : int) -> str:
+        # lexemes are only sliced from the program when they're needed
+        if self.types[index] == ENDFILE_CODE:
+            return "$"
+        return self.program[self.starts[index]:self.ends[index]]
+    
+    def lexemes(self):
+        return map(self.program.__getitem__, map(slice, self.starts, self.ends))
+
+def _row(default, transitions):
+    # a row of the table, later transitions override the earlier ones
+    row = [default] * 12
+    for classes, state in transitions:
+        for characterClass in classes:
+            row[characterClass] = state
+    return tuple(row)
+
+TRANSITIONS = (
+    # 0: start of a token
+    _row(ERROR_TRANSITION, [
+        ((SPACE_CLASS,), 0), ((LETTER_CLASS,), 1), ((NUMBER_CLASS,), 2), ((SYMBOL_CLASS, STAR_CLASS), 3),
+        ((SLASH_CLASS,), 4), ((LESS_CLASS,), 7), ((GREATER_CLASS,), 9), ((EQUAL_CLASS,), 11), ((BANG_CLASS,), 13),
+        ((END_CLASS,), 27)
+    ]),
+    # 1: ID, 2: number
+    _row(ERROR_TRANSITION, [(DELIMITERS, 15), ((LETTER_CLASS,), 1)]),
+    _row(ERROR_TRANSITION, [(DELIMITERS, 16), ((NUMBER_CLASS,), 2)]),
+    # 3: simple symbol
+    _row(ERROR_TRANSITION, [(TOKEN_CHARACTERS, 17)]),
+    # 4: '/', which can start a comment
+    _row(ERROR_TRANSITION, [(TOKEN_CHARACTERS, 18), ((STAR_CLASS,), 5)]),
+    # 5: in a comment, 6: '*' in a comment
+    _row(5, [((STAR_CLASS,), 6), ((END_CLASS,), 27)]),
+    _row(5, [((SLASH_CLASS,), COMMENT_END), ((END_CLASS,), 27)]),
+    # 7: '<', 8: '<='
+    _row(ERROR_TRANSITION, [(TOKEN_CHARACTERS, 20), ((EQUAL_CLASS,), 8)]),
+    _row(ERROR_TRANSITION, [(TOKEN_CHARACTERS, 21)]),
+    # 9: '>', 10: '>='
+    _row(ERROR_TRANSITION, [(TOKEN_CHARACTERS, 22), ((EQUAL_CLASS,), 10)]),
+    _row(ERROR_TRANSITION, [(TOKEN_CHARACTERS, 23)]),
+    # 11: '=', 12: '=='
+    _row(ERROR_TRANSITION, [(TOKEN_CHARACTERS, 24), ((EQUAL_CLASS,), 12)]),
+    _row(ERROR_TRANSITION, [(TOKEN_CHARACTERS, 25)]),
+    # 13: '!', 14: '!='
+    _row(ERROR_TRANSITION, [((EQUAL_CLASS,), 14)]),
+    _row(ERROR_TRANSITION, [(TOKEN_CHARACTERS, 26)]),
+)
 
 class Lexer():
-    def __init__(self, program, strictMode=False, state=0):
+    def __init__(self, program, strictMode=False, state=0, diagnostics : Diagnostics = None, failFast=False):
         # variables to iterate through the program
         self.programLength = len(program) 
         self.program = program + '$'
         self.pos = 0
         
         self.strictMode = strictMode
+        # stops lexing at the first error
+        self.failFast = failFast
         
         self.isSyntaxValid = True
         self.firstErrorMessage = ""
         self.errorLine = 0
         self.errorColumn = 0
         
-        self.firstFinalState = 15 # all final states are at and after this number
+        # all the errors in the program, the parser and the type checker report theirs here too
+        self.diagnostics = diagnostics if diagnostics != None else Diagnostics(program)
+        
+        self.firstFinalState = FIRST_FINAL_STATE # all final states are at and after this number
         self.state = state
+        
+        # the tokens of the program, lexed the first time they're needed, and the next one getToken returns
+        self.tokens : TokenBuffer = None
+        self.tokenIndex = 0
 
+    def tokenize(self):
+        # returns the tokens of the whole program, with the fast path if it can be used
+        if self.tokens == None:
+            if self.state == 0:
+                self.tokens = self._tokenizeWithPattern()
+            if self.tokens == None:
+                self.tokens = self._tokenizeWithDFA()
+        return self.tokens
+    
     def getToken(self, prints = False):
-        lexeme = ""
+        # returns the next token and its lexeme, the end of the file is returned again if more tokens are read
+        tokens = self.tokenize()
+        index = self.tokenIndex
+        self.pos = tokens.ends[index]
+        if tokens.types[index] != ENDFILE_CODE:
+            self.tokenIndex = index + 1
         
-        while self.pos <= self.programLength:
-            if self.state == 0:
-                lexeme = ""
-            c = self.program[self.pos]
+        token, lexeme = tokens.token(index), tokens.lexeme(index)
+        if prints:
+            print(token," = ", lexeme)
+        return token, lexeme
+    
+    def _tokenizeWithPattern(self):
+        # returns the tokens, or None if the DFA has to lex the program
+        if self.program.find("$") < self.programLength:
+            return None
+        
+        # the arrays are built without a Python loop over the tokens, since that's the slow part
+        matches = TOKEN_PATTERN.findall(self.program)
+        ends = array("i", accumulate(map(len, map(itemgetter(0), matches))))
+        
+        # the matches are next to each other, so if they don't reach the end, a character wasn't matched
+        if not ends or ends[-1] != len(self.program):
+            return None
+        
+        lexemes = list(map(itemgetter(1), matches))
+        types = array("B", map(_TokenCodes(FIXED_TOKEN_CODES).__getitem__, lexemes))
+        starts = array("i", map(sub, ends, map(len, lexemes)))
+        
+        # the DFA stops at the '$' without reading it
+        starts[-1] = ends[-1] = self.programLength
+        return TokenBuffer(self.program, types, starts, ends)
+    
+    def _tokenizeWithDFA(self):
+        types, starts, ends = array("B"), array("i"), array("i")
+        while True:
+            token, start = self._nextToken()
             
-            self._advanceState(c)
+            # a '$' in the program ends it, and after an error in the last character there's no ENDFILE token
+            # when failing fast, the first error ends it as well
+            isStopped = self.failFast and not self.isSyntaxValid
+            if token == None or token == TokenType.ENDFILE or isStopped:
+                end = self.pos if token != None else self.programLength
+                self.diagnostics.isStopped = isStopped
+                types.append(ENDFILE_CODE)
+                starts.append(end)
+                ends.append(end)
+                return TokenBuffer(self.program, types, starts, ends)
             
-            # check if we have gotten to a final state
-            if self.state == 19: # this is the end of a comment, we don't want to return it to the parser
-                self.state = 0
-            elif self.state >= self.firstFinalState:
-                token, lexeme = self._returnFromFinalState(lexeme)
-                self.state = 0
+            types.append(TOKEN_CODES[token])
+            starts.append(start)
+            ends.append(self.pos)
+    
+    def _nextToken(self):
+        # lexes the next token with the DFA, returns it and where it starts, and leaves the lexer at its end
+        # the table and the program are read through locals, since this loop runs once for each character
+        program = self.program
+        programLength = self.programLength
+        pos = self.pos
+        state = self.state
+        start = pos
+        
+        while pos <= programLength:
+            if state == 0:
+                start = pos
+            
+            nextState = TRANSITIONS[state][CHARACTER_CLASSES.get(program[pos], OTHER_CLASS)]
+            
+            # final states, errors and the end of comments are all at or after FIRST_FINAL_STATE
+            if nextState >= FIRST_FINAL_STATE:
+                if nextState == COMMENT_END: # this is the end of a comment, we don't want to return it to the parser
+                    state = 0
+                    pos += 1
+                    continue
                 
-                if prints:
-                    print(token," = ", lexeme)
+                if nextState == ERROR_TRANSITION:
+                    self.state = state
+                    self.pos = pos
+                    self._handleErrors(program[pos])
+                    start = self.pos
+                else:
+                    self.state = nextState
+                    self.pos = pos
                 
-                return token, lexeme
+                token, _ = self._returnFromFinalState(program[start:pos])
+                self.state = 0
+                return token, start
             
             # we haven't gotten to a final state
-            lexeme += c
-            self.pos += 1
+            state = nextState
+            pos += 1
+        
+        self.state = state
+        self.pos = pos
+        return None, pos
     
     def getPos(self):
         return self.pos
     
     def printErrorLine(self, errorMessage="", pos_=None, errorType="Syntax"):
+        # reports the error at the last character before pos that's not a space, and returns its line and column
         pos = self.pos if pos_ == None else pos_
         while pos >= 0 and self.program[pos] in WHITE_SPACE:
             pos -= 1
         
-        # print where the error is 
-        lastNewLine = self.program.rfind('\n', 0, pos)
-        lastNewLine = lastNewLine + 1 if lastNewLine != -1 else 0
-        
-        nextNewLine = self.program.find('\n', pos)
-        nextNewLine = nextNewLine - 1 if nextNewLine != -1 else self.programLength - 1
-        
-        lineNumber = self.program[:pos].count('\n') + 1
-        columnNumber = pos - lastNewLine + 1
-        errorOutput = (
-            f"\n>>> {errorType} error found at line " 
-            + str(lineNumber)
-            + ": " + errorMessage + "\n"
-            + self.program[lastNewLine:nextNewLine+1] + "\n"
-            + " " * (columnNumber - 1) + "^\n" 
-        )
+        diagnostic = self.diagnostics.report(errorType, errorMessage, max(pos, 0))
         if self.strictMode:
-            raise Exception(errorOutput)
-        else:
-            print(errorOutput)
-            return lineNumber, columnNumber
+            raise Exception(diagnostic.format(self.diagnostics.lineIndex))
+        if self.diagnostics.prints:
+            print(diagnostic.format(self.diagnostics.lineIndex))
+        return diagnostic.line, diagnostic.column
     
     def _handleErrors(self, c): 
         errorMessage = self._getErrorMessage(c)      
@@ -103,185 +334,16 @@ class Lexer():
             return f"Invalid character '{c}' after '!', did you mean !=?"
         return f"Unexpected character '{c}'"
         
-    def _advanceState(self, c):
-        if self.state == 0:
-            self._lex0(c)
-        elif self.state == 1:
-            self._lex1(c)
-        elif self.state == 2:
-            self._lex2(c)
-        elif self.state == 3:
-            self._lex3(c)
-        elif self.state == 4:
-            self._lex4(c)
-        elif self.state == 5:
-            self._lex5(c)
-        elif self.state == 6:
-            self._lex6(c)
-        elif self.state == 7:
-            self._lex7(c)
-        elif self.state == 8:
-            self._lex8(c)
-        elif self.state == 9:
-            self._lex9(c)
-        elif self.state == 10:
-            self._lex10(c)
-        elif self.state == 11:
-            self._lex11(c)
-        elif self.state == 12:
-            self._lex12(c)
-        elif self.state == 13:
-            self._lex13(c)
-        elif self.state == 14:
-            self._lex14(c)
-    
     def _returnFromFinalState(self, lexeme):
-        if self.state == 15: # ID can be a reserved word or an ID
-            if lexeme in RESERVED_WORDS:
-                return TokenType(lexeme), lexeme
-            else:
-                return TokenType.ID, lexeme
-        elif self.state == 16:
+        state = self.state
+        if state == 15: # ID can be a reserved word or an ID
+            return RESERVED_WORD_TOKENS.get(lexeme, TokenType.ID), lexeme
+        elif state == 16:
             return TokenType.NUM, lexeme
-        elif self.state == 17: # This is SIMPLE_SYMBOL, so using the lexeme we can get the token 
-            return TokenType(lexeme), lexeme
-        elif self.state == 18:
-            return TokenType.OVER, '/'
-        elif self.state == 20:
-            return TokenType.LETH, '<'
-        elif self.state == 21:
-            return TokenType.LETHEQ, '<='
-        elif self.state == 22:
-            return TokenType.BITH, '>'
-        elif self.state == 23:
-            return TokenType.BITHEQ, '>='
-        elif self.state == 24:
-            return TokenType.ASSIGN, "="
-        elif self.state == 25:
-            return TokenType.EQ, "=="
-        elif self.state == 26:
-            return TokenType.NEQ, "!="
-        elif self.state == 27:
-            return TokenType.ENDFILE, "$"
-        elif self.state == 28:
-            return TokenType.ERROR, ""
+        elif state == 17: # This is SIMPLE_SYMBOL, so using the lexeme we can get the token 
+            return SIMPLE_SYMBOL_TOKENS[lexeme], lexeme
+        elif state in FINAL_STATE_TOKENS:
+            return FINAL_STATE_TOKENS[state]
         else:
-            print(self.state)
+            print(state)
             return None, "Error in returning the token from a final state"
-        
-        
-    def _lex0(self, c):
-        if c in LETTER:
-            self.state = 1
-        elif c in NUMBER:
-            self.state = 2
-        elif c in SIMPLE_SYM:
-            self.state = 3
-        elif c == '/':
-            self.state = 4
-        elif c == '<':
-            self.state = 7
-        elif c == '>':
-            self.state = 9
-        elif c == "=":
-            self.state = 11
-        elif c == "!":
-            self.state = 13
-        elif c == "$":
-            self.state = 27
-        elif c not in WHITE_SPACE:
-            self._handleErrors(c)
-            
-    def _lex1(self, c):
-        if c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS:
-            self.state = 15
-        elif c not in LETTER:
-            self._handleErrors(c)
-    
-    def _lex2(self, c):
-        if c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS:
-            self.state = 16
-        elif c not in NUMBER:
-            self._handleErrors(c)
-    
-    def _lex3(self, c):
-        if c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS or c in LETTER or c in NUMBER:
-            self.state = 17
-        else:
-            self._handleErrors(c)
-    
-    def _lex4(self, c):
-        if c == "*":
-            self.state = 5
-        elif c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS or c in LETTER or c in NUMBER:
-            self.state = 18
-        else:
-            self._handleErrors(c)
-    
-    def _lex5(self, c):
-        if c == '*':
-            self.state = 6
-        elif c == '$':
-            self.state = 27
-    
-    def _lex6(self, c):
-        if c == '/':
-            self.state = 19
-        elif c == '$':
-            self.state = 27
-        else:
-            self.state = 5
-    
-    def _lex7(self, c):
-        if c == '=':
-            self.state = 8
-        elif c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS or c in LETTER or c in NUMBER:
-            self.state = 20
-        else:
-            self._handleErrors(c)
-    
-    def _lex8(self, c):
-        if c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS or c in LETTER or c in NUMBER:
-            self.state = 21
-        else:
-            self._handleErrors(c)
-
-    def _lex9(self, c):
-        if c == '=':
-            self.state = 10
-        elif c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS or c in LETTER or c in NUMBER:
-            self.state = 22
-        else:
-            self._handleErrors(c)
-    
-    def _lex10(self, c):
-        if c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS or c in LETTER or c in NUMBER:
-            self.state = 23
-        else:
-            self._handleErrors(c)
-
-    def _lex11(self, c):
-        if c == '=':
-            self.state = 12
-        elif c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS or c in LETTER or c in NUMBER:
-            self.state = 24
-        else:
-            self._handleErrors(c)
-
-    def _lex12(self, c):
-        if c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS or c in LETTER or c in NUMBER:
-            self.state = 25
-        else:
-            self._handleErrors(c)
-            
-    def _lex13(self, c):
-        if c == '=':
-            self.state = 14
-        else:
-            self._handleErrors(c)
-    
-    def _lex14(self, c):
-        if c in WHITE_SPACE or c in OPERATORS or c in SPECIAL_SYMBOLS or c in LETTER or c in NUMBER:
-            self.state = 26
-        else:
-            self._handleErrors(c)
@@ -1,8 +1,34 @@
 from compiler.global_types import *
+from compiler.diagnostics import FirstErrorFound, NestingLimitReached
 from .lexer import *
 
+# levels statements can be nested in each other, and expressions in each other, in a program
+MAX_NESTING = 1000
+
+# what a statement is nested in, on the stack of Parser._compoundStmt
+IN_BLOCK = 0
+IN_THEN = 1
+IN_ELSE = 2
+IN_LOOP = 3
+
+# what an expression is nested in, on the stack of Parser._expression
+IN_PARENTHESES = 0
+IN_INDEX = 1
+# the index of an ID an expression starts with, and the arguments of a call it starts with, which can be assigned to
+IN_ID_INDEX = 2
+IN_ARGUMENTS = 3
+IN_ID_ARGUMENTS = 4
+IN_ASSIGNMENT = 5
+
+# steps of Parser._expression
+EXPRESSION_START = 0
+OPERAND_START = 1
+ID_OPERAND = 2
+OPERAND = 3
+EXPRESSION_END = 4
+
 class Parser():
-    def __init__(self, program, strictMode=False):
+    def __init__(self, program, strictMode=False, lexer : Lexer = None, failFast=False, maxNesting=MAX_NESTING):
         self.AST = None
         self.isSyntaxValid = True
         
@@ -10,48 +36,67 @@ class Parser():
         self.tokenPosition = 0 # is added to the node to map it to the program
         
         self.strictMode = strictMode
+        # stops parsing at the first error, or doesn't start after a lexer error, and leaves the AST as None
+        self.failFast = failFast
+        # statements and expressions nested deeper than this are an error, and the parser stops there
+        self.maxNesting = maxNesting
         
         # used to store the first error
         self.lineNumber = 0
         self.columnNumber = 0
         self.firstErrorMessage = ""
         
-        # pasar las variables globales al lexer, y pedir el primer token
-        self.lexer = Lexer(program, strictMode=strictMode)
+        # the program is lexed once, or the lexer of an earlier lexing of the program is reused
+        # the parser walks its tokens by index, self.index is the current token
+        self.lexer = lexer if lexer != None else Lexer(program, strictMode=strictMode, failFast=failFast)
+        self.tokens = self.lexer.tokenize()
+        self.index = -1
         self._getToken()
     
+    @property
+    def lexeme(self):
+        return self.tokens.lexeme(self.index)
+    
     def _getToken(self):
-        self.lastTokenPosition = self.lexer.getPos() - 1
-        self.token, self.lexeme = self.lexer.getToken()
-        self.tokenPosition = self.lexer.getPos() - 1
-        
-        while (self.token == TokenType.ERROR and self.token != TokenType.ENDFILE):
-            self.lastTokenPosition = self.lexer.getPos() - 1
-            self.token, self.lexeme = self.lexer.getToken()
-            self.tokenPosition = self.lexer.getPos() - 1
-            
+        # moves to the next token that's not a lexer error, the end of the file is never passed
+        types = self.tokens.types
+        ends = self.tokens.ends
+        index = self.index
+        
+        while True:
+            self.lastTokenPosition = (ends[index] if index >= 0 else 0) - 1
+            if types[index] != ENDFILE_CODE or index < 0:
+                index += 1
+            if types[index] != ERROR_CODE:
+                break
+        
+        self.index = index
+        self.token = TOKEN_TYPES[types[index]]
+        self.tokenPosition = ends[index] - 1
         
 
     def parse(self, prints=False):
-        self.AST = self._program()
+        if self.failFast and not self.lexer.isSyntaxValid:
+            return None
         
-        if self.token != TokenType.ENDFILE:
-            msg = ">>> Error: Program finished prematurely"
-            if self.strictMode:
-                raise Exception(msg)
-            else:
-                self.isSyntaxValid = False
-                print(msg)
-        if self.isSyntaxValid:
-            if prints:
+        try:
+            self.AST = self._program()
+            
+            if self.token != TokenType.ENDFILE:
+                self._reportError("Program finished prematurely", self.tokenPosition)
+        except (FirstErrorFound, NestingLimitReached):
+            self.AST = None
+            self.lexer.diagnostics.isStopped = True
+        if prints:
+            if self.isSyntaxValid:
                 self.printAST()
-        else:
-            print("\n>>> AST not printed since a syntax error was found")
+            else:
+                print("\n>>> AST not printed since a syntax error was found")
             
         return self.AST
 
     def printErrorLine(self, errorMessage="", pos=None, errorType="Syntax"):
-        self.lexer.printErrorLine(errorMessage, pos, errorType)
+        return self.lexer.printErrorLine(errorMessage, pos, errorType)
         
     def printAST(self, AST : ASTnode = None):
         # do own AST if none is passed
@@ -59,9 +104,14 @@ class Parser():
         self._doPrintAST(AST)
         
     def _doPrintAST(self, AST: ASTnode, indentation=0):
-        if AST != None:
+        # the nodes left to print, with a stack instead of recursion so deep trees can be printed
+        nodes = [(AST, indentation)]
+        while nodes:
+            AST, indentation = nodes.pop()
+            if AST == None: continue
+            
             print("| " * indentation, end='')
-            print(AST.type.value, end='')
+            print(AST.type.name, end='')
             print(": " + AST.label, end='')
             
             if AST.type == NodeTypes.FunDeclaration:
@@ -74,25 +124,14 @@ class Parser():
             else:
                 print("")
             
-            
-            
-            for child in AST.children:
-                self._doPrintAST(child, indentation + 1)
+            nodes.extend((child, indentation + 1) for child in reversed(AST.children))
     
     def _match(self, expectedToken, errorMsg="", ignoreError=False):
-        oldLexeme = self.lexeme
+        oldIndex = self.index
         if expectedToken == self.token:
             self._getToken()
         else:
-            line, col = self.lexer.printErrorLine(errorMsg, self.lastTokenPosition)
-            
-            # store the first error's position
-            if self.isSyntaxValid:
-                self.lineNumber = line
-                self.columnNumber = col
-                self.firstErrorMessage = errorMsg
-            
-            self.isSyntaxValid = False
+            self._reportError(errorMsg, self.lastTokenPosition)
             
             # when we ignore the error, we act as if it was there, and not consume any token to continue parsing from there
             # otherwise, we consume tokens until we find the one we were expecting
@@ -101,13 +140,26 @@ class Parser():
                     self._getToken()
 
                 # we got the token we wanted, we continue parsing from here -> more errors are likely
-                oldLexeme = self.lexeme
+                oldIndex = self.index
                 self._getToken()
             
-        return oldLexeme # This is sometimes used in the AST, e.g. for IDs in var and fun declarations
+        return self.tokens.lexeme(oldIndex) # This is sometimes used in the AST, e.g. for IDs in var and fun declarations
+    
+    def _reportError(self, errorMsg, pos):
+        line, col = self.lexer.printErrorLine(errorMsg, pos)
+        
+        # store the first error's position
+        if self.isSyntaxValid:
+            self.lineNumber = line
+            self.columnNumber = col
+            self.firstErrorMessage = errorMsg
+        
+        self.isSyntaxValid = False
+        if self.failFast:
+            raise FirstErrorFound(errorMsg)
     
     def _program(self):
-        n = ASTnode(type = NodeTypes.Program, pos=self.tokenPosition)
+        n = ASTnode(type = NodeTypes.Program, children=[], pos=self.tokenPosition)
         
         n.children.append(self._declaration())
         
@@ -143,7 +195,9 @@ class Parser():
         if (self.token == TokenType.LBRA):
             self._match(TokenType.LBRA)
             num = self._match(TokenType.NUM, "Expected number to define array size")
-            n.arraySize = int(num)
+            # when recovering from a missing number, the token we stopped at may be the end of the file
+            if num.isdigit():
+                n.arraySize = int(num)
             self._match(TokenType.RBRA, "Expected ']' in array size declaration", True)
             
         
@@ -153,7 +207,7 @@ class Parser():
     
     def _funDeclaration(self, idLexeme, returnType : Types):
         # A fun declaration node has an ID child, a return type child, can have param children, and a funBody child
-        n = ASTnode(type = NodeTypes.FunDeclaration, label=idLexeme, pos=self.tokenPosition)
+        n = ASTnode(type = NodeTypes.FunDeclaration, label=idLexeme, children=[], pos=self.tokenPosition)
         n.returnType = returnType
         
         # add param children
@@ -193,7 +247,75 @@ class Parser():
         return ASTnode(type = NodeTypes.Param, label=idLexeme, isArrayParam=isArray, pos=self.tokenPosition)
     
     def _compoundStmt(self):
-        n = ASTnode(type = NodeTypes.CompoundStmt, pos=self.tokenPosition)
+        # statements are nested in blocks, ifs and whiles, which are kept in a stack instead of parsed by recursion
+        # each one is kept as the kind of statement and its node, until the statements in it are parsed
+        stack = []
+        self._openBlock(stack)
+        
+        # the statement just parsed, and given to the one it's nested in, None for an empty one
+        statement = None
+        isStatementParsed = True
+        
+        while True:
+            if not isStatementParsed:
+                if self.token in EXPRESSION_STMT_STARTERS:
+                    if self.token == TokenType.SEMICOLON: # if it's a semicolon, it's an empty statement, we don't want it as a child
+                        self._match(TokenType.SEMICOLON)
+                        statement = None
+                    else:
+                        statement = self._expressionStmt()
+                elif self.token == TokenType.LKEY:
+                    # the block is given its statements while it's on the stack
+                    self._openBlock(stack)
+                    statement = None
+                elif self.token == TokenType.IF:
+                    self._nest(stack, (IN_THEN, self._selectionStmt()))
+                    continue
+                elif self.token == TokenType.WHILE:
+                    self._nest(stack, (IN_LOOP, self._iterationStmt()))
+                    continue
+                else: # token should be return
+                    statement = self._returnStmt()
+                
+                isStatementParsed = True
+                continue
+            
+            # the statement goes to the one it's nested in, which can take another one or be finished
+            kind, n = stack[-1]
+            if kind == IN_BLOCK:
+                if statement != None:
+                    n.children.append(statement)
+                
+                if self.token in STATEMENT_STARTERS:
+                    isStatementParsed = False
+                    continue
+                
+                self._match(TokenType.RKEY, "Expected '}' to close compound statement", True)
+            elif kind == IN_THEN:
+                if statement != None:
+                    n.children.append(ASTnode(type=NodeTypes.Then, children=[statement], pos=self.tokenPosition))
+                
+                # optional else
+                if self.token == TokenType.ELSE:
+                    self._match(TokenType.ELSE)
+                    stack[-1] = (IN_ELSE, n)
+                    isStatementParsed = False
+                    continue
+            elif kind == IN_ELSE:
+                if statement != None:
+                    n.children.append(ASTnode(type=NodeTypes.Else, children=[statement], pos=self.tokenPosition))
+            else:
+                if statement != None:
+                    n.children.append(ASTnode(type=NodeTypes.Then, children=[statement], pos=self.tokenPosition))
+            
+            stack.pop()
+            if not stack:
+                return n
+            statement = n
+    
+    def _openBlock(self, stack):
+        n = ASTnode(type = NodeTypes.CompoundStmt, children=[], pos=self.tokenPosition)
+        self._nest(stack, (IN_BLOCK, n))
         
         self._match(TokenType.LKEY, "Expected '{' for function body", True)
         
@@ -202,33 +324,13 @@ class Parser():
             self._match(TokenType.INT)
             idLexeme = self._match(TokenType.ID, "Expected ID in variable declaration")
             n.children.append(self._varDeclaration(idLexeme=idLexeme))
-        
-        # it's a statement
-        while (self.token in STATEMENT_STARTERS):
-            statement = self._statement()
-            if statement == None: continue
-            
-            n.children.append(statement)
-
-        self._match(TokenType.RKEY, "Expected '}' to close compound statement", True)
-        return n
     
-    def _statement(self): # can return none since we do not want empty statements
-        if self.token in EXPRESSION_STMT_STARTERS:
-            if self.token == TokenType.SEMICOLON: # if it's a semicolon, it's an empty statement, we don't want it as a child
-                self._match(TokenType.SEMICOLON)
-                return None
-            n = self._expressionStmt()
-        elif self.token == TokenType.LKEY:
-            n = self._compoundStmt()
-        elif self.token == TokenType.IF:
-            n = self._selectionStmt()
-        elif self.token == TokenType.WHILE:
-            n = self._iterationStmt()
-        else: # token should be return
-            n = self._returnStmt()
-        
-        return n
+    def _nest(self, stack, frame):
+        # pushes a statement or an expression in the one it's nested in, if it's not past the nesting limit
+        if len(stack) >= self.maxNesting:
+            self._reportError(f"Too deeply nested, the limit is {self.maxNesting} levels", self.tokenPosition)
+            raise NestingLimitReached()
+        stack.append(frame)
     
     def _expressionStmt(self):
         n = self._expression()
@@ -236,7 +338,8 @@ class Parser():
         return n
     
     def _selectionStmt(self):
-        n = ASTnode(type=NodeTypes.Selection, pos=self.tokenPosition)
+        # the then and the else of the if are added by _compoundStmt
+        n = ASTnode(type=NodeTypes.Selection, children=[], pos=self.tokenPosition)
         
         self._match(TokenType.IF)
         self._match(TokenType.LPAR, "Expected '(' to define the condition of the if statement", True)
@@ -245,22 +348,11 @@ class Parser():
         n.children.append(ASTnode(type=NodeTypes.Condition, children=[self._expression()], pos=self.tokenPosition))
         self._match(TokenType.RPAR, "Expected ')' to close the condition", True)
         
-        # the then of the if is a statement
-        then = self._statement()
-        if then != None:
-            n.children.append(ASTnode(type=NodeTypes.Then, children=[then], pos=self.tokenPosition))
-            
-        # optional else
-        if self.token == TokenType.ELSE:
-            self._match(TokenType.ELSE)
-            else_ = self._statement()
-            if else_ != None:
-                n.children.append(ASTnode(type=NodeTypes.Else, children=[else_], pos=self.tokenPosition))
-        
         return n
     
     def _iterationStmt(self):
-        n = ASTnode(type=NodeTypes.Iteration, pos=self.tokenPosition)
+        # the then of the while is added by _compoundStmt
+        n = ASTnode(type=NodeTypes.Iteration, children=[], pos=self.tokenPosition)
         
         self._match(TokenType.WHILE)
         self._match(TokenType.LPAR, "Expected '(' to define cycle condition", True)
@@ -269,15 +361,10 @@ class Parser():
         n.children.append(ASTnode(type=NodeTypes.Condition, children=[self._expression()], pos=self.tokenPosition))
         self._match(TokenType.RPAR, "Expected ')' after cycle condition", True)
         
-        # the then of the while is a statement
-        then = self._statement()
-        if then != None:
-            n.children.append(ASTnode(type=NodeTypes.Then, children=[then], pos=self.tokenPosition))
-        
         return n
     
     def _returnStmt(self):
-        n = ASTnode(type=NodeTypes.Return, pos=self.tokenPosition)
+        n = ASTnode(type=NodeTypes.Return, children=[], pos=self.tokenPosition)
         
         self._match(TokenType.RETURN)
         
@@ -288,151 +375,156 @@ class Parser():
         return n
     
     def _expression(self):
-        if self.token == TokenType.ID:
-            idLexeme = self._match(TokenType.ID)
-            n = self._idExpression(idLexeme)
-        else:
-            n = self._simpleExpression()
-        return n
-    
-    def _idExpression(self, idLexeme):
-        # check if it's a call
-        if self.token == TokenType.LPAR: # it's a function call
-            self._match(TokenType.LPAR)
-            
-            v = ASTnode(type=NodeTypes.Call, label=idLexeme, pos=self.tokenPosition)
-            v.children = self._args()
-            
-            self._match(TokenType.RPAR, "Expected ')' to close function call", True)
-            
-            n = self._idSimpleExpression(v)
-        else:
-            # check if the id has an index
-            index = None
-            if self.token == TokenType.LBRA:
-                self._match(TokenType.LBRA)
-                index = ASTnode(type=NodeTypes.Index, children=[self._expression()], pos=self.tokenPosition)
-                self._match(TokenType.RBRA, "Expected ']' after variable indexing", True)
-            
-            v = ASTnode(type=NodeTypes.ID, label=idLexeme, children=[] if index == None else [index], pos=self.tokenPosition)
-            v.isIdIndexed = index != None
-            
-            n = self._idSimpleExpression(v)
-            
-        return n
-    
-    def _idSimpleExpression(self, idNode):
-        if self.token == TokenType.ASSIGN:
-            self._match(TokenType.ASSIGN)
-            
-            n = ASTnode(NodeTypes.Assignment, children=[
-                idNode,
-                self._expression()
-            ], pos=self.tokenPosition)
-        else:
-            n = self._simpleExpression(idNode)
-        
-        return n
-
-    def _args(self):
-        # arguments can be empty
-        args = []
-        if self.token in EXPRESSION_STARTERS:
-            args = [self._expression()]
-            
-            while self.token == TokenType.COMMA:
-                self._match(TokenType.COMMA)
-                args.append(self._expression())
-        
-        return args
-
-    def _simpleExpression(self, idNode=None):
-        first = self._additiveExpression(idNode)
-        
-        if self.token in RELOP:
-            op = self._match(self.token) # we just care to advance the token and get the lexeme of operations
-            n = ASTnode(type=NodeTypes.BinaryOp, label=op, pos=self.tokenPosition)
-            second = self._additiveExpression()
+        # expressions are nested in parentheses, indexes, arguments and assignments, which are kept in a stack instead
+        # of parsed by recursion, with the operations of the expression they're in that wait for their right operand
+        stack = []
+        
+        # the multiplication, addition and comparison waiting for their right operand
+        term = additive = relation = None
+        
+        n = None
+        step = EXPRESSION_START
+        
+        while True:
+            if step == EXPRESSION_START:
+                # an expression starting with an ID can be an assignment, or a call or an ID used in operations
+                if self.token != TokenType.ID:
+                    step = OPERAND_START
+                    continue
+                
+                idLexeme = self._match(TokenType.ID)
+                if self.token == TokenType.LPAR: # it's a function call
+                    self._match(TokenType.LPAR)
+                    n = ASTnode(type=NodeTypes.Call, label=idLexeme, pos=self.tokenPosition)
+                    frame = (IN_ID_ARGUMENTS, n, [])
+                elif self.token == TokenType.LBRA: # the id has an index
+                    self._match(TokenType.LBRA)
+                    frame = (IN_ID_INDEX, ASTnode(type=NodeTypes.ID, label=idLexeme), None)
+                else:
+                    n = ASTnode(type=NodeTypes.ID, label=idLexeme, pos=self.tokenPosition)
+                    step = ID_OPERAND
+                    continue
             
-            n.children = [first, second]
-            return n
-        
-        return first
-    
-    def _additiveExpression(self, idNode=None):
-        first = self._term(idNode)
-        
-        if self.token not in [TokenType.PLUS, TokenType.MINUS]: return first
-        
-        # build the head of the chain of operations
-        op = self._match(self.token) # we just care to advance the token and get the lexeme of operations
-        curr = ASTnode(type=NodeTypes.BinaryOp, label=op, pos=self.tokenPosition) # curr is used to traverse and create this subtree
-        second = self._term()
-        
-        curr.children = [first, second]
-        
-        while self.token in [TokenType.PLUS, TokenType.MINUS]:
-            op = self._match(self.token) # we just care to advance the token and get the lexeme of operations
-            new = ASTnode(type=NodeTypes.BinaryOp, label=op, pos=self.tokenPosition)
-            second = self._term()
+            elif step == OPERAND_START:
+                if self.token == TokenType.LPAR:
+                    self._match(TokenType.LPAR)
+                    frame = (IN_PARENTHESES, None, None)
+                elif self.token == TokenType.NUM:
+                    num = self._match(TokenType.NUM)
+                    n = ASTnode(type=NodeTypes.NUM, label=num, pos=self.tokenPosition)
+                    step = OPERAND
+                    continue
+                else:
+                    idLexeme = self._match(TokenType.ID, "Unexpected token in expression, expected ID")
+                    
+                    if self.token == TokenType.LPAR:
+                        self._match(TokenType.LPAR)
+                        n = ASTnode(type=NodeTypes.Call, label=idLexeme, pos=self.tokenPosition)
+                        frame = (IN_ARGUMENTS, n, [])
+                    else:
+                        n = ASTnode(type=NodeTypes.ID, label=idLexeme, pos=self.tokenPosition)
+                        
+                        # check if the var is indexed
+                        if self.token != TokenType.LBRA:
+                            step = OPERAND
+                            continue
+                        self._match(TokenType.LBRA)
+                        frame = (IN_INDEX, n, None)
             
-            new.children = [curr, second]
-            curr = new
-        
-        return curr
-
-    
-    def _term(self, idNode=None):
-        first = self._factor(idNode)
-        
-        if self.token not in [TokenType.TIMES, TokenType.OVER]: return first
-        
-        # build the head of the chain of operations
-        op = self._match(self.token) # we just care to advance the token and get the lexeme of operations
-        curr = ASTnode(type=NodeTypes.BinaryOp, label=op, pos=self.tokenPosition) # curr is used to traverse and create this subtree
-        second = self._factor()
-        
-        curr.children = [first, second]
-        
-        while self.token in [TokenType.TIMES, TokenType.OVER]:
-            op = self._match(self.token) # we just care to advance the token and get the lexeme of operations
-            new = ASTnode(type=NodeTypes.BinaryOp, label=op, pos=self.tokenPosition)
-            second = self._factor()
+            elif step == ID_OPERAND:
+                if self.token != TokenType.ASSIGN:
+                    step = OPERAND
+                    continue
+                
+                self._match(TokenType.ASSIGN)
+                frame = (IN_ASSIGNMENT, n, None)
             
-            new.children = [curr, second]
-            curr = new
-        
-        return curr
-    
-    def _factor(self, idNode=None):
-        if idNode: return idNode
-        
-        if self.token == TokenType.LPAR:
-            self._match(TokenType.LPAR)
-            n = self._expression()
-            self._match(TokenType.RPAR, "Missing ')' to match opening parenthesis in expression", True)
-            return n
-        elif self.token == TokenType.NUM:
-            num = self._match(TokenType.NUM)
-            n = ASTnode(type=NodeTypes.NUM, label=num, pos=self.tokenPosition)
-        else:
-            idLexeme = self._match(TokenType.ID, "Unexpected token in expression, expected ID")
+            elif step == OPERAND:
+                # the operand is given to the operations waiting for it, from the one with the highest precedence,
+                # and each one is the left operand of the next operation of the same precedence, if there's one
+                if term != None:
+                    term.children[1] = n
+                    n, term = term, None
+                if self.token in MULOP:
+                    term = self._operation(n)
+                    step = OPERAND_START
+                    continue
+                
+                if additive != None:
+                    additive.children[1] = n
+                    n, additive = additive, None
+                if self.token in ADDOP:
+                    additive = self._operation(n)
+                    step = OPERAND_START
+                    continue
+                
+                # there's at most one comparison in an expression
+                if relation != None:
+                    relation.children[1] = n
+                    n, relation = relation, None
+                elif self.token in RELOP:
+                    relation = self._operation(n)
+                    step = OPERAND_START
+                    continue
+                
+                step = EXPRESSION_END
+                continue
             
-            if self.token == TokenType.LPAR:
-                self._match(TokenType.LPAR)
-                n = ASTnode(type=NodeTypes.Call, label=idLexeme, pos=self.tokenPosition)
-                n.children = self._args()
-                self._match(TokenType.RPAR, "Expected ')' to close function call", True)
             else:
-                n = ASTnode(type=NodeTypes.ID, label=idLexeme, pos=self.tokenPosition)
+                # the expression is finished, and goes back to the one it's nested in
+                if not stack:
+                    return n
                 
-                # check if the var is indexed
-                if (self.token == TokenType.LBRA):
-                    self._match(TokenType.LBRA)
-                    index = ASTnode(type=NodeTypes.Index, children=[self._expression()], pos=self.tokenPosition)
+                kind, parent, args, term, additive, relation = stack.pop()
+                if kind == IN_PARENTHESES:
+                    self._match(TokenType.RPAR, "Missing ')' to match opening parenthesis in expression", True)
+                    step = OPERAND
+                    continue
+                
+                elif kind == IN_INDEX or kind == IN_ID_INDEX:
+                    index = ASTnode(type=NodeTypes.Index, children=[n], pos=self.tokenPosition)
                     self._match(TokenType.RBRA, "Expected ']' after variable indexing", True)
+                    
+                    parent.children = [index]
+                    parent.isIdIndexed = True
+                    n = parent
+                    if kind == IN_INDEX:
+                        step = OPERAND
+                        continue
+                    
+                    # an ID an expression starts with is at the end of its index
+                    n.pos = self.tokenPosition
+                    step = ID_OPERAND
+                    continue
+                
+                elif kind == IN_ASSIGNMENT:
+                    n = ASTnode(NodeTypes.Assignment, children=[parent, n], pos=self.tokenPosition)
+                    continue
                 
-                    n.children = [index]
-                    n.isIdIndexed = True
+                # arguments of a call
+                args.append(n)
+                if self.token == TokenType.COMMA:
+                    self._match(TokenType.COMMA)
+                    frame = (kind, parent, args)
+                else:
+                    parent.children = args
+                    self._match(TokenType.RPAR, "Expected ')' to close function call", True)
+                    n = parent
+                    step = ID_OPERAND if kind == IN_ID_ARGUMENTS else OPERAND
+                    continue
+            
+            # arguments can be empty
+            if frame[0] in (IN_ARGUMENTS, IN_ID_ARGUMENTS) and not frame[2] and self.token not in EXPRESSION_STARTERS:
+                self._match(TokenType.RPAR, "Expected ')' to close function call", True)
+                step = ID_OPERAND if frame[0] == IN_ID_ARGUMENTS else OPERAND
+                continue
             
-        return n
\ No newline at end of file
+            # the nested expression is parsed next, the operations of this one wait on the stack
+            self._nest(stack, (*frame, term, additive, relation))
+            term = additive = relation = None
+            step = EXPRESSION_START
+    
+    def _operation(self, left):
+        op = self._match(self.token) # we just care to advance the token and get the lexeme of operations
+        # the right operand is set once it's parsed
+        return ASTnode(type=NodeTypes.BinaryOp, label=op, children=[left, None], pos=self.tokenPosition)
@@ -3,6 +3,11 @@ from compiler.global_types import *
 class SymbolTable():
     def __init__(self):
         self.table : list[dict[str, Symbol]] = list()
+        
+        # the scopes each label is declared in, the innermost last, so a symbol is found without looking in every scope
+        self.labelScopes : dict[str, list[int]] = dict()
+        # the size in the stack of the scopes before each one, and of all of them at the end
+        self.scopeStarts : list[int] = [0]
     
     # from a program or function node, it fills the symbol table with the values from that scope 
     def fill(self, node : ASTnode):
@@ -40,28 +45,31 @@ class SymbolTable():
                 
                 
         # add the current scope to the type environment
+        for label in scopeTypes:
+            self.labelScopes.setdefault(label, []).append(len(self.table))
         self.table.append(scopeTypes)
+        self.scopeStarts.append(self.scopeStarts[-1] + (len(scopeTypes) + 2) * 4)
         
         return self.table
     
     def getSymbol(self, label : str):
-        # iterate backwards to respect scope rules
-        for scope in self.table[::-1]:
-            if label in scope:
-                return scope[label]
+        # the innermost scope it's declared in, to respect scope rules
+        scopes = self.labelScopes.get(label)
+        if scopes:
+            return self.table[scopes[-1]][label]
         
         return None
     
     def getType(self, label : str):
-        # iterate backwards to respect scope rules
-        for scope in self.table[::-1]:
-            if label in scope:
-                return scope[label].type
-        
-        return None
+        symbol = self.getSymbol(label)
+        return symbol.type if symbol != None else None
     
     def pop(self):
-        return self.table.pop()
+        scope = self.table.pop()
+        self.scopeStarts.pop()
+        for label in scope:
+            self.labelScopes[label].pop()
+        return scope
     
     def getFunParamTypes(self, label : str):
         if label in self.table[0]:
@@ -96,21 +104,16 @@ class SymbolTable():
     
     
     def getScopeOffset(self, label : str):
-        scopeOffset = 0
-        for scope in self.table[::-1]:
-            if label in scope:
-                break
-            scopeOffset += (len(scope) + 2) * 4
-        
-        return scopeOffset
+        # the size of the scopes after the one the label is declared in, or of all of them if it's not declared
+        scopes = self.labelScopes.get(label)
+        start = self.scopeStarts[scopes[-1] + 1] if scopes else 0
+        return self.scopeStarts[-1] - start
     
     def getControlStatementOffset(self):
-        offset = 0
-        for i in reversed(range(len(self.table))):
-            if i <= 1:
-                return offset
-            
-            offset += (len(self.table[i]) + 2) * 4
+        # the size of the scopes after the global one and the one of the function
+        if len(self.table) == 0:
+            return None
+        return self.scopeStarts[-1] - self.scopeStarts[min(len(self.table), 2)]
     
     def getCurrentScope(self):
         return list(self.table[-1].values())
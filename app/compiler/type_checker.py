@@ -1,23 +1,37 @@
 from compiler.global_types import *
+from compiler.diagnostics import FirstErrorFound
 from .parser import *
 from compiler.symbol_table import SymbolTable
 
 class TypeChecker():
-    def __init__(self, program="", AST=None, strictMode=False):
+    def __init__(self, program="", AST=None, strictMode=False, parser : Parser = None, failFast=False):
         self.st = SymbolTable()
         self.isTypingValid = True
         
         self.strictMode = strictMode
+        # stops checking at the first error
+        self.failFast = failFast
         
-        self.parser = Parser(program, strictMode)
+        # the parser that built the AST can be passed, so the program isn't lexed again to print errors
+        self.parser = parser if parser != None else Parser(program, strictMode, failFast=failFast)
         self.firstErrorMessage = ""
+        self.errorLine = 0
+        self.errorColumn = 0
         
         self.AST = self.parser.parse(False) if AST == None else AST
         
         
     def checkTyping(self, prints=False):
+        # when failing fast, programs with syntax errors have no AST, and they're not checked
+        if self.failFast and self.AST == None:
+            self.isTypingValid = None
+            return None
+        
         # do DFS to traverse the tree, being careful to build the symbolTable for the scope
-        self._doCheckTyping(self.AST)
+        try:
+            self._doCheckTyping(self.AST)
+        except FirstErrorFound:
+            self.parser.lexer.diagnostics.isStopped = True
         
         if prints:
             print("Typing is valid" if self.isTypingValid else "Typing is NOT valid")
@@ -28,6 +42,35 @@ class TypeChecker():
         self.parser.printAST()
 
     def _doCheckTyping(self, node : ASTnode, funLabel : str = None):
+        # walks the tree with a stack of the checks in progress instead of recursion, each check is a generator that
+        # yields the children it needs the type of, with the function they're in, and is sent their type back
+        checks = []
+        check = self._checkNode(node, funLabel)
+        nodeType = None
+        
+        while True:
+            try:
+                child, label = check.send(nodeType)
+            except StopIteration as stop:
+                if not checks:
+                    return stop.value
+                check = checks.pop()
+                nodeType = stop.value
+                continue
+            
+            if not self.isTypingValid or child == None:
+                nodeType = None
+            # the leaves without children are checked right away
+            elif child.type == NodeTypes.NUM:
+                nodeType = Types.Int
+            elif child.type == NodeTypes.ID and not child.isIdIndexed:
+                nodeType = self._idType(child)
+            else:
+                checks.append(check)
+                check = self._checkNode(child, label)
+                nodeType = None
+    
+    def _checkNode(self, node : ASTnode, funLabel : str = None):
         if not self.isTypingValid or node == None: return None
         
         # check if it's a node we should have the type for in the environment
@@ -35,15 +78,13 @@ class TypeChecker():
             return Types.Int
         
         elif node.type == NodeTypes.ID:
-            idType = self.st.getType(node.label)
+            idType = self._idType(node)
             
             if idType == None:
-                self._printErrorLine("Undeclared ID: " + node.label, node.pos, "Semantic")
-                self.isTypingValid = False
                 return None
             
             if node.isIdIndexed:
-                if idType != Types.Array or len(node.children) == 0 or self._doCheckTyping(node.children[0], funLabel) != Types.Int:
+                if idType != Types.Array or len(node.children) == 0 or (yield node.children[0], funLabel) != Types.Int:
                     self.isTypingValid = False
                     
                     if idType != Types.Array:
@@ -83,7 +124,7 @@ class TypeChecker():
                 return None
             
             for i in range(len(node.children)):
-                argType = self._doCheckTyping(node.children[i], funLabel)
+                argType = (yield node.children[i], funLabel)
                 
                 if argType == None:
                     self._printErrorLine(f"Undeclared identifier {node.children[i].label}")
@@ -109,14 +150,14 @@ class TypeChecker():
                 node = next(child for child in node.children if child.type == NodeTypes.CompoundStmt)
 
             for child in node.children:
-                self._doCheckTyping(child, funLabel=label)
+                yield child, label
                 
             self.st.pop()
             return None
             
         # check if it's a node we need to check the type for
         elif node.type == NodeTypes.Return:
-            returnType = Types.Void if len(node.children) == 0 else self._doCheckTyping(node.children[0], funLabel)
+            returnType = Types.Void if len(node.children) == 0 else (yield node.children[0], funLabel)
             
             if returnType != self.st.getType(funLabel):
                 self._printErrorLine("Return value of wrong type, expected " + str(self.st.getType(funLabel).value), node.pos, "Semantic")
@@ -125,7 +166,7 @@ class TypeChecker():
             return returnType
         
         elif node.type == NodeTypes.Index:
-            indexType = self._doCheckTyping(node.children[0], funLabel)
+            indexType = (yield node.children[0], funLabel)
             
             if indexType != Types.Int:
                 # no need to add error handling here since index happens after ID and ID handles the error
@@ -134,8 +175,8 @@ class TypeChecker():
             return indexType
         
         elif node.type == NodeTypes.BinaryOp:
-            type1 = self._doCheckTyping(node.children[0], funLabel)
-            type2 = self._doCheckTyping(node.children[1], funLabel)
+            type1 = (yield node.children[0], funLabel)
+            type2 = (yield node.children[1], funLabel)
             
             if not self.isTypingValid:
                 return Types.Int
@@ -151,8 +192,8 @@ class TypeChecker():
             return Types.Int
         
         elif node.type == NodeTypes.Assignment:
-            leftType = self._doCheckTyping(node.children[0], funLabel)
-            rightType = self._doCheckTyping(node.children[1], funLabel)
+            leftType = (yield node.children[0], funLabel)
+            rightType = (yield node.children[1], funLabel)
             
             if not self.isTypingValid:
                 return rightType
@@ -166,14 +207,27 @@ class TypeChecker():
         # otherwise we just check children
         else:
             for child in node.children:
-                self._doCheckTyping(child, funLabel)
+                yield child, funLabel
             
             return None
     
+    def _idType(self, node : ASTnode):
+        idType = self.st.getType(node.label)
+        
+        if idType == None:
+            self._printErrorLine("Undeclared ID: " + node.label, node.pos, "Semantic")
+            self.isTypingValid = False
+        
+        return idType
+    
     def _printErrorLine(self, errorMessage="", pos_=None, errorType="Semantic"):
+        line, column = self.parser.printErrorLine(errorMessage, pos_, errorType)
         if self.isTypingValid:
             self.firstErrorMessage = errorMessage
+            self.errorLine = line
+            self.errorColumn = column
         
         self.isTypingValid = False
-        self.parser.printErrorLine(errorMessage, pos_, errorType)
+        if self.failFast:
+            raise FirstErrorFound(errorMessage)
         return None
\ No newline at end of file
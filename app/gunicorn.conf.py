@@ -0,0 +1,77 @@
+import gc
+import os
+import tempfile
+from dotenv import load_dotenv
+
+"""
+Production serving with gunicorn: gunicorn --config gunicorn.conf.py app:app
+
+The app and the compiler are imported and warmed up once in the master process, before the workers are forked,
+so the workers share those pages copy-on-write instead of each loading them. Workers are replaced gracefully
+after a number of requests, finishing the requests they are serving first.
+
+Jobs from /jobs run in the worker that received them, and are shared with the other workers through a SQLite file
+(JOB_STORE, a new temporary file by default), so they can be polled through any worker. The documents of
+/checkSyntax sessions are shared the same way (CHECK_SESSION_STORE), so they can be edited through any worker.
+The compile cache, the run queue and the metrics are kept by each worker: /metrics labels its samples with the pid of
+the worker, and /cacheStats and /queueStats give the stats of the worker that answers.
+
+Like the development server, it serves HTTPS: with SSL_CERT_FILE and SSL_KEY_FILE if they're set, otherwise with a
+self-signed certificate generated at startup. SSL=false serves plain HTTP, e.g. behind a proxy that terminates TLS.
+"""
+
+load_dotenv()
+
+PORT = int(os.getenv('PORT', 3001))
+WORKERS = int(os.getenv('WORKERS', os.cpu_count() or 2))
+THREADS = int(os.getenv('THREADS', 8))
+WORKER_MAX_REQUESTS = int(os.getenv('WORKER_MAX_REQUESTS', 1000))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv('WORKER_MAX_REQUESTS_JITTER', 100))
+# time for a worker to finish its requests when it's recycled or stopped, before it's killed
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+SSL = os.getenv('SSL', 'true').lower() == 'true'
+SSL_CERT_FILE = os.getenv('SSL_CERT_FILE', '')
+SSL_KEY_FILE = os.getenv('SSL_KEY_FILE', '')
+
+# the app splits its limits between the workers, so MAX_RUNNING_PROGRAMS stays a cap for the whole server
+os.environ['SERVER_PROCESSES'] = str(WORKERS)
+
+# the workers share their jobs through this file
+if WORKERS > 1 and not os.getenv('JOB_STORE'):
+    os.environ['JOB_STORE'] = os.path.join(tempfile.mkdtemp(prefix="jobs_"), "jobs.sqlite3")
+# and their /checkSyntax sessions through this one
+if WORKERS > 1 and not os.getenv('CHECK_SESSION_STORE'):
+    os.environ['CHECK_SESSION_STORE'] = os.path.join(tempfile.mkdtemp(prefix="sessions_"), "sessions.sqlite3")
+
+bind = f"0.0.0.0:{PORT}"
+workers = WORKERS
+threads = THREADS
+worker_class = "gthread"
+preload_app = True
+max_requests = WORKER_MAX_REQUESTS
+max_requests_jitter = WORKER_MAX_REQUESTS_JITTER
+graceful_timeout = GRACEFUL_TIMEOUT
+# requests that stream test case results can last longer than a single program
+timeout = 120
+
+if SSL and SSL_CERT_FILE and SSL_KEY_FILE:
+    certfile = SSL_CERT_FILE
+    keyfile = SSL_KEY_FILE
+elif SSL:
+    # same as the adhoc certificate of the development server, but written to files for gunicorn
+    from werkzeug.serving import make_ssl_devcert
+    certfile, keyfile = make_ssl_devcert(os.path.join(tempfile.mkdtemp(prefix="ssl_"), "adhoc"), host="localhost")
+
+def when_ready(server):
+    # runs in the master, after the app is loaded and before the workers are forked
+    from app import warm_up
+    warm_up()
+
+    # objects allocated so far are never collected, so the collector doesn't touch (and copy) their pages
+    gc.freeze()
+
+def worker_exit(server, worker):
+    from app import backend
+    close = getattr(backend, "close", None)
+    if close != None:
+        close()
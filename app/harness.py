@@ -0,0 +1,119 @@
+from compiler.global_types import RESERVED_WORDS
+import hashlib
+import hmac
+import json
+import secrets
+
+"""
+Helpers to build the main function that drives a student's function with the test cases of /performTestCases.
+
+In the per-case mode, a main is created for every test case, and the last output of the program is the result.
+In the batched mode, a single main calls the function once per test case, and every result is followed by a marker
+so the output of a single run can be split back into one result per test case.
+"""
+
+def int_to_letters(n):
+    result = ''
+    while True:
+        result = chr(ord('a') + (n % 26)) + result
+        n = n // 26 - 1
+        if n < 0:
+            break
+    return result
+
+def validate_test_case(test_case):
+    # returns True if all params are ints or lists of ints, the only types C- can receive
+    for param in test_case:
+        if isinstance(param, bool):
+            return False
+        if isinstance(param, list):
+            if not all(isinstance(value, int) and not isinstance(value, bool) for value in param):
+                return False
+        elif not isinstance(param, int):
+            return False
+    return True
+
+def _int_literal(value):
+    # C- has no unary minus, so negative numbers are written as a subtraction
+    return f"0-{str(-value)}" if value < 0 else str(value)
+
+def _declare_params(test_case, names):
+    declarations = ""
+    assignments = ""
+
+    for param, param_ID in zip(test_case, names):
+        # for an int
+        if isinstance(param, int):
+            declarations += f"int {param_ID};\n"
+            assignments += f"{param_ID} = {_int_literal(param)};\n"
+
+        # for an array
+        else:
+            declarations += f"int {param_ID}[{len(param)}];\n"
+            for i, value in enumerate(param):
+                assignments += f"{param_ID}[{i}] = {_int_literal(value)};\n"
+
+    return declarations, assignments
+
+def build_test_main(function_name, test_case):
+    names = [int_to_letters(i) for i in range(len(test_case))]
+    declarations, assignments = _declare_params(test_case, names)
+
+    mainFunction = "void main(void) {\n" + declarations + assignments
+    mainFunction += f"output({function_name}({', '.join(names)}));\n"
+    mainFunction += "}\n"
+    return mainFunction
+
+def _variable_names():
+    # yields unique variable names, skipping the ones that are reserved words in C-
+    n = 0
+    while True:
+        name = int_to_letters(n)
+        n += 1
+        if name not in RESERVED_WORDS:
+            yield name
+
+# secret used to derive the markers, so they can't be predicted by the program being tested
+MARKER_KEY = secrets.token_bytes(32)
+
+def new_marker(program, function_name, test_cases):
+    """
+    Returns a positive number that fits in a register, used to separate the output of each test case.
+    It's derived from the request so resubmissions compile to the same program and hit the compile cache,
+    while the secret key keeps it unpredictable.
+    """
+    message = json.dumps([program, function_name, test_cases]).encode()
+    digest = hmac.new(MARKER_KEY, message, hashlib.sha256).digest()
+    return 100000000 + int.from_bytes(digest[:8], 'big') % (2**31 - 1 - 100000000)
+
+def build_batched_main(function_name, test_cases, marker):
+    names = _variable_names()
+    declarations = ""
+    body = ""
+
+    for test_case in test_cases:
+        caseNames = [next(names) for _ in test_case]
+        caseDeclarations, caseAssignments = _declare_params(test_case, caseNames)
+
+        declarations += caseDeclarations
+        body += caseAssignments
+        body += f"output({function_name}({', '.join(caseNames)}));\n"
+        body += f"output({marker});\n"
+
+    return "void main(void) {\n" + declarations + body + "}\n"
+
+def split_batched_output(outputs, marker):
+    """
+    Splits the outputs of a batched run into the outputs of each test case.
+    Only test cases that reached their marker are returned, since those are the ones known to have finished.
+    """
+    cases = []
+    current = []
+    for value in outputs:
+        if value == marker:
+            cases.append(current)
+            current = []
+        else:
+            current.append(value)
+
+    return cases
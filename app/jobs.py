@@ -0,0 +1,208 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import logging
+import metrics
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+"""
+Background jobs for the heavy endpoints, so HTTP workers don't wait for the programs to run.
+
+Jobs run on a bounded pool of threads, the number of jobs waiting to run is limited, and finished jobs are kept
+for a while so clients can poll for their results.
+
+A job runs in the process that received it. When the server has several worker processes, their jobs are also
+saved in a JobStore shared by all of them, so a job can be polled through any worker.
+"""
+
+logger = logging.getLogger(__name__)
+
+# interval to check the store for changes, when waiting for a job that runs in another process
+STORE_POLL_INTERVAL = 0.1
+
+class QueueFull(Exception):
+    pass
+
+class Job():
+    def __init__(self, kind : str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+
+        # the response the endpoint would have given: the body and the status code
+        self.result = None
+        self.statusCode = None
+
+        self.createdAt = time.time()
+        self.finishedAt = None
+        self.done = threading.Event()
+
+    def wait(self, timeout):
+        return self.done.wait(timeout)
+
+    def toDict(self):
+        return {
+            'id': self.id,
+            'type': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'statusCode': self.statusCode
+        }
+
+class JobStore():
+    # jobs saved in a SQLite database, shared by the processes of the server
+    def __init__(self, path : str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+
+    def save(self, job : Job):
+        with self.lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.kind, job.status, json.dumps(job.result), job.statusCode, job.createdAt, job.finishedAt)
+            )
+
+    def load(self, jobId) -> Job:
+        with self.lock:
+            row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (jobId,)).fetchone()
+        if row == None:
+            return None
+
+        job = Job(row[1])
+        job.id, job.status, job.statusCode, job.createdAt, job.finishedAt = row[0], row[2], row[4], row[5], row[6]
+        job.result = json.loads(row[3])
+        if job.finishedAt != None:
+            job.done.set()
+        return job
+
+    def expire(self, before, maxRetained):
+        with self.lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM jobs WHERE finishedAt < ?", (before,))
+            connection.execute(
+                "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE finishedAt IS NOT NULL ORDER BY finishedAt DESC LIMIT -1 OFFSET ?)",
+                (maxRetained,)
+            )
+
+    def _connect(self):
+        # connections can't be shared with forked processes, so each process opens its own
+        if self.connection == None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs "
+                "(id TEXT PRIMARY KEY, kind TEXT, status TEXT, result TEXT, statusCode INTEGER, createdAt REAL, finishedAt REAL)"
+            )
+            self.pid = os.getpid()
+        return self.connection
+
+class JobQueue():
+    def __init__(self, workers=4, maxPending=1000, retention=600, maxRetained=10000, storePath=""):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.maxPending = maxPending
+        self.retention = retention
+        self.maxRetained = maxRetained
+
+        self.jobs : OrderedDict[str, Job] = OrderedDict()
+        self.pending = 0
+        self.lastExpired = 0
+        self.lock = threading.Lock()
+
+        # without a store, jobs can only be polled through this process
+        self.store = JobStore(storePath) if storePath else None
+
+    def submit(self, kind, function, *args) -> Job:
+        # function returns the body and the status code of the response
+        job = Job(kind)
+
+        with self.lock:
+            self._expire()
+            if self.pending >= self.maxPending:
+                raise QueueFull()
+
+            self.pending += 1
+            self.jobs[job.id] = job
+
+        self._save(job)
+        self.executor.submit(self._run, job, function, args)
+        return job
+
+    def get(self, jobId) -> Job:
+        with self.lock:
+            self._expire()
+            job = self.jobs.get(jobId)
+
+        # the job may have been received by another process
+        if job == None and self.store != None:
+            job = self.store.load(jobId)
+        return job
+
+    def wait(self, job : Job, timeout) -> Job:
+        # returns the job once it's finished or after the timeout, with its latest status
+        if self.store == None or job.id in self.jobs:
+            job.wait(timeout)
+            return job
+
+        deadline = time.monotonic() + timeout
+        while not job.done.is_set() and time.monotonic() < deadline:
+            time.sleep(min(STORE_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+            job = self.store.load(job.id) or job
+        return job
+
+    def stats(self):
+        with self.lock:
+            return {'pending': self.pending, 'retained': len(self.jobs)}
+
+    def _run(self, job : Job, function, args):
+        metrics.endpoint.set(f"job_{job.kind}")
+        job.status = "running"
+        self._save(job)
+        try:
+            job.result, job.statusCode = function(*args)
+            job.status = "done"
+        except Exception as e:
+            job.result, job.statusCode = {'error': 'Error running the job', 'message': str(e)}, 500
+            job.status = "failed"
+        finally:
+            job.finishedAt = time.time()
+            self._save(job)
+            with self.lock:
+                self.pending -= 1
+            job.done.set()
+
+    def _save(self, job : Job):
+        if self.store == None:
+            return
+        try:
+            self.store.save(job)
+        except sqlite3.Error as e:
+            logger.warning("Could not save job %s: %s", job.id, e)
+
+    def _expire(self):
+        now = time.time()
+        if now - self.lastExpired < 1 and len(self.jobs) <= self.maxRetained:
+            return
+        self.lastExpired = now
+
+        for jobId, job in list(self.jobs.items()):
+            if job.finishedAt != None and now - job.finishedAt > self.retention:
+                del self.jobs[jobId]
+
+        # over the limit, the oldest finished jobs are removed first
+        for jobId, job in list(self.jobs.items()):
+            if len(self.jobs) <= self.maxRetained:
+                break
+            if job.finishedAt != None:
+                del self.jobs[jobId]
+
+        if self.store != None:
+            try:
+                self.store.expire(now - self.retention, self.maxRetained)
+            except sqlite3.Error as e:
+                logger.warning("Could not expire jobs: %s", e)
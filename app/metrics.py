@@ -0,0 +1,220 @@
+from contextlib import contextmanager
+import contextvars
+import os
+import subprocess
+import threading
+import time
+
+"""
+Counters, gauges and histograms exposed in the Prometheus text format by the /metrics endpoint.
+
+Stages are timed with the stage() context manager, which labels the observation with the endpoint that is
+being served and the outcome of the stage. The endpoint is kept in a context variable, so work done for a
+request in other threads has to be run with a copy of the request's context.
+
+The stages are also summed for each request in a RequestTimings kept in a context variable, which the app
+writes in the Server-Timing header of the response and in the log of slow requests.
+
+Each worker process of the server has its own metrics, so every sample is labeled with the pid of the worker that
+rendered it, and a scrape only gets the samples of the worker that answered it. Summing by the other labels across
+workers gives the totals of the server, and a recycled worker shows up as new series instead of a counter reset.
+"""
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+endpoint = contextvars.ContextVar("endpoint", default="none")
+requestTimings = contextvars.ContextVar("requestTimings", default=None)
+
+def _formatLabels(names, values):
+    if not names:
+        return ""
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}"
+
+def _withLabel(sample, label):
+    # adds a label to a rendered sample, before its other labels
+    name, separator, rest = sample.partition("{")
+    if separator:
+        return f"{name}{{{label},{rest}"
+    name, _, value = sample.partition(" ")
+    return f"{name}{{{label}}} {value}"
+
+class Metric():
+    kind = ""
+
+    def __init__(self, name, documentation, labelNames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelNames = tuple(labelNames)
+        self.lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self._samples()
+
+    def _samples(self):
+        return []
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelNames=()):
+        super().__init__(name, documentation, labelNames)
+        self.values : dict[tuple, float] = dict()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def _samples(self):
+        with self.lock:
+            return [f"{self.name}{_formatLabels(self.labelNames, labels)} {value}" for labels, value in self.values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value=0):
+        with self.lock:
+            self.values[labels] = value
+
+class CallbackGauge(Metric):
+    # a gauge whose values are read when rendering, from a function returning a dict of label values to values
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelNames, callback):
+        super().__init__(name, documentation, labelNames)
+        self.callback = callback
+
+    def _samples(self):
+        return [f"{self.name}{_formatLabels(self.labelNames, labels)} {value}" for labels, value in self.callback().items()]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelNames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelNames)
+        self.buckets = tuple(buckets)
+        # for each set of labels: the count of each bucket, the sum and the count of observations
+        self.values : dict[tuple, list] = dict()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            if labels not in self.values:
+                self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            bucketCounts, _, _ = entry = self.values[labels]
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucketCounts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, *labels):
+        return self.values[labels][2] if labels in self.values else 0
+
+    def _samples(self):
+        samples = []
+        with self.lock:
+            for labels, (bucketCounts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucketCount in zip(self.buckets, bucketCounts):
+                    cumulative += bucketCount
+                    bucketLabels = _formatLabels(self.labelNames + ("le",), labels + (bound,))
+                    samples.append(f"{self.name}_bucket{bucketLabels} {cumulative}")
+
+                infLabels = _formatLabels(self.labelNames + ("le",), labels + ("+Inf",))
+                samples.append(f"{self.name}_bucket{infLabels} {count}")
+                samples.append(f"{self.name}_sum{_formatLabels(self.labelNames, labels)} {total}")
+                samples.append(f"{self.name}_count{_formatLabels(self.labelNames, labels)} {count}")
+        return samples
+
+class Registry():
+    def __init__(self):
+        self.metrics : list[Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        # the pid is read when rendering, since the workers are forked after the metrics are created
+        label = f'worker="{os.getpid()}"'
+        lines = []
+        for metric in self.metrics:
+            lines.extend(line if line.startswith("#") else _withLabel(line, label) for line in metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "compiler_stage_duration_seconds",
+    "Duration of each stage of compiling and running a program",
+    ["stage", "endpoint", "outcome"]
+))
+REQUESTS = registry.register(Counter("http_requests_total", "Requests served", ["endpoint", "status"]))
+TIMEOUTS = registry.register(Counter("program_timeouts_total", "Programs stopped for running too long", ["endpoint"]))
+SANDBOXES_IN_FLIGHT = registry.register(Gauge("sandboxes_in_flight", "Programs being run at the moment"))
+QUEUE_WAIT_SECONDS = registry.register(Histogram("run_queue_wait_seconds", "Time programs waited to be run", ["endpoint"]))
+REJECTED_RUNS = registry.register(Counter("run_queue_rejected_total", "Programs rejected because the run queue was full", ["endpoint"]))
+
+class RequestTimings():
+    # durations of the stages of a request, summed by stage, as stages can run in several threads at once
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.durations : dict[str, float] = dict()
+
+    def add(self, name, duration):
+        with self.lock:
+            self.durations[name] = self.durations.get(name, 0.0) + duration
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+    def stages(self):
+        with self.lock:
+            return dict(self.durations)
+
+    def serverTiming(self):
+        # the value of the Server-Timing header, with the durations in milliseconds
+        timings = [f"{name};dur={duration * 1000:.3f}" for name, duration in self.stages().items()]
+        timings.append(f"total;dur={self.total() * 1000:.3f}")
+        return ", ".join(timings)
+
+def record(name, duration):
+    # adds a duration to the timings of the request being served, if any
+    timings = requestTimings.get()
+    if timings != None:
+        timings.add(name, duration)
+
+class Stage():
+    def __init__(self, name):
+        self.name = name
+        self.outcome = "ok"
+
+@contextmanager
+def stage(name):
+    # times the block, the outcome can be changed in the block and is "error" if it raises an exception
+    current = Stage(name)
+    start = time.perf_counter()
+    try:
+        yield current
+    except subprocess.TimeoutExpired:
+        current.outcome = "timeout"
+        TIMEOUTS.inc(endpoint.get())
+        raise
+    except BaseException:
+        if current.outcome == "ok":
+            current.outcome = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, name, endpoint.get(), current.outcome)
+        record(name, duration)
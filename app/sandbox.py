@@ -0,0 +1,445 @@
+import logging
+import metrics
+import os
+import queue
+import select
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+"""
+Runs compiled programs with the spim emulator inside a bubblewrap sandbox.
+
+A program can be run with a new sandbox for each run, or by a pool of persistent sandboxed spim processes
+that are driven through spim's interactive mode (reinitialize, load, run). The pool avoids paying the sandbox setup
+and the spim startup on every run, and each worker is replaced after a number of runs, a timeout or a crash.
+
+Where anonymous memory files are supported (Linux), the assembly never touches the disk: it's written to a memfd
+that spim inherits and loads from /proc/self/fd, so no directory has to be created, bound and removed for each run.
+Otherwise it's written to a temporary directory bound into the sandbox.
+
+Both ways return a subprocess.CompletedProcess with the spim output, and raise subprocess.TimeoutExpired on timeouts.
+The output is read as it's written, and spim is stopped as soon as it's over a number of lines or bytes, in which case
+the result has truncated set, so the memory used by a run doesn't depend on how much the program prints.
+"""
+
+logger = logging.getLogger(__name__)
+
+# the assembly reads an input with this syscall, which the pool can't feed since stdin carries the spim commands
+READ_INT_SYSCALL = "li $v0 5\n"
+PROMPT = b"(spim) "
+
+# time for a new worker to be ready to receive commands
+WORKER_STARTUP_TIMEOUT = 10
+
+IN_MEMORY = hasattr(os, "memfd_create")
+
+# limits on the output kept for each run, which includes the spim banner
+MAX_OUTPUT_BYTES = 4 * 1024 * 1024
+MAX_OUTPUT_LINES = 100_000
+
+def sandbox_command(sandbox_dir, command, debug=False):
+    # Create a more restricted sandbox with specific directory bindings
+    commands = [
+        "bwrap",
+        # Bind all necessary system directories
+        "--ro-bind", "/bin", "/bin",
+        "--ro-bind", "/usr", "/usr",
+        "--ro-bind", "/lib", "/lib"
+    ]
+
+    # prod env needs /lib64, but not in debug mode
+    if not debug:
+        logger.debug("Binding /lib64")
+        commands.extend(["--ro-bind", "/lib64", "/lib64"])
+
+    commands += [
+        "--ro-bind", "/etc", "/etc",
+        # Create necessary system directories
+        "--tmpfs", "/tmp",
+        "--ro-bind", "/proc", "/proc",
+        "--ro-bind", "/dev", "/dev",
+        # Security options - only IPC and UTS, no network or user/pid
+        "--unshare-ipc",
+        "--unshare-uts",
+        "--die-with-parent",
+        "--new-session",
+    ]
+
+    # Bind our sandbox directory, programs passed in memory don't need one
+    if sandbox_dir != None:
+        commands += ["--bind", sandbox_dir, sandbox_dir]
+
+    # The actual command
+    return commands + command
+
+def write_assembly(sandbox_dir, assembly):
+    with open(f'{sandbox_dir}/output.s', 'w') as f:
+        f.write(assembly)
+
+def write_memory_file(fd, assembly):
+    # the pool workers reuse their file, so it's truncated first
+    os.ftruncate(fd, 0)
+    data = memoryview(assembly.encode())
+    offset = 0
+    while offset < len(data):
+        offset += os.pwrite(fd, data[offset:], offset)
+
+def memory_file_path(fd):
+    # spim inherits the file with the same descriptor, and opens it through its own /proc entry
+    return f"/proc/self/fd/{fd}"
+
+def hide_path(result, path):
+    # Don't expose internal paths in error messages
+    if result.stderr:
+        result.stderr = result.stderr.replace(path.encode(), b"/sandbox/output.s")
+    return result
+
+class OutputBuffer():
+    # output of a program, up to a number of bytes and lines, which are counted as the output is read
+    def __init__(self, maxBytes=MAX_OUTPUT_BYTES, maxLines=MAX_OUTPUT_LINES):
+        self.maxBytes = maxBytes
+        self.maxLines = maxLines
+        self.data = bytearray()
+        self.lines = 0
+        self.truncated = False
+
+    def write(self, chunk):
+        # returns False once the output is over the limits, the part of the chunk over them is dropped
+        if self.truncated:
+            return False
+
+        lines = chunk.count(b"\n")
+        if self.lines + lines > self.maxLines:
+            end = -1
+            for _ in range(self.maxLines - self.lines):
+                end = chunk.find(b"\n", end + 1)
+            chunk = chunk[:end + 1]
+            lines = self.maxLines - self.lines
+            self.truncated = True
+
+        if len(self.data) + len(chunk) > self.maxBytes:
+            chunk = chunk[:self.maxBytes - len(self.data)]
+            lines = chunk.count(b"\n")
+            self.truncated = True
+
+        self.data += chunk
+        self.lines += lines
+        return not self.truncated
+
+    def getvalue(self):
+        return bytes(self.data)
+
+def run_bounded(command, input_data, timeout, stdout : OutputBuffer, pass_fds=()):
+    # like subprocess.run with capture_output, but the process is killed as soon as its output is over the limits
+    stderr = OutputBuffer(stdout.maxBytes, stdout.maxLines)
+    deadline = time.monotonic() + timeout
+
+    with subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=pass_fds) as process:
+        try:
+            readers = {process.stdout.fileno(): stdout, process.stderr.fileno(): stderr}
+            pending = memoryview(input_data)
+            writers = [process.stdin.fileno()]
+
+            while readers:
+                if not pending and writers:
+                    process.stdin.close()
+                    writers = []
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(command, timeout, output=stdout.getvalue(), stderr=stderr.getvalue())
+
+                readable, writable, _ = select.select(list(readers), writers, [], remaining)
+                if writable:
+                    try:
+                        pending = pending[os.write(writers[0], pending[:select.PIPE_BUF]):]
+                    except BrokenPipeError:
+                        # the program doesn't read the rest of its inputs
+                        pending = pending[:0]
+
+                for fd in readable:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        del readers[fd]
+                    elif not readers[fd].write(chunk):
+                        # over the limits, the rest of the output is not needed
+                        process.kill()
+                        readers = {}
+                        break
+        except BaseException:
+            process.kill()
+            raise
+
+    result = subprocess.CompletedProcess(command, process.returncode, stdout.getvalue(), stderr.getvalue())
+    result.truncated = stdout.truncated or stderr.truncated
+    return result
+
+def run_once(assembly, input_data=b"", timeout=10, debug=False, maxOutputBytes=MAX_OUTPUT_BYTES, maxOutputLines=MAX_OUTPUT_LINES):
+    # runs the program in a new sandbox, which is removed afterwards
+    sandbox_dir = None
+    fd = None
+    try:
+        with metrics.stage("sandbox_setup"):
+            if IN_MEMORY:
+                fd = os.memfd_create("output.s")
+                write_memory_file(fd, assembly)
+                path = memory_file_path(fd)
+            else:
+                sandbox_dir = tempfile.mkdtemp(prefix="sandbox_", dir="/tmp")
+                write_assembly(sandbox_dir, assembly)
+                path = f"{sandbox_dir}/output.s"
+
+        with metrics.stage("run") as stage:
+            result = run_bounded(
+                sandbox_command(sandbox_dir, ["spim", "-file", path], debug),
+                input_data,
+                timeout,
+                OutputBuffer(maxOutputBytes, maxOutputLines),
+                pass_fds=[fd] if fd != None else []
+            )
+            if result.stderr:
+                stage.outcome = "runtime_error"
+        return hide_path(result, path)
+    finally:
+        # clean up the memory file or the sandbox directory, including files
+        if fd != None:
+            os.close(fd)
+        if sandbox_dir != None:
+            shutil.rmtree(sandbox_dir, ignore_errors=True)
+
+def parse_spim_output(stdout):
+    with metrics.stage("output_parse"):
+        output = stdout.decode()
+
+        # in different environments, the output is different, but what follows 'Loaded' is the actual output
+        output = output[output.find('Loaded'):]
+
+        # First line is the spim output, last line is empty after last new line
+        output_lines = output.split('\n')[1:-1]
+
+        return [int(line) for line in output_lines]
+
+class WorkerUnavailable(Exception):
+    pass
+
+class SpimWorker():
+    def __init__(self, debug=False, maxOutputBytes=MAX_OUTPUT_BYTES, maxOutputLines=MAX_OUTPUT_LINES):
+        self.runs = 0
+        self.isAlive = True
+        self.maxOutputBytes = maxOutputBytes
+        self.maxOutputLines = maxOutputLines
+        # set when the output of the last command was over the limits, and the process was killed
+        self.truncated = False
+
+        # each program is written to the same memory file, or to a directory bound into the sandbox
+        self.directory = None
+        self.memoryFile = None
+        if IN_MEMORY:
+            self.memoryFile = os.memfd_create("output.s")
+            self.path = memory_file_path(self.memoryFile)
+        else:
+            self.directory = tempfile.mkdtemp(prefix="spim_worker_", dir="/tmp")
+            self.path = f"{self.directory}/output.s"
+
+        # stdbuf makes sure the prompt is not kept in spim's buffer when writing to a pipe
+        self.command = sandbox_command(self.directory, ["stdbuf", "-o0", "spim"], debug)
+        try:
+            self.process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                pass_fds=[self.memoryFile] if self.memoryFile != None else []
+            )
+            
+            # the banner ends with the 'Loaded' line of the exception handler, like the output of spim -file
+            self.banner, _ = self._readUntilPrompt(WORKER_STARTUP_TIMEOUT)
+            if not self.isAlive:
+                raise WorkerUnavailable("spim exited while starting")
+        except Exception:
+            self.close()
+            raise
+
+    def run(self, assembly, timeout):
+        # the output has the same shape as the output of spim -file: the banner followed by the program output
+        if self.memoryFile != None:
+            write_memory_file(self.memoryFile, assembly)
+        else:
+            write_assembly(self.directory, assembly)
+        deadline = time.monotonic() + timeout
+
+        stdout, stderr = b"", b""
+        self.truncated = False
+        try:
+            for command in ["reinitialize", f'load "{self.path}"', "run"]:
+                if not self.isAlive:
+                    break
+
+                # only the output of the program is kept, the other commands can only report errors
+                stdout, err = self._command(command, deadline)
+                stderr += err
+        except subprocess.TimeoutExpired as e:
+            e.output = self.banner + (e.output or b"")
+            raise
+
+        stdout = self.banner + stdout
+
+        self.runs += 1
+        result = subprocess.CompletedProcess(self.command, 0 if self.isAlive else self.process.poll(), stdout, stderr)
+        result.truncated = self.truncated
+        return hide_path(result, self.path)
+
+    def close(self):
+        self.isAlive = False
+        process = getattr(self, "process", None)
+        if process != None and process.poll() == None:
+            process.kill()
+            process.wait()
+
+        if process != None:
+            for stream in [process.stdin, process.stdout, process.stderr]:
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+
+        if self.memoryFile != None:
+            os.close(self.memoryFile)
+            self.memoryFile = None
+        if self.directory != None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _command(self, command, deadline):
+        try:
+            self.process.stdin.write((command + "\n").encode())
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.isAlive = False
+            return b"", b""
+
+        return self._readUntilPrompt(deadline - time.monotonic())
+
+    def _readUntilPrompt(self, timeout):
+        deadline = time.monotonic() + timeout
+        stdout = OutputBuffer(self.maxOutputBytes, self.maxOutputLines)
+        stderr = OutputBuffer(self.maxOutputBytes, self.maxOutputLines)
+        streams = {self.process.stdout.fileno(): stdout, self.process.stderr.fileno(): stderr}
+
+        while not stdout.data.endswith(PROMPT):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.command, timeout, output=stdout.getvalue(), stderr=stderr.getvalue())
+
+            ready, _, _ = select.select(list(streams), [], [], remaining)
+            for fd in ready:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    # spim exited, what it wrote is still the output of the command
+                    self.isAlive = False
+                    return stdout.getvalue(), stderr.getvalue()
+
+                if not streams[fd].write(chunk):
+                    # over the limits, spim is stopped and the worker is replaced
+                    self.truncated = True
+                    self.isAlive = False
+                    self.process.kill()
+                    return stdout.getvalue(), stderr.getvalue()
+
+        # errors can be written right before the prompt, so get what's left without waiting
+        ready, _, _ = select.select([self.process.stderr.fileno()], [], [], 0)
+        if ready:
+            stderr.write(os.read(self.process.stderr.fileno(), 65536))
+
+        return bytes(stdout.data[:-len(PROMPT)]), stderr.getvalue()
+
+class SpimPool():
+    def __init__(self, size=4, maxRunsPerWorker=100, debug=False, maxOutputBytes=MAX_OUTPUT_BYTES, maxOutputLines=MAX_OUTPUT_LINES):
+        self.size = size
+        self.maxRunsPerWorker = maxRunsPerWorker
+        self.debug = debug
+        self.maxOutputBytes = maxOutputBytes
+        self.maxOutputLines = maxOutputLines
+
+        # if workers can't be started, the pool is disabled and runs use a new sandbox
+        self.isEnabled = size > 0
+
+        self.idle : queue.LifoQueue[SpimWorker] = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(max(size, 1))
+
+    def run(self, assembly, timeout):
+        # runs don't wait for a worker to be free, they run in a new sandbox instead
+        if not self.slots.acquire(blocking=False):
+            raise WorkerUnavailable("all the workers are busy")
+
+        worker = None
+        try:
+            with metrics.stage("sandbox_setup"):
+                worker = self._checkout()
+
+            with metrics.stage("run") as stage:
+                result = worker.run(assembly, timeout)
+                if result.stderr:
+                    stage.outcome = "runtime_error"
+            return result
+        except Exception:
+            # a worker that timed out or failed can be in any state, so it's not reused
+            if worker != None:
+                worker.close()
+                worker = None
+            raise
+        finally:
+            if worker != None:
+                if worker.isAlive and worker.runs < self.maxRunsPerWorker:
+                    self.idle.put(worker)
+                else:
+                    worker.close()
+            self.slots.release()
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+    def _checkout(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            return SpimWorker(self.debug, self.maxOutputBytes, self.maxOutputLines)
+        except Exception as e:
+            logger.warning("Could not start a spim worker, programs will run in a new sandbox: %s", e)
+            self.isEnabled = False
+            raise WorkerUnavailable(str(e))
+
+class Sandbox():
+    def __init__(self, timeout=10, debug=False, poolSize=0, maxRunsPerWorker=100,
+                 maxOutputBytes=MAX_OUTPUT_BYTES, maxOutputLines=MAX_OUTPUT_LINES):
+        self.timeout = timeout
+        self.debug = debug
+        self.maxOutputBytes = maxOutputBytes
+        self.maxOutputLines = maxOutputLines
+        self.pool = SpimPool(poolSize, maxRunsPerWorker, debug, maxOutputBytes, maxOutputLines)
+
+    def run(self, assembly, input_data=b"", timeout=None):
+        # the number of runs at the same time is limited by the caller (see admission.py), so runs start right away
+        # a timeout shorter than the one of the sandbox can be given, e.g. to stop at the deadline of a batch
+        timeout = self.timeout if timeout == None else min(timeout, self.timeout)
+        metrics.SANDBOXES_IN_FLIGHT.inc()
+        try:
+            # the pool is only used by programs that don't read inputs
+            if self.pool.isEnabled and READ_INT_SYSCALL not in assembly:
+                try:
+                    return self.pool.run(assembly, timeout)
+                except WorkerUnavailable:
+                    pass
+
+            return run_once(assembly, input_data, timeout, self.debug, self.maxOutputBytes, self.maxOutputLines)
+        finally:
+            metrics.SANDBOXES_IN_FLIGHT.dec()
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,261 @@
+from compiler.incremental import IncrementalDocument
+from compiler.parser import MAX_NESTING
+from collections import OrderedDict
+import metrics
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+"""
+Documents open for /checkSyntax sessions, so editors can send their edits instead of the whole program.
+
+Sessions are closed by the client, or evicted once they've been idle for idleTimeout seconds, or when there are
+more than maxSessions of them or their documents take more than maxBytes, starting with the least recently used.
+
+When the server has several worker processes, the text of the documents is also saved in a DocumentStore shared by
+all of them, along with a version that each edit increments. A worker parses the document again from the store when
+it doesn't have the session, or has an older version of it, so a session can be used through any worker. The
+limits then apply to the documents each worker keeps parsed, and to the texts kept in the store.
+"""
+
+# interval between removing the idle and least recently used documents from the store
+STORE_EXPIRE_INTERVAL = 1
+
+class SessionNotFound(Exception):
+    pass
+
+class Session():
+    def __init__(self, program : str, maxErrors : int = 0, maxNesting : int = MAX_NESTING, sessionId=None, version=0):
+        self.id = sessionId or uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.lastUsed = time.monotonic()
+        # the number of edits applied to the document, None once it's behind the one in the store
+        self.version = version
+
+        with metrics.stage("parse") as stage:
+            self.document = IncrementalDocument(program, maxErrors, maxNesting)
+            if not self.document.isLexerValid or not self.document.isSyntaxValid:
+                stage.outcome = "syntax_error"
+
+    def edit(self, edits, store=None) -> bool:
+        # applies the edits in order, each one with the offsets of the document left by the ones before it
+        # returns False if the document was edited through another process first, then the session is out of date
+        with self.lock, metrics.stage("parse") as stage:
+            if self.version == None:
+                return False
+
+            # the edits are checked first, so the document isn't left half edited
+            length = self.document.length
+            for start, end, text in edits:
+                if not 0 <= start <= end <= length:
+                    raise ValueError(f"The edit from {start} to {end} is outside of the document, of length {length}")
+                length += len(text) - (end - start)
+
+            for start, end, text in edits:
+                self.document.edit(start, end, text)
+            if not self.document.isLexerValid or not self.document.isSyntaxValid:
+                stage.outcome = "syntax_error"
+
+            if store != None and not store.update(self.id, self.document.text(), self.version + 1):
+                self.version = None
+                return False
+            self.version += 1
+            return True
+
+class DocumentStore():
+    # the texts of the session documents saved in a SQLite database, shared by the processes of the server
+    def __init__(self, path : str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+
+    def add(self, sessionId, program):
+        with self.lock:
+            self._connect().execute("INSERT INTO documents VALUES (?, ?, 0, ?)", (sessionId, program, time.time()))
+
+    def touch(self, sessionId):
+        # marks the document as used, and returns its version, or None if it was removed
+        with self.lock:
+            connection = self._connect()
+            connection.execute("UPDATE documents SET lastUsed = ? WHERE id = ?", (time.time(), sessionId))
+            row = connection.execute("SELECT version FROM documents WHERE id = ?", (sessionId,)).fetchone()
+        return row[0] if row != None else None
+
+    def load(self, sessionId):
+        # the text and the version of the document, or None if it was removed
+        with self.lock:
+            return self._connect().execute("SELECT program, version FROM documents WHERE id = ?", (sessionId,)).fetchone()
+
+    def update(self, sessionId, program, version):
+        # saves the next version of the document, unless another process saved it first
+        with self.lock:
+            cursor = self._connect().execute(
+                "UPDATE documents SET program = ?, version = ?, lastUsed = ? WHERE id = ? AND version = ?",
+                (program, version, time.time(), sessionId, version - 1)
+            )
+        return cursor.rowcount == 1
+
+    def remove(self, sessionId):
+        with self.lock:
+            cursor = self._connect().execute("DELETE FROM documents WHERE id = ?", (sessionId,))
+        return cursor.rowcount == 1
+
+    def expire(self, before, maxDocuments, maxBytes):
+        # like SessionStore._evict, the most recently used document is kept even if it's too big by itself
+        with self.lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM documents WHERE lastUsed < ?", (before,))
+            connection.execute(
+                "DELETE FROM documents WHERE id IN (SELECT id FROM ("
+                "SELECT id, ROW_NUMBER() OVER recent AS rank, SUM(length(program)) OVER recent AS total FROM documents "
+                "WINDOW recent AS (ORDER BY lastUsed DESC)) WHERE rank > 1 AND (rank > ? OR total > ?))",
+                (maxDocuments, maxBytes)
+            )
+
+    def _connect(self):
+        # connections can't be shared with forked processes, so each process opens its own
+        if self.connection == None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, program TEXT, version INTEGER, lastUsed REAL)"
+            )
+            self.pid = os.getpid()
+        return self.connection
+
+class SessionStore():
+    def __init__(self, maxSessions=256, maxBytes=16 * 1024 * 1024, idleTimeout=300, maxErrors=0, maxNesting=MAX_NESTING, storePath=""):
+        self.maxSessions = maxSessions
+        self.maxBytes = maxBytes
+        self.idleTimeout = idleTimeout
+        self.maxErrors = maxErrors
+        self.maxNesting = maxNesting
+
+        # the least recently used session first
+        self.sessions : OrderedDict[str, Session] = OrderedDict()
+        # the bytes counted for each document, and their total
+        self.sizes : dict[str, int] = dict()
+        self.totalBytes = 0
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+        # without a store, a session can only be used through the process that opened it
+        self.store = DocumentStore(storePath) if storePath else None
+        self.lastExpired = 0
+
+    def open(self, program : str) -> Session:
+        session = Session(program, self.maxErrors, self.maxNesting)
+        if self.store != None:
+            self._expireStore()
+            self.store.add(session.id, program)
+
+        with self.lock:
+            self._add(session)
+            self._evict()
+        return session
+
+    def get(self, sessionId : str) -> Session:
+        with self.lock:
+            self._evict()
+            session = self.sessions.get(sessionId)
+            if session != None:
+                session.lastUsed = time.monotonic()
+                self.sessions.move_to_end(sessionId)
+
+        if self.store != None:
+            return self._synchronize(sessionId, session)
+        if session == None:
+            raise SessionNotFound(sessionId)
+        return session
+
+    def edit(self, sessionId : str, edits) -> Session:
+        # with a store, the edits are applied again to the latest version if another process edited it meanwhile
+        while True:
+            session = self.get(sessionId)
+            if session.edit(edits, self.store):
+                self._resize(session)
+                return session
+
+    def close(self, sessionId : str):
+        with self.lock:
+            session = self._remove(sessionId)
+
+        isClosed = self.store.remove(sessionId) if self.store != None else session != None
+        if not isClosed:
+            raise SessionNotFound(sessionId)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sessions': len(self.sessions),
+                'bytes': self.totalBytes,
+                'evictions': self.evictions,
+                'maxSessions': self.maxSessions,
+                'maxBytes': self.maxBytes
+            }
+
+    def _synchronize(self, sessionId, session):
+        # the session may have been opened, edited or closed through another process since this one last used it
+        self._expireStore()
+        version = self.store.touch(sessionId)
+        if version == None:
+            with self.lock:
+                self._remove(sessionId)
+            raise SessionNotFound(sessionId)
+        if session != None and session.version == version:
+            return session
+
+        row = self.store.load(sessionId)
+        if row == None:
+            raise SessionNotFound(sessionId)
+        session = Session(row[0], self.maxErrors, self.maxNesting, sessionId, row[1])
+
+        with self.lock:
+            self._add(session)
+            self._evict()
+        return session
+
+    def _expireStore(self):
+        now = time.time()
+        if now - self.lastExpired < STORE_EXPIRE_INTERVAL:
+            return
+        self.lastExpired = now
+        self.store.expire(now - self.idleTimeout, self.maxSessions, self.maxBytes)
+
+    def _add(self, session):
+        # adds the session, or replaces the one with the same id
+        self._remove(session.id)
+        self.sessions[session.id] = session
+        self.sizes[session.id] = session.document.size()
+        self.totalBytes += self.sizes[session.id]
+
+    def _remove(self, sessionId):
+        session = self.sessions.pop(sessionId, None)
+        if session != None:
+            self.totalBytes -= self.sizes.pop(sessionId)
+        return session
+
+    def _resize(self, session):
+        # documents grow and shrink with their edits, the size is read under the session's lock so it's up to date
+        with session.lock, self.lock:
+            if self.sessions.get(session.id) is session:
+                size = session.document.size()
+                self.totalBytes += size - self.sizes[session.id]
+                self.sizes[session.id] = size
+                self._evict()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            isIdle = now - oldest.lastUsed > self.idleTimeout
+            # the newest session is kept even if it's too big by itself, so it can be used once
+            isOverLimit = len(self.sessions) > 1 and (len(self.sessions) > self.maxSessions or self.totalBytes > self.maxBytes)
+            if not isIdle and not isOverLimit:
+                break
+
+            self._remove(oldest.id)
+            self.evictions += 1
@@ -0,0 +1,365 @@
+import metrics
+import subprocess
+import time
+
+"""
+In-process MIPS simulator for the subset of instructions emitted by the CodeGenerator.
+
+It's an execution backend that can be used instead of spim: the assembly is decoded once into a list of
+instructions with their labels resolved, and run with a limit in the number of executed instructions and in
+the memory used, so runaway programs are stopped deterministically instead of by a wall-clock timeout.
+
+The tradeoff against spim is speed: the simulator runs in Python, a few million instructions per second, on the
+thread of the request and holding the GIL, so long runs slow down the other requests of the same worker process.
+The default limit of 2 million instructions stops a runaway program in about half a second, which is enough for
+typical exercises, but programs that need more should run with spim or a higher SIMULATOR_MAX_STEPS.
+
+The run returns a subprocess.CompletedProcess with the same output spim -file would write, so the endpoints
+handle both backends the same way. Like the spim runs, the program is stopped once its output is over a number of
+bytes or lines, and the result has truncated set.
+
+A run can also be given a timeout, like a spim run, which is checked every DEADLINE_CHECK_STEPS instructions.
+"""
+
+DATA_BASE = 0x10010000
+STACK_BASE = 0x7FFFEFFC
+WORD_MASK = 0xFFFFFFFF
+DEADLINE_CHECK_STEPS = 65536
+
+REGISTERS = {
+    "zero": 0, "at": 1, "v0": 2, "v1": 3, "a0": 4, "a1": 5, "a2": 6, "a3": 7,
+    "t0": 8, "t1": 9, "t2": 10, "t3": 11, "t4": 12, "t5": 13, "t6": 14, "t7": 15,
+    "s0": 16, "s1": 17, "s2": 18, "s3": 19, "s4": 20, "s5": 21, "s6": 22, "s7": 23,
+    "t8": 24, "t9": 25, "k0": 26, "k1": 27, "gp": 28, "sp": 29, "fp": 30, "ra": 31
+}
+SP, FP, RA, V0, A0 = REGISTERS["sp"], REGISTERS["fp"], REGISTERS["ra"], REGISTERS["v0"], REGISTERS["a0"]
+
+# opcodes of the decoded instructions, roughly in order of how often they're executed
+SW, LW, ADDIU, LI, MOVE, LW_LABEL, SW_LABEL, ADD, ADDU, SUB, MULT, DIV, MFLO, SLT, SLE, SEQ, SNE, BEQ, B, JAL, JR, LA, SYSCALL = range(23)
+
+OPCODES = {
+    "add": ADD, "addu": ADDU, "sub": SUB, "mult": MULT, "div": DIV, "mflo": MFLO,
+    "slt": SLT, "sle": SLE, "seq": SEQ, "sne": SNE, "beq": BEQ, "b": B, "jal": JAL, "jr": JR,
+    "li": LI, "la": LA, "move": MOVE, "addiu": ADDIU, "syscall": SYSCALL
+}
+
+class OutputLimitReached(Exception):
+    def __init__(self, output):
+        super().__init__("Program output exceeded the limit")
+        self.output = output
+
+class SimulatorError(Exception):
+    pass
+
+class StepLimitExceeded(subprocess.TimeoutExpired):
+    def __init__(self, maxSteps, output=b""):
+        super().__init__("simulator", 0, output=output)
+        self.maxSteps = maxSteps
+
+    def __str__(self):
+        return f"Program exceeded the limit of {self.maxSteps} executed instructions"
+
+def _signed(value):
+    value &= WORD_MASK
+    return value - 0x100000000 if value & 0x80000000 else value
+
+def _unescape(text):
+    return text.encode().decode("unicode_escape").encode("latin-1")
+
+class Program():
+    """
+    The decoded assembly: instructions are tuples of (opcode, a, b, c) with registers as numbers,
+    and labels resolved to instruction indexes or data addresses.
+    """
+    def __init__(self, assembly : str):
+        self.instructions : list[tuple] = []
+        self.data : dict[int, int] = dict()
+        self.dataEnd = DATA_BASE
+        self.entry = None
+
+        textLabels : dict[str, int] = dict()
+        dataLabels : dict[str, int] = dict()
+        pending = []
+
+        dataBytes = bytearray()
+        inText = False
+        for line in assembly.split("\n"):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+
+            # labels can be followed by a directive or an instruction in the same line
+            while ":" in line and not line.startswith(".") and '"' not in line.split(":", 1)[0]:
+                label, line = line.split(":", 1)
+                line = line.strip()
+                if inText:
+                    textLabels[label.strip()] = len(pending)
+                else:
+                    dataLabels[label.strip()] = DATA_BASE + len(dataBytes)
+            if not line:
+                continue
+
+            if line.startswith("."):
+                directive, _, argument = line.partition(" ")
+                argument = argument.strip()
+                if directive == ".text":
+                    inText = True
+                elif directive == ".data":
+                    inText = False
+                elif directive == ".align":
+                    alignment = 2 ** int(argument)
+                    dataBytes += bytes(-len(dataBytes) % alignment)
+                elif directive == ".word":
+                    for value in argument.replace(",", " ").split():
+                        dataBytes += (int(value, 0) & WORD_MASK).to_bytes(4, "little")
+                elif directive == ".space":
+                    dataBytes += bytes(int(argument, 0))
+                elif directive == ".asciiz":
+                    dataBytes += _unescape(argument.strip()[1:-1]) + b"\0"
+                elif directive == ".globl":
+                    pass
+                else:
+                    raise SimulatorError(f"Unsupported directive: {directive}")
+                continue
+
+            name, _, operands = line.partition(" ")
+            operands = operands.replace(",", " ").split()
+            pending.append((name, operands, line))
+
+        # words are aligned to simplify loads and stores, as the data segment only holds words and strings
+        dataBytes += bytes(-len(dataBytes) % 4)
+        for offset in range(0, len(dataBytes), 4):
+            word = int.from_bytes(dataBytes[offset:offset + 4], "little")
+            if word:
+                self.data[DATA_BASE + offset] = word
+        self.dataEnd = DATA_BASE + len(dataBytes)
+
+        # instructions are decoded once the labels are known
+        for name, operands, line in pending:
+            self.instructions.append(self._decode(name, operands, line, textLabels, dataLabels))
+
+        self.entry = textLabels.get("main")
+
+    def _decode(self, name, operands, line, textLabels, dataLabels):
+        def register(operand):
+            operand = operand.lstrip("$")
+            if operand.isdigit():
+                return int(operand)
+            if operand not in REGISTERS:
+                raise SimulatorError(f"Unknown register in: {line}")
+            return REGISTERS[operand]
+
+        def textLabel(operand):
+            if operand not in textLabels:
+                raise SimulatorError(f"Undefined label in: {line}")
+            return textLabels[operand]
+
+        if name in ["lw", "sw"]:
+            target = register(operands[0])
+            address = operands[1]
+            if "(" in address:
+                offset, base = address.rstrip(")").split("(")
+                return (LW if name == "lw" else SW, target, register(base), int(offset or "0", 0))
+            if address not in dataLabels:
+                raise SimulatorError(f"Undefined label in: {line}")
+            return (LW_LABEL if name == "lw" else SW_LABEL, target, dataLabels[address], 0)
+
+        if name not in OPCODES:
+            raise SimulatorError(f"Unsupported instruction: {line}")
+        opcode = OPCODES[name]
+
+        if opcode == SYSCALL:
+            return (SYSCALL, 0, 0, 0)
+        elif opcode in [ADD, ADDU, SUB, SLT, SLE, SEQ, SNE]:
+            return (opcode, register(operands[0]), register(operands[1]), register(operands[2]))
+        elif opcode in [MULT, DIV, MOVE]:
+            return (opcode, register(operands[0]), register(operands[1]), 0)
+        elif opcode in [MFLO, JR]:
+            return (opcode, register(operands[0]), 0, 0)
+        elif opcode == ADDIU:
+            return (ADDIU, register(operands[0]), register(operands[1]), int(operands[2], 0))
+        elif opcode == LI:
+            return (LI, register(operands[0]), _signed(int(operands[1], 0)), 0)
+        elif opcode == LA:
+            if operands[1] not in dataLabels:
+                raise SimulatorError(f"Undefined label in: {line}")
+            return (LA, register(operands[0]), dataLabels[operands[1]], 0)
+        elif opcode == BEQ:
+            return (BEQ, register(operands[0]), register(operands[1]), textLabel(operands[2]))
+        else: # b and jal
+            return (opcode, textLabel(operands[0]), 0, 0)
+
+class Simulator():
+    def __init__(self, maxSteps=2_000_000, maxMemory=64 * 1024 * 1024, maxOutputBytes=4 * 1024 * 1024, maxOutputLines=100_000):
+        self.maxSteps = maxSteps
+        self.maxMemory = maxMemory
+        self.maxOutputBytes = maxOutputBytes
+        self.maxOutputLines = maxOutputLines
+
+    def run(self, assembly, input_data=b"", timeout=None):
+        metrics.SANDBOXES_IN_FLIGHT.inc()
+        try:
+            with metrics.stage("sandbox_setup"):
+                program = Program(assembly)
+                inputs = input_data.decode(errors="replace").split("\n")
+
+            truncated = False
+            with metrics.stage("run") as stage:
+                try:
+                    output, error = self.execute(program, inputs, timeout)
+                except OutputLimitReached as e:
+                    output, error, truncated = e.output, "", True
+                if error:
+                    stage.outcome = "runtime_error"
+        finally:
+            metrics.SANDBOXES_IN_FLIGHT.dec()
+
+        # same shape as the output of spim -file, where the program output follows the 'Loaded' line
+        stdout = ("Loaded: simulator\n" + "".join(output)).encode()
+        result = subprocess.CompletedProcess("simulator", 1 if error else 0, stdout, error.encode())
+        result.truncated = truncated
+        return result
+
+    def execute(self, program : Program, inputs : list[str], timeout : float = None):
+        # returns the list of written strings, and the error message if the program failed
+        output : list[str] = []
+        if program.entry == None:
+            return output, ""
+
+        instructions = program.instructions
+        memory = dict(program.data)
+        maxWords = self.maxMemory // 4
+
+        registers = [0] * 32
+        registers[SP] = STACK_BASE
+        # spim's startup code calls main with argc in $a0, and uninitialized variables take that value
+        registers[A0] = 1
+        registers[V0] = 4
+        registers[RA] = -1
+
+        heapEnd = program.dataEnd
+        lo = 0
+        inputIndex = 0
+        outputBytes = 0
+        outputLines = 0
+        pc = program.entry
+        steps = self.maxSteps
+        count = len(instructions)
+        
+        # the clock is only read when the step counter goes below the next check, so the loop doesn't get slower
+        deadline = None if timeout == None else time.monotonic() + timeout
+        nextCheck = max(steps - DEADLINE_CHECK_STEPS, 0) if deadline != None else 0
+
+        try:
+            while True:
+                if pc < 0 or pc >= count:
+                    # returning from main without calling exit
+                    return output, ""
+
+                steps -= 1
+                if steps < nextCheck:
+                    if steps < 0:
+                        raise StepLimitExceeded(self.maxSteps, ("Loaded: simulator\n" + "".join(output)).encode())
+                    if time.monotonic() >= deadline:
+                        raise subprocess.TimeoutExpired("simulator", timeout, ("Loaded: simulator\n" + "".join(output)).encode())
+                    nextCheck = max(steps - DEADLINE_CHECK_STEPS, 0)
+
+                opcode, a, b, c = instructions[pc]
+                pc += 1
+
+                if opcode == SW:
+                    address = (registers[b] + c) & WORD_MASK
+                    if address not in memory and len(memory) >= maxWords:
+                        return output, "Memory limit exceeded\n"
+                    if address & 3:
+                        return output, f"Unaligned address in store: 0x{address:08x}\n"
+                    memory[address] = registers[a]
+                elif opcode == LW:
+                    address = (registers[b] + c) & WORD_MASK
+                    if address & 3 or address < DATA_BASE:
+                        return output, f"Bad address in data/stack read: 0x{address:08x}\n"
+                    registers[a] = memory.get(address, 0)
+                elif opcode == ADDIU:
+                    registers[a] = _signed(registers[b] + c)
+                elif opcode == LI:
+                    registers[a] = b
+                elif opcode == MOVE:
+                    registers[a] = registers[b]
+                elif opcode == LW_LABEL:
+                    registers[a] = memory.get(b, 0)
+                elif opcode == SW_LABEL:
+                    memory[b] = registers[a]
+                elif opcode == ADD or opcode == SUB:
+                    value = registers[b] + registers[c] if opcode == ADD else registers[b] - registers[c]
+                    if value != _signed(value):
+                        return output, f"Exception occurred at PC=0x{0x00400000 + 4 * (pc - 1):08x}\n  Arithmetic overflow\n"
+                    registers[a] = value
+                elif opcode == ADDU:
+                    registers[a] = _signed(registers[b] + registers[c])
+                elif opcode == MULT:
+                    lo = _signed(registers[a] * registers[b])
+                elif opcode == DIV:
+                    # like spim, dividing by zero leaves lo unchanged
+                    if registers[b] != 0:
+                        quotient = abs(registers[a]) // abs(registers[b])
+                        lo = _signed(quotient if (registers[a] < 0) == (registers[b] < 0) else -quotient)
+                elif opcode == MFLO:
+                    registers[a] = lo
+                elif opcode == SLT:
+                    registers[a] = 1 if registers[b] < registers[c] else 0
+                elif opcode == SLE:
+                    registers[a] = 1 if registers[b] <= registers[c] else 0
+                elif opcode == SEQ:
+                    registers[a] = 1 if registers[b] == registers[c] else 0
+                elif opcode == SNE:
+                    registers[a] = 1 if registers[b] != registers[c] else 0
+                elif opcode == BEQ:
+                    if registers[a] == registers[b]:
+                        pc = c
+                elif opcode == B:
+                    pc = a
+                elif opcode == JAL:
+                    registers[RA] = pc
+                    pc = a
+                elif opcode == JR:
+                    pc = registers[a]
+                elif opcode == LA:
+                    registers[a] = b
+                else: # syscall
+                    service = registers[V0]
+                    if service == 1 or service == 4:
+                        text = str(registers[A0]) if service == 1 else self._readString(memory, registers[A0])
+                        outputBytes += len(text)
+                        outputLines += text.count("\n")
+                        if outputBytes > self.maxOutputBytes or outputLines > self.maxOutputLines:
+                            raise OutputLimitReached(output)
+                        output.append(text)
+                    elif service == 5:
+                        line = inputs[inputIndex].strip() if inputIndex < len(inputs) else ""
+                        inputIndex += 1
+                        try:
+                            registers[V0] = _signed(int(line))
+                        except ValueError:
+                            registers[V0] = 0
+                    elif service == 9:
+                        size = registers[A0]
+                        if size < 0 or (heapEnd + size - program.dataEnd) // 4 + len(memory) > maxWords:
+                            return output, "Memory limit exceeded\n"
+                        registers[V0] = heapEnd
+                        heapEnd += (size + 3) & ~3
+                    elif service == 10:
+                        return output, ""
+                    else:
+                        return output, f"Unsupported syscall {service}\n"
+        except IndexError:
+            return output, "Invalid instruction operand\n"
+
+    def _readString(self, memory, address):
+        text = bytearray()
+        while len(text) < 4096:
+            byte = (memory.get(address & ~3, 0) >> (8 * (address & 3))) & 0xFF
+            if byte == 0:
+                break
+            text.append(byte)
+            address += 1
+        return text.decode("latin-1")
@@ -0,0 +1,41 @@
+import threading
+import pytest
+from admission import AdmissionControl, Overloaded
+
+def test_full_queue_rejects_right_away():
+    admission = AdmissionControl(maxRunning=1, maxQueued=0, maxWait=5)
+    
+    with admission.slot():
+        with pytest.raises(Overloaded) as error:
+            admission.acquire()
+        assert error.value.retryAfter >= 1
+    
+    assert admission.stats()['rejected'] == 1
+    assert admission.stats()['running'] == 0
+
+def test_wait_is_bounded():
+    admission = AdmissionControl(maxRunning=1, maxQueued=1, maxWait=0.05)
+    
+    with admission.slot():
+        with pytest.raises(Overloaded):
+            admission.acquire()
+    
+    assert admission.stats()['queued'] == 0
+
+def test_waiting_run_gets_the_slot():
+    admission = AdmissionControl(maxRunning=1, maxQueued=1, maxWait=5)
+    admitted = threading.Event()
+    
+    def wait_for_slot():
+        with admission.slot():
+            admitted.set()
+    
+    admission.acquire()
+    thread = threading.Thread(target=wait_for_slot)
+    thread.start()
+    assert not admitted.wait(0.05)
+    
+    admission.release()
+    thread.join(5)
+    assert admitted.is_set()
+    assert admission.stats()['running'] == 0
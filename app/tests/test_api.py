@@ -1,5 +1,11 @@
+import json
+import time
+import os
 import pytest
+import app as app_module
 from app import app
+from simulator import Simulator
+from admission import AdmissionControl
 
 @pytest.fixture
 def client():
@@ -7,6 +13,12 @@ def client():
     with app.test_client() as client:
         yield client
 
+@pytest.fixture
+def simulator_client(client, monkeypatch):
+    # runs the programs with the in-process simulator, which doesn't need spim to be installed
+    monkeypatch.setattr(app_module, "backend", Simulator())
+    yield client
+
 # Test cases for checkSyntax
 def test_check_syntax_valid(client):
     valid_program = """
@@ -33,6 +45,61 @@ def test_check_syntax_invalid(client):
     assert data["isSyntaxCorrect"] is False
     assert isinstance(data["line"], int)
 
+def test_check_syntax_returns_all_errors(client):
+    program = "void main(void) {\n    int x\n    x = 5\n    output(x);\n}\n"
+    
+    # by default, the parser stops at the first error
+    first = client.post("/checkSyntax", json={"program": program}).get_json()
+    assert first["isSyntaxCorrect"] is False
+    assert [error["line"] for error in first["errors"]] == [2]
+    assert first["errorsTruncated"] is True
+    
+    data = client.post("/checkSyntax", json={"program": program, "allErrors": True}).get_json()
+    assert [error["line"] for error in data["errors"]] == [2, 3]
+    assert (data["errors"][0]["line"], data["errors"][0]["column"]) == (data["line"], data["column"])
+    assert (first["error"], first["line"], first["column"]) == (data["error"], data["line"], data["column"])
+    assert data["errorsTruncated"] is False
+
+def test_check_syntax_deep_nesting(client):
+    program = "void main(void) {\n    output(" + "(" * 5000 + "1" + ")" * 5000 + ");\n}\n"
+    data = client.post("/checkSyntax", json={"program": program}).get_json()
+    assert data["isSyntaxCorrect"] is False
+    assert data["error"] == f"Too deeply nested, the limit is {app_module.MAX_NESTING} levels"
+
+def test_check_syntax_session(client):
+    program = "void main(void) {\n    int x;\n    x = 5;\n    output(x);\n}\n"
+    response = client.post("/checkSyntax/sessions", json={"program": program})
+    assert response.status_code == 201
+    session = response.get_json()["session"]
+    assert response.get_json()["isSyntaxCorrect"] is True
+    
+    # deletes the ';' after the assignment, like /checkSyntax for the whole program
+    edit = program.index("5;") + 1
+    response = client.patch(f"/checkSyntax/sessions/{session}", json={"edits": [{"start": edit, "end": edit + 1, "text": ""}]})
+    expected = client.post("/checkSyntax", json={"program": program[:edit] + program[edit + 1:]}).get_json()
+    data = response.get_json()
+    assert data["isSyntaxCorrect"] is False
+    assert (data["error"], data["line"], data["column"]) == (expected["error"], expected["line"], expected["column"])
+    
+    response = client.patch(f"/checkSyntax/sessions/{session}", json={"edits": [{"start": 0, "end": 1000, "text": ""}]})
+    assert response.status_code == 400
+    
+    assert client.delete(f"/checkSyntax/sessions/{session}").status_code == 204
+    response = client.patch(f"/checkSyntax/sessions/{session}", json={"edits": []})
+    assert response.status_code == 404
+
+def test_check_syntax_session_missing_array_size(client):
+    program = "int a[4];\nvoid main(void) {\n    output(1);\n}\n"
+    session = client.post("/checkSyntax/sessions", json={"program": program}).get_json()["session"]
+    
+    # "int a[];" is cut into a segment of its own, which is parsed until the end of the segment
+    edit = program.index("4")
+    response = client.patch(f"/checkSyntax/sessions/{session}", json={"edits": [{"start": edit, "end": edit + 1, "text": ""}]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["isSyntaxCorrect"] is False
+    assert data["error"] == "Expected number to define array size"
+
 def test_check_syntax_empty_input(client):
     response = client.post("/checkSyntax", json={"program": ""})
     assert response.status_code == 400
@@ -129,4 +196,231 @@ def test_perform_test_cases_no_funName(client):
             "testCases": [[[1,2,3], 3], [[0,-1,2], 3]]
     }
     response = client.post("/performTestCases", json=body)
-    assert response.status_code == 400
\ No newline at end of file
+    assert response.status_code == 400
+
+def test_cache_stats(client):
+    program = "void main(void) {\n    output(1);\n}\n"
+    client.post("/checkSyntax", json={"program": program})
+    client.post("/checkSyntax", json={"program": program})
+    
+    response = client.get("/cacheStats")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["hits"] >= 1
+    assert data["entries"] >= 1
+    assert data["worker"] == os.getpid()
+
+def test_perform_test_cases_batched_matches_per_case(simulator_client, monkeypatch):
+    body = {
+            "program": "int sumUntil(int n) {\nint i;\nint total;\ni = 0;\ntotal = 0;\nwhile (i <= n) {\ntotal = total + i;\ni = i + 1;\n}\nreturn total;\n}",
+            "funName": "sumUntil",
+            "testCases": [[3], [10], [0-1], [0]]
+    }
+    batched = simulator_client.post("/performTestCases", json=body).get_json()
+    
+    monkeypatch.setattr(app_module, "BATCH_TEST_CASES", False)
+    perCase = simulator_client.post("/performTestCases", json=body).get_json()
+    
+    assert batched == perCase
+    assert [result["output"] for result in batched["results"]] == [6, 55, 0, 0]
+
+# test cases for jobs
+def test_jobs_run_compile(simulator_client):
+    program = "void main(void) {\n    output(input() + 1);\n}\n"
+    response = simulator_client.post("/jobs", json={"program": program, "inputs": [41]})
+    assert response.status_code == 202
+    job_id = response.get_json()["id"]
+    
+    response = simulator_client.get(f"/jobs/{job_id}?wait=10")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["status"] == "done"
+    assert data["type"] == "runCompile"
+    assert data["statusCode"] == 200
+    assert data["result"]["outputs"] == [42]
+
+def test_jobs_perform_test_cases(simulator_client):
+    body = {
+            "program": "int twice(int x) {\nreturn x * 2;\n}",
+            "funName": "twice",
+            "testCases": [[1], [5]]
+    }
+    job_id = simulator_client.post("/jobs", json=body).get_json()["id"]
+    data = simulator_client.get(f"/jobs/{job_id}?wait=10").get_json()
+    assert data["type"] == "performTestCases"
+    assert [result["output"] for result in data["result"]["results"]] == [2, 10]
+
+def test_jobs_unknown(client):
+    assert client.get("/jobs/unknown").status_code == 404
+    assert client.post("/jobs", json={"type": "other"}).status_code == 400
+
+def test_perform_test_cases_parallel_keeps_order(simulator_client, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_TEST_CASES", False)
+    body = {
+            "program": "int square(int x) {\nreturn x * x;\n}",
+            "funName": "square",
+            "testCases": [[i] for i in range(20)]
+    }
+    data = simulator_client.post("/performTestCases", json=body).get_json()
+    assert [result["output"] for result in data["results"]] == [i * i for i in range(20)]
+
+def test_perform_test_cases_stream_ndjson(simulator_client, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_TEST_CASES", False)
+    body = {
+            "program": "int square(int x) {\nreturn x * x;\n}",
+            "funName": "square",
+            "testCases": [[2], [3], [4]]
+    }
+    response = simulator_client.post("/performTestCases?stream=ndjson", json=body)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(record["index"] for record in records[:-1]) == [0, 1, 2]
+    assert records[-1]["type"] == "summary"
+    assert [result["output"] for result in records[-1]["results"]] == [4, 9, 16]
+
+def test_perform_test_cases_stream_sse(simulator_client):
+    body = {
+            "program": "int square(int x) {\nreturn x * x;\n}",
+            "funName": "square",
+            "testCases": [[2], [3]]
+    }
+    response = simulator_client.post("/performTestCases?stream=sse", json=body)
+    assert response.mimetype == "text/event-stream"
+    text = response.get_data(as_text=True)
+    assert text.count("event: result\n") == 2
+    assert "event: summary\n" in text
+
+def test_perform_test_cases_stream_invalid(client):
+    response = client.post("/performTestCases?stream=ndjson", json={"program": "int f(void) { return 1; }"})
+    assert response.status_code == 400
+
+def test_metrics(simulator_client):
+    program = "void main(void) {\n    output(1);\n}\n"
+    simulator_client.post("/runCompile", json={"program": program})
+    
+    response = simulator_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    
+    body = response.get_data(as_text=True)
+    worker = f'worker="{os.getpid()}"'
+    assert f'compiler_stage_duration_seconds_count{{{worker},stage="codegen",endpoint="run_compile",outcome="ok"}}' in body
+    assert f'compiler_stage_duration_seconds_count{{{worker},stage="run",endpoint="run_compile",outcome="ok"}}' in body
+    assert f'http_requests_total{{{worker},endpoint="run_compile",status="200"}}' in body
+    assert f"sandboxes_in_flight{{{worker}}} 0" in body
+
+def test_run_compile_overloaded(simulator_client, monkeypatch):
+    monkeypatch.setattr(app_module, "admission", AdmissionControl(maxRunning=1, maxQueued=0, maxWait=1))
+    app_module.admission.acquire()
+    
+    response = simulator_client.post("/runCompile", json={"program": "void main(void) {\n    output(1);\n}\n"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    
+    response = simulator_client.get("/queueStats")
+    assert response.status_code == 503
+    assert response.get_json()["rejected"] == 1
+    
+    app_module.admission.release()
+    response = simulator_client.get("/queueStats")
+    assert response.status_code == 200
+
+def test_warm_up_program_runs(simulator_client):
+    response = simulator_client.post("/runCompile", json={"program": app_module.WARM_UP_PROGRAM, "inputs": [-3]})
+    assert response.status_code == 200
+    assert response.get_json()["outputs"] == [6]
+
+def test_step_budget(simulator_client):
+    program = "void main(void) {\n    output(1);\n    while (1 == 1) { }\n}\n"
+    response = simulator_client.post("/runCompile", json={"program": program, "stepBudget": 1000})
+    assert response.status_code == 408
+    assert response.get_json()["error"] == "Step budget exceeded"
+    assert response.get_json()["outputs"] == [1]
+    
+    response = simulator_client.post("/runCompile", json={"program": program, "stepBudget": -1})
+    assert response.status_code == 400
+    
+    # a budget of one step is enough for a program that only enters main
+    response = simulator_client.post("/runCompile", json={"program": "void main(void) { output(1); }", "stepBudget": 1})
+    assert response.status_code == 200
+    assert response.get_json()["outputs"] == [1]
+    
+    response = simulator_client.post("/performTestCases", json={
+        "program": "int f(int n) { while (n > 0) { n = n - 1; } return 0; }",
+        "funName": "f",
+        "testCases": [[5], [5000]],
+        "stepBudget": 100
+    })
+    results = response.get_json()["results"]
+    assert results[0]["error"] == "" and results[0]["output"] == 0
+    assert results[1]["error"] == "Step budget exceeded"
+
+def test_run_compile_batch(simulator_client):
+    program = "void main(void) {\n    output(input() * 2);\n}\n"
+    items = [
+        {"program": program, "inputs": [1]},
+        {"program": program, "inputs": [2]},
+        {"program": program, "inputs": [1]},
+        {"program": "void main(void) { output(1) }"},
+        "not an item"
+    ]
+    response = simulator_client.post("/runCompileBatch", json={"items": items})
+    assert response.status_code == 200
+    
+    data = response.get_json()
+    assert data["skipped"] == 0
+    results = data["results"]
+    assert [result["outputs"] for result in results[:3]] == [[2], [4], [2]]
+    assert [result["status"] for result in results] == [200, 200, 200, 400, 400]
+    assert results[3]["error"] == "Syntax error in program"
+
+def test_run_compile_batch_time_budget(simulator_client, monkeypatch):
+    monkeypatch.setattr(app_module, "backend", Simulator(maxSteps=10**9))
+    items = [{"program": "void main(void) { while (1 == 1) { } }", "inputs": [i]} for i in range(2)]
+    
+    response = simulator_client.post("/runCompileBatch", json={"items": items, "timeBudget": 0.2})
+    data = response.get_json()
+    assert data["skipped"] == 2
+    assert all(result["skipped"] for result in data["results"])
+    
+    # the runs stop at the deadline instead of running to the step limit
+    end = time.monotonic() + 2
+    while app_module.admission.stats()["running"] > 0 and time.monotonic() < end:
+        time.sleep(0.01)
+    assert app_module.admission.stats()["running"] == 0
+
+def test_perform_test_cases_overloaded(simulator_client, monkeypatch):
+    # the queue has room when the request is checked, but the runs wait too long for a slot
+    monkeypatch.setattr(app_module, "admission", AdmissionControl(maxRunning=1, maxQueued=1, maxWait=0.01))
+    app_module.admission.acquire()
+    body = {"program": "int f(int n) { return n; }", "funName": "f", "testCases": [[1], [2], [3]]}
+    
+    try:
+        response = simulator_client.post("/performTestCases", json=body)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        
+        response = simulator_client.post("/performTestCases?stream=ndjson", json=body)
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert records[-1]["type"] == "error"
+        assert records[-1]["status"] == 429
+    finally:
+        app_module.admission.release()
+
+def test_server_timing(simulator_client, monkeypatch, capsys):
+    monkeypatch.setattr(app_module, "SLOW_REQUEST_THRESHOLD", 1e-9)
+    program = "void main(void) {\n    output(input());\n}\n"
+    response = simulator_client.post("/runCompile", json={"program": program, "inputs": [4]})
+    
+    timings = response.headers["Server-Timing"]
+    for stage in ["lex", "parse", "type_check", "codegen", "run", "total"]:
+        assert f"{stage};dur=" in timings
+    
+    entry = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert entry["event"] == "slow_request"
+    assert entry["endpoint"] == "run_compile"
+    assert entry["programSize"] == len(program)
+    assert len(entry["programHash"]) == 64
+    assert "run" in entry["stages"]
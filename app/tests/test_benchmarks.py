@@ -0,0 +1,51 @@
+import pytest
+import app as app_module
+from app import app
+from simulator import Simulator
+from benchmarks.corpus import CORPUS
+from benchmarks.load_test import compare, percentile
+from benchmarks.compiler_bench import SHAPES, bench_shape, growth_exponent
+from compiler import Compiler
+
+@pytest.fixture
+def simulator_client(monkeypatch):
+    monkeypatch.setattr(app_module, "backend", Simulator())
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case.name for case in CORPUS])
+def test_corpus_statuses(simulator_client, case):
+    response = simulator_client.post(case.endpoint, json=case.payload)
+    assert response.status_code == case.expectedStatus
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([3], 0.95) == 3
+    assert percentile([], 0.5) == 0.0
+
+def test_compare():
+    baseline = {"endpoints": {"/runCompile": {"p95": 0.1, "requestsPerSecond": 100}}}
+    results = {"endpoints": {"/runCompile": {"p95": 0.15, "requestsPerSecond": 100}}}
+    
+    _, isRegression = compare(baseline, results, 0.2)
+    assert isRegression is True
+    _, isRegression = compare(baseline, results, 0.6)
+    assert isRegression is False
+
+@pytest.mark.parametrize("shape", list(SHAPES))
+def test_bench_shapes_are_valid(shape):
+    generate, base = SHAPES[shape]
+    assert Compiler(generate(base)).isTypingValid() is True
+
+def test_growth_exponent():
+    assert growth_exponent([1, 2, 4], [3, 12, 48]) == pytest.approx(2)
+    assert growth_exponent([1], [1]) == None
+
+def test_bench_shape():
+    result = bench_shape("long_expression", [1, 2], repeat=1)
+    assert [run["scale"] for run in result["runs"]] == [1, 2]
+    assert all(result["runs"][1]["peakBytes"][stage] > 0 for stage in ["lex", "parse", "type_check", "codegen"])
+    assert result["exponents"]["parse"] != None
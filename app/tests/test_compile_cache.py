@@ -0,0 +1,66 @@
+from compile_cache import CompileCache
+
+PROGRAM = "void main(void) {\n    int x;\n    x = 5;\n    output(x);\n}\n"
+
+def test_whitespace_and_comments_hit():
+    cache = CompileCache()
+    first = cache.get(PROGRAM)
+    second = cache.get("/* same program */ void main(void) { int x; x = 5; output(x); }")
+    
+    assert first is second
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_stages_are_cached():
+    cache = CompileCache()
+    compiled = cache.get(PROGRAM)
+    
+    assert compiled.checkTyping() is True
+    assembly = compiled.generateAssembly()
+    assert "main_entry:" in assembly
+    assert cache.get(PROGRAM).generateAssembly() is assembly
+
+def test_program_is_lexed_once(monkeypatch):
+    from compiler.lexer import Lexer
+    tokenized = []
+    tokenize = Lexer.tokenize
+    monkeypatch.setattr(Lexer, "tokenize", lambda lexer: tokenized.append(lexer.tokens == None) or tokenize(lexer))
+    
+    compiled = CompileCache().get(PROGRAM)
+    assert compiled.checkTyping() is True
+    assert tokenized.count(True) == 1
+
+def test_syntax_errors_only_hit_same_source():
+    cache = CompileCache()
+    invalid = "void main(void) {\n    int x;\n    x = 5\n    output(x);\n}\n"
+    
+    compiled = cache.get(invalid)
+    assert compiled.isSyntaxValid is False
+    assert cache.get(invalid) is compiled
+    
+    # the same tokens with a different layout have the error in another line
+    moved = cache.get("\n" + invalid)
+    assert moved is not compiled
+    assert moved.syntaxError[1] == compiled.syntaxError[1] + 1
+
+def test_eviction_by_count():
+    cache = CompileCache(maxEntries=2)
+    for value in range(3):
+        cache.get(f"void main(void) {{ output({value}); }}")
+    
+    stats = cache.stats()
+    assert stats['entries'] == 2
+    assert stats['evictions'] == 1
+
+def test_eviction_by_bytes():
+    cache = CompileCache()
+    entries = [cache.get(f"void main(void) {{ output({value}); }}") for value in range(3)]
+    assert cache.stats()['bytes'] == sum(entry.size() for entry in entries)
+    
+    # the assembly is counted once it's generated, which takes the cache over its limit
+    cache.maxBytes = cache.stats()['bytes'] + 1
+    entries[2].generateAssembly()
+    
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] == entries[1].size() + entries[2].size()
@@ -0,0 +1,37 @@
+from compiler.diagnostics import Diagnostics, LineIndex
+from compiler.lexer import Lexer
+from compiler.parser import Parser
+from compiler.type_checker import TypeChecker
+
+def test_line_index():
+    index = LineIndex("int x;\n\nvoid main(void) {}")
+    
+    assert index.position(0) == (1, 1)
+    assert index.position(6) == (1, 7)
+    assert index.position(7) == (2, 1)
+    assert index.position(12) == (3, 5)
+    assert index.line(1) == "int x;"
+    assert index.line(2) == ""
+    assert index.line(3) == "void main(void) {}"
+
+def test_errors_are_capped():
+    program = "int x;\n" + "x = 1 ! 2;\n" * 10
+    lexer = Lexer(program, diagnostics=Diagnostics(program, maxErrors=3, prints=False))
+    lexer.tokenize()
+    
+    assert [error['line'] for error in lexer.diagnostics.toList()] == [2, 3, 4]
+    assert lexer.diagnostics.errorCount == 10
+    assert lexer.diagnostics.isTruncated()
+    assert (lexer.errorLine, lexer.errorColumn) == (2, 7)
+
+def test_errors_of_all_stages_are_collected(capsys):
+    program = "void main(void) {\n    int x;\n    x = y;\n    output(x)\n}\n"
+    lexer = Lexer(program, diagnostics=Diagnostics(program, prints=False))
+
+    parser = Parser(program, lexer=lexer)
+    typeChecker = TypeChecker(program, AST=parser.parse(), parser=parser)
+    assert typeChecker.checkTyping() is False
+    assert (typeChecker.errorLine, typeChecker.errorColumn) == (3, 10)
+    
+    assert [(error['type'], error['line']) for error in lexer.diagnostics.toList()] == [("Semantic", 3), ("Syntax", 4)]
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,25 @@
+from compiler import Compiler
+from harness import build_batched_main, build_test_main, split_batched_output, validate_test_case
+
+PROGRAM = "int sum(int nums[], int size) {\nint i;\nint total;\ni = 0;\ntotal = 0;\nwhile (i < size) {\ntotal = total + nums[i];\ni = i + 1;\n}\nreturn total;\n}"
+
+def test_build_test_main_compiles():
+    compiler = Compiler(build_test_main("sum", [[1, -2, 3], 3]) + PROGRAM)
+    assert compiler.isTypingValid() is True
+
+def test_build_batched_main_compiles():
+    test_cases = [[[1, 2], 2], [[0, -1, 2], 3], [[5], 1]]
+    program = build_batched_main("sum", test_cases, 123456789) + PROGRAM
+    
+    compiler = Compiler(program)
+    assert compiler.isTypingValid() is True
+    assert program.count("output(123456789);") == len(test_cases)
+
+def test_split_batched_output():
+    # the last test case did not reach its marker, so it is not returned
+    assert split_batched_output([7, 1, 999, 2, 999, 4], 999) == [[7, 1], [2]]
+
+def test_validate_test_case():
+    assert validate_test_case([1, [1, 2]]) is True
+    assert validate_test_case(["1"]) is False
+    assert validate_test_case([[1, "a"]]) is False
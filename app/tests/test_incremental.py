@@ -0,0 +1,149 @@
+from compiler.incremental import IncrementalDocument
+from compile_cache import CompiledProgram
+from sessions import SessionStore, SessionNotFound
+import multiprocessing
+import pytest
+import random
+
+PROGRAM = """int values[4];
+
+int twice(int a) {
+    return a * 2;
+}
+
+/* the entry point */
+void main(void) {
+    output(twice(input()));
+}
+"""
+
+def whole_program_result(program):
+    compiled = CompiledProgram(program)
+    compiled.parse()
+    return compiled.isLexerValid, compiled.lexerError, compiled.isSyntaxValid, compiled.syntaxError
+
+def document_result(document):
+    return document.isLexerValid, document.lexerError, document.isSyntaxValid, document.syntaxError
+
+def test_segments_are_declarations():
+    document = IncrementalDocument(PROGRAM)
+    
+    assert [segment.text.strip() for segment in document.segments][:2] == ["int values[4];", "int twice(int a) {\n    return a * 2;\n}"]
+    assert document.text() == PROGRAM
+    assert document.isSyntaxValid and document.isLexerValid
+
+def test_edit_only_parses_touched_declaration():
+    document = IncrementalDocument(PROGRAM)
+    untouched = document.segments[0], document.segments[2]
+    
+    position = PROGRAM.index("a * 2")
+    document.edit(position, position + 1, "")
+    assert document.syntaxError == whole_program_result(document.text())[3]
+    assert document.syntaxError[1] == 4
+    assert (document.segments[0], document.segments[2]) == untouched
+    
+    document.edit(position, position, "a")
+    assert document_result(document) == whole_program_result(PROGRAM)
+
+def test_unclosed_comment_and_brace_spread():
+    document = IncrementalDocument(PROGRAM)
+    program = PROGRAM
+    for position, text in [(PROGRAM.index("int twice"), "/*"), (len("int values[4];"), "{")]:
+        document.edit(position, position, text)
+        program = program[:position] + text + program[position:]
+        assert document.text() == program
+        assert document_result(document) == whole_program_result(program)
+        assert [segment.text for segment in document.segments] == [segment.text for segment in IncrementalDocument(program).segments]
+
+def test_random_edits_match_whole_program():
+    rng = random.Random(1)
+    pieces = ["int", "void", "(", ")", "{", "}", ";", "x", "1", "=", "!", "@", "/*", "*/", "\n", "return"]
+    document = IncrementalDocument(PROGRAM)
+    program = PROGRAM
+    
+    for _ in range(300):
+        start = rng.randint(0, len(program))
+        end = min(start + rng.randint(0, 4), len(program))
+        text = rng.choice(pieces) if rng.random() < 0.6 else ""
+        
+        document.edit(start, end, text)
+        program = program[:start] + text + program[end:]
+        if document.exception == None:
+            assert document_result(document) == whole_program_result(program)
+
+def test_edit_outside_document():
+    with pytest.raises(ValueError):
+        IncrementalDocument("int x;").edit(3, 10, "")
+
+def test_sessions_are_evicted():
+    store = SessionStore(maxSessions=2, idleTimeout=60)
+    first = store.open(PROGRAM)
+    second = store.open(PROGRAM)
+    store.get(first.id)
+    store.open(PROGRAM)
+    
+    # the least recently used one is evicted
+    with pytest.raises(SessionNotFound):
+        store.get(second.id)
+    assert store.get(first.id) is first
+    
+    store.idleTimeout = 0
+    with pytest.raises(SessionNotFound):
+        store.get(first.id)
+    assert store.stats()['sessions'] == 0
+
+def test_sessions_are_evicted_by_size():
+    store = SessionStore()
+    first = store.open(PROGRAM)
+    second = store.open(PROGRAM)
+    assert store.stats()['bytes'] == first.document.size() + second.document.size()
+    
+    # the edit is counted, and takes the sessions over the limit
+    store.maxBytes = store.stats()['bytes'] + 1
+    store.edit(second.id, [(0, 0, "int x;\n")])
+    assert store.stats()['bytes'] == second.document.size()
+    with pytest.raises(SessionNotFound):
+        store.get(first.id)
+    
+    store.close(second.id)
+    assert store.stats()['bytes'] == 0
+
+def test_sessions_are_shared_through_the_store(tmp_path):
+    # two stores with the same file stand in for two worker processes
+    path = str(tmp_path / "sessions.sqlite3")
+    first = SessionStore(storePath=path)
+    second = SessionStore(storePath=path)
+    
+    session = first.open(PROGRAM)
+    edited = second.edit(session.id, [(0, 0, "int x;\n")])
+    assert edited.document.text() == "int x;\n" + PROGRAM
+    
+    # the first one parses the document again, since its version is older
+    edited = first.edit(session.id, [(0, 0, "int y;\n")])
+    assert edited.document.text() == "int y;\nint x;\n" + PROGRAM
+    assert edited.document.isSyntaxValid
+    
+    second.close(session.id)
+    with pytest.raises(SessionNotFound):
+        first.get(session.id)
+    with pytest.raises(SessionNotFound):
+        first.close(session.id)
+
+def insert_declaration(path, sessionId, name):
+    store = SessionStore(storePath=path)
+    store.edit(sessionId, [(0, 0, f"int {name};\n")])
+
+def test_sessions_are_edited_by_worker_processes(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SessionStore(storePath=path)
+    session = store.open(PROGRAM)
+    
+    # the edits are made at the same time by forked processes, like gunicorn workers, and none of them is lost
+    names = [f"x{letter}" for letter in "abcdefgh"]
+    with multiprocessing.get_context("fork").Pool(2) as pool:
+        pool.starmap(insert_declaration, [(path, session.id, name) for name in names])
+    
+    document = store.get(session.id).document
+    assert document.text().endswith(PROGRAM)
+    assert sorted(document.text()[:-len(PROGRAM)].split()) == sorted(["int"] * 8 + [f"{name};" for name in names])
+    assert document.isSyntaxValid
@@ -0,0 +1,28 @@
+import threading
+from jobs import JobQueue
+
+def test_jobs_are_shared_through_the_store(tmp_path):
+    # two queues with the same store stand in for two worker processes
+    path = str(tmp_path / "jobs.sqlite3")
+    first = JobQueue(workers=1, storePath=path)
+    second = JobQueue(workers=1, storePath=path)
+    release = threading.Event()
+    
+    def function(value):
+        release.wait(5)
+        return {'value': value}, 200
+    
+    job = first.submit("runCompile", function, 3)
+    remote = second.get(job.id)
+    assert remote != None
+    assert remote.status in ["queued", "running"]
+    
+    release.set()
+    remote = second.wait(remote, 5)
+    assert remote.status == "done"
+    assert remote.result == {'value': 3}
+    assert remote.statusCode == 200
+
+def test_unknown_job(tmp_path):
+    queue = JobQueue(workers=1, storePath=str(tmp_path / "jobs.sqlite3"))
+    assert queue.get("unknown") == None
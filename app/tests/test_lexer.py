@@ -0,0 +1,69 @@
+from compiler.global_types import TokenType
+from compiler.lexer import Lexer
+
+def lex(program):
+    lexer = Lexer(program)
+    tokens = []
+    while True:
+        token, lexeme = lexer.getToken()
+        tokens.append((token, lexeme))
+        if token == TokenType.ENDFILE:
+            return lexer, tokens
+
+def test_tokens():
+    _, tokens = lex("int x; /* comment */ while (x <= 10) { x = x / 2; }")
+    assert [token for token, _ in tokens] == [
+        TokenType.INT, TokenType.ID, TokenType.SEMICOLON, TokenType.WHILE, TokenType.LPAR, TokenType.ID,
+        TokenType.LETHEQ, TokenType.NUM, TokenType.RPAR, TokenType.LKEY, TokenType.ID, TokenType.ASSIGN,
+        TokenType.ID, TokenType.OVER, TokenType.NUM, TokenType.SEMICOLON, TokenType.RKEY, TokenType.ENDFILE
+    ]
+    assert tokens[1] == (TokenType.ID, "x")
+    assert tokens[7] == (TokenType.NUM, "10")
+
+def test_errors():
+    lexer, tokens = lex("int x;\nx = 12a;\ny = 1 ! 2;")
+    assert (TokenType.ERROR, "") in tokens
+    assert lexer.isSyntaxValid is False
+    assert lexer.firstErrorMessage == "A letter cannot be next to a number"
+    assert (lexer.errorLine, lexer.errorColumn) == (2, 7)
+
+def test_unterminated_comment():
+    _, tokens = lex("int x; /* no end")
+    assert tokens[-1] == (TokenType.ENDFILE, "$")
+
+def buffers(program):
+    # the tokens of the fast path, and of the DFA, with the state of the lexer after each one
+    results = []
+    for tokenize in [Lexer._tokenizeWithPattern, Lexer._tokenizeWithDFA]:
+        lexer = Lexer(program)
+        tokens = tokenize(lexer)
+        if tokens == None:
+            results.append(None)
+            continue
+        results.append((
+            list(tokens.types), list(tokens.starts), list(tokens.ends), [tokens.lexeme(i) for i in range(len(tokens))],
+            lexer.firstErrorMessage, lexer.errorLine, lexer.errorColumn
+        ))
+    return results
+
+def test_fast_path_matches_the_dfa():
+    program = "int f(int a[]) { /* a ** comment **/ */ return a[0] != 10; }\nvoid main(void) { output(f(x) >= 2); }\n"
+    fast, dfa = buffers(program)
+    assert fast != None
+    assert fast == dfa
+
+def test_fast_path_falls_back_to_the_dfa():
+    for program in ["int x; x = 1 ! 2;", "int x$y;", "x = 3\r\n;", "/* unterminated"]:
+        fast, dfa = buffers(program)
+        assert fast == None
+        assert dfa != None
+
+def test_token_buffer():
+    tokens = Lexer("int x; x = 1 ! 2").tokenize()
+    assert [tokens.token(i) for i in range(len(tokens))] == [
+        TokenType.INT, TokenType.ID, TokenType.SEMICOLON, TokenType.ID, TokenType.ASSIGN, TokenType.NUM,
+        TokenType.ERROR, TokenType.NUM, TokenType.ENDFILE
+    ]
+    assert [tokens.lexeme(i) for i in range(len(tokens))] == ["int", "x", ";", "x", "=", "1", "", "2", "$"]
+    # the error is the character after '!', which is skipped
+    assert (tokens.starts[6], tokens.ends[6]) == (15, 15)
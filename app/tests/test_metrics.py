@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+import subprocess
+import pytest
+import metrics
+
+def test_histogram_render():
+    histogram = metrics.Histogram("duration_seconds", "Duration", ["stage"], buckets=(0.1, 1))
+    histogram.observe(0.05, "lex")
+    histogram.observe(0.5, "lex")
+    histogram.observe(5, "lex")
+    
+    lines = histogram.render()
+    assert 'duration_seconds_bucket{stage="lex",le="0.1"} 1' in lines
+    assert 'duration_seconds_bucket{stage="lex",le="1"} 2' in lines
+    assert 'duration_seconds_bucket{stage="lex",le="+Inf"} 3' in lines
+    assert 'duration_seconds_count{stage="lex"} 3' in lines
+
+def render_registry():
+    registry = metrics.Registry()
+    registry.register(metrics.Counter("requests_total", "Requests", ["status"])).inc("200")
+    registry.register(metrics.Gauge("in_flight", "In flight"))
+    return os.getpid(), registry.render()
+
+def test_registry_labels_worker():
+    # the samples of a forked worker are told apart by its pid
+    with multiprocessing.get_context("fork").Pool(1) as pool:
+        pid, body = pool.apply(render_registry)
+    assert pid != os.getpid()
+    assert f'requests_total{{worker="{pid}",status="200"}} 1' in body
+    assert "# TYPE requests_total counter" in body
+    
+    pid, body = render_registry()
+    assert f'requests_total{{worker="{pid}",status="200"}} 1' in body
+
+def test_stage_outcomes():
+    token = metrics.endpoint.set("test_stage_outcomes")
+    try:
+        with metrics.stage("parse") as stage:
+            stage.outcome = "syntax_error"
+        
+        with pytest.raises(subprocess.TimeoutExpired):
+            with metrics.stage("run"):
+                raise subprocess.TimeoutExpired("spim", 1)
+    finally:
+        metrics.endpoint.reset(token)
+    
+    assert metrics.STAGE_SECONDS.count("parse", "test_stage_outcomes", "syntax_error") == 1
+    assert metrics.STAGE_SECONDS.count("run", "test_stage_outcomes", "timeout") == 1
+    assert metrics.TIMEOUTS.get("test_stage_outcomes") == 1
+
+def test_request_timings():
+    timings = metrics.RequestTimings()
+    token = metrics.requestTimings.set(timings)
+    try:
+        with metrics.stage("lex"):
+            pass
+        with metrics.stage("lex"):
+            pass
+        metrics.record("queue_wait", 0.5)
+    finally:
+        metrics.requestTimings.reset(token)
+    
+    assert set(timings.stages()) == {"lex", "queue_wait"}
+    assert "queue_wait;dur=500.000" in timings.serverTiming()
+    assert timings.serverTiming().split(", ")[-1].startswith("total;dur=")
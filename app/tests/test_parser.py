@@ -0,0 +1,67 @@
+from compiler.global_types import NodeTypes, NO_CHILDREN
+from compiler.parser import Parser
+from compiler.type_checker import TypeChecker
+from compiler.code_generator import CodeGenerator
+import contextlib
+import io
+
+PROGRAM = "int total;\nvoid main(void) {\n    int values[4];\n    total = values[1] + total;\n}\n"
+
+def nodes(AST):
+    found = []
+    pending = [AST]
+    while pending:
+        node = pending.pop()
+        found.append(node)
+        pending.extend(node.children)
+    return found
+
+def test_compact_nodes():
+    AST = Parser(PROGRAM).parse()
+    found = nodes(AST)
+    assert all(not hasattr(node, "__dict__") for node in found)
+
+    # the labels of an ID are the same string, and nodes without children share them
+    totals = [node.label for node in found if node.label == "total"]
+    assert len(totals) == 3 and all(label is totals[0] for label in totals)
+    assert all(node.children is NO_CHILDREN for node in found if node.type == NodeTypes.NUM)
+
+    declaration = next(node for node in found if node.type == NodeTypes.VarDeclaration and node.label == "values")
+    assert declaration.arraySize == 4
+    assert isinstance(NodeTypes.BinaryOp, int)
+
+def test_print_AST():
+    parser = Parser(PROGRAM)
+    parser.parse()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        parser.printAST()
+    assert "VarDeclaration: total" in output.getvalue()
+    assert "BinaryOp: +" in output.getvalue()
+
+def test_deep_nesting():
+    # deeper than the recursion limit of Python, which the parser and the tree walks used to be bound by
+    depth = 900
+    expression = "(" * depth + "x + 1" + ")" * depth
+    blocks = "if (x < 1) { " * (depth // 2) + "x = " + expression + ";" + " }" * (depth // 2)
+    program = "void main(void) {\n    int x;\n    x = input();\n    " + blocks + "\n    output(x);\n}\n"
+    
+    parser = Parser(program)
+    AST = parser.parse()
+    assert parser.isSyntaxValid
+    assert TypeChecker(program, AST=AST, parser=parser).checkTyping()
+    assembly = CodeGenerator(AST, filePath=None).generateCode()
+    assert assembly.count("true_branch_") == depth // 2
+
+def test_nesting_limit():
+    program = "void main(void) {\n    output(" + "(" * 20 + "1" + ")" * 20 + ");\n}\n"
+    parser = Parser(program, maxNesting=10)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        assert parser.parse() == None
+    
+    assert parser.firstErrorMessage == "Too deeply nested, the limit is 10 levels"
+    assert (parser.lineNumber, parser.columnNumber) == (2, 22)
+    assert parser.lexer.diagnostics.isStopped
+    
+    assert Parser(program, maxNesting=21).parse() != None
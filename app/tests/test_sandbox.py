@@ -0,0 +1,168 @@
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+import sandbox
+from compile_cache import CompiledProgram
+from sandbox import SpimPool, parse_spim_output
+
+# stands in for spim's interactive mode: "run" outputs the numbers loaded with li $a0 in the program
+FAKE_SPIM = '''
+import sys
+def write(text):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+write("SPIM Version 8.0\\nLoaded: /usr/lib/spim/exceptions.s\\n(spim) ")
+program = ""
+for line in sys.stdin:
+    command = line.strip()
+    if command.startswith("load"):
+        program = open(command.split('"')[1]).read()
+    elif command == "run":
+        if "hang" in program:
+            while True:
+                pass
+        for instruction in program.splitlines():
+            if instruction.startswith("li $a0"):
+                write(instruction.split()[-1] + "\\n")
+    write("(spim) ")
+'''
+
+@pytest.fixture
+def fake_spim(tmp_path, monkeypatch):
+    script = tmp_path / "fake_spim.py"
+    script.write_text(FAKE_SPIM)
+    monkeypatch.setattr(sandbox, "sandbox_command", lambda sandbox_dir, command, debug=False: [sys.executable, str(script)])
+
+def test_pool_runs_programs(fake_spim):
+    pool = SpimPool(size=1, maxRunsPerWorker=10)
+    try:
+        for value in [3, 7]:
+            result = pool.run(f"li $a0 {value}\n", timeout=5)
+            assert parse_spim_output(result.stdout) == [value]
+        
+        # the same worker is reused
+        assert pool.idle.qsize() == 1
+        assert pool.idle.queue[0].runs == 2
+    finally:
+        pool.close()
+
+def test_pool_recycles_workers(fake_spim):
+    pool = SpimPool(size=1, maxRunsPerWorker=1)
+    try:
+        pool.run("li $a0 1\n", timeout=5)
+        assert pool.idle.qsize() == 0
+    finally:
+        pool.close()
+
+def test_pool_timeout_discards_worker(fake_spim):
+    pool = SpimPool(size=1, maxRunsPerWorker=10)
+    try:
+        with pytest.raises(subprocess.TimeoutExpired):
+            pool.run("hang\n", timeout=0.5)
+        assert pool.idle.qsize() == 0
+        
+        # a new worker takes its place
+        result = pool.run("li $a0 4\n", timeout=5)
+        assert parse_spim_output(result.stdout) == [4]
+    finally:
+        pool.close()
+
+def test_run_once_in_memory(tmp_path, monkeypatch):
+    # stands in for spim -file: outputs the numbers loaded with li $a0 in the file
+    script = tmp_path / "fake_spim_file.py"
+    script.write_text(
+        "import sys\n"
+        "print('Loaded: /usr/lib/spim/exceptions.s')\n"
+        "for instruction in open(sys.argv[2]).read().splitlines():\n"
+        "    print(instruction.split()[-1])\n"
+    )
+    
+    directories = []
+    def command(sandbox_dir, command, debug=False):
+        directories.append(sandbox_dir)
+        return [sys.executable, str(script)] + command[1:]
+    monkeypatch.setattr(sandbox, "sandbox_command", command)
+    
+    result = sandbox.run_once("li $a0 5\nli $a0 6\n", timeout=5)
+    assert parse_spim_output(result.stdout) == [5, 6]
+    
+    # the program is passed in memory, without a sandbox directory
+    if sandbox.IN_MEMORY:
+        assert directories == [None]
+
+def test_sandbox_command_is_quiet(capsys):
+    # built for every run and every pool worker, so it mustn't write to the server's output
+    command = sandbox.sandbox_command(None, ["spim", "-file", "program.s"])
+    assert command[-3:] == ["spim", "-file", "program.s"]
+    assert "/lib64" in command
+    assert capsys.readouterr().out == ""
+
+def test_output_limit_stops_the_program():
+    # prints forever, so the run only ends because of the output limit
+    command = [sys.executable, "-c", "print('Loaded: exceptions.s')\nwhile True: print(7)"]
+    result = sandbox.run_bounded(command, b"", 5, sandbox.OutputBuffer(maxBytes=1024 * 1024, maxLines=1000))
+    
+    assert result.truncated is True
+    assert parse_spim_output(result.stdout) == [7] * 999
+
+def test_output_buffer_byte_limit():
+    output = sandbox.OutputBuffer(maxBytes=10, maxLines=100)
+    assert output.write(b"1\n2\n") is True
+    assert output.write(b"345\n6789\n") is False
+    assert output.getvalue() == b"1\n2\n345\n67"
+    assert output.lines == 3
+
+def test_busy_pool_is_unavailable(fake_spim):
+    pool = SpimPool(size=1, maxRunsPerWorker=10)
+    try:
+        pool.slots.acquire()
+        with pytest.raises(sandbox.WorkerUnavailable):
+            pool.run("li $a0 1\n", timeout=5)
+        
+        # a busy pool is still used by the next runs
+        assert pool.isEnabled
+    finally:
+        pool.close()
+
+# the programs run by the real spim, the same worker runs all of them, so they also show it's reset between programs
+SPIM_PROGRAMS = [
+    "void main(void) {\n    output(1);\n}\n",
+    "int count;\nvoid main(void) {\n    count = count + 5;\n    output(count);\n}\n",
+    "int values[10];\nvoid main(void) {\n    int i;\n    i = 0;\n    while (i < 10) {\n        values[i] = i * i;\n        output(values[i]);\n        i = i + 1;\n    }\n}\n",
+    "int factorial(int n) {\n    if (n < 2) {\n        return 1;\n    }\n    return n * factorial(n - 1);\n}\nvoid main(void) {\n    output(factorial(10));\n}\n",
+]
+
+def program_output(stdout):
+    # the output after the line of the banner that says which exceptions file was loaded
+    output = stdout.decode()
+    return output[output.find('Loaded'):].split('\n', 1)[1]
+
+@pytest.mark.skipif(shutil.which("spim") == None or shutil.which("bwrap") == None, reason="needs spim and bwrap")
+def test_pool_matches_spim_file():
+    # the pool parses spim's interactive mode, which has to give the same output as spim -file
+    debug = not os.path.isdir("/lib64")
+    assemblies = []
+    for program in SPIM_PROGRAMS:
+        compiled = CompiledProgram(program)
+        assert compiled.checkTyping() is True
+        assemblies.append(compiled.generateAssembly())
+    
+    pool = SpimPool(size=1, maxRunsPerWorker=100, debug=debug)
+    try:
+        for assembly in assemblies * 2:
+            expected = sandbox.run_once(assembly, timeout=10, debug=debug)
+            result = pool.run(assembly, timeout=10)
+            
+            assert program_output(result.stdout) == program_output(expected.stdout)
+            assert parse_spim_output(result.stdout) == parse_spim_output(expected.stdout)
+            assert result.stderr == expected.stderr
+            assert result.truncated == expected.truncated
+        
+        # all the programs ran in the same worker
+        assert pool.idle.qsize() == 1
+        assert pool.idle.queue[0].runs == len(assemblies) * 2
+    finally:
+        pool.close()
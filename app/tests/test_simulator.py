@@ -0,0 +1,65 @@
+import pytest
+import subprocess
+from compile_cache import CompileCache
+from sandbox import parse_spim_output
+from simulator import Simulator, StepLimitExceeded
+
+def assemble(program):
+    compiled = CompileCache().get(program)
+    assert compiled.checkTyping() is True
+    return compiled.generateAssembly()
+
+def run(program, inputs=[], **limits):
+    input_data = ('\n'.join(str(inp) for inp in inputs) + '\n').encode()
+    return Simulator(**limits).run(assemble(program), input_data)
+
+def test_recursion_and_arithmetic():
+    result = run("int fact(int n) { if (n <= 1) { return 1; } else { return n * fact(n - 1); } }\n"
+                 "void main(void) { output(fact(10)); output(0 - 7 / 2); output(3 > 2); output(2 != 2); }")
+    assert result.stderr == b""
+    assert parse_spim_output(result.stdout) == [3628800, -3, 1, 0]
+
+def test_inputs_and_missing_inputs():
+    result = run("void main(void) { int x; x = input(); output(x * 2); output(input()); }", [21])
+    assert parse_spim_output(result.stdout) == [42, 0]
+
+def test_global_arrays():
+    result = run("int g[5];\n"
+                 "int sum(int a[], int n) { int i; int t; i = 0; t = 0; while (i < n) { t = t + a[i]; i = i + 1; } return t; }\n"
+                 "void main(void) { int i; i = 0; while (i < 5) { g[i] = i * i; i = i + 1; } output(sum(g, 5)); }")
+    assert parse_spim_output(result.stdout) == [30]
+
+def test_step_limit():
+    with pytest.raises(StepLimitExceeded) as e:
+        run("void main(void) { output(1); while (1 == 1) { } }", maxSteps=10000)
+    
+    # the output written before the limit is kept, like the output of a timeout
+    assert parse_spim_output(e.value.stdout) == [1]
+
+def test_timeout():
+    with pytest.raises(subprocess.TimeoutExpired) as e:
+        Simulator(maxSteps=10**9).run(assemble("void main(void) { output(1); while (1 == 1) { } }"), timeout=0.05)
+    
+    assert parse_spim_output(e.value.output) == [1]
+
+def test_memory_limit():
+    result = run("int f(int n) { return f(n + 1); } void main(void) { output(f(0)); }", maxMemory=64 * 1024)
+    assert result.stderr == b"Memory limit exceeded\n"
+
+def test_arithmetic_overflow():
+    result = run("void main(void) { int x; x = 2147483647; output(x + 1); }")
+    assert b"Arithmetic overflow" in result.stderr
+
+def test_output_limit():
+    result = run("void main(void) { int i; i = 0; while (1 == 1) { output(i); i = i + 1; } }", maxOutputLines=100)
+    
+    assert result.truncated is True
+    assert parse_spim_output(result.stdout) == list(range(100))
+
+def test_step_budget():
+    compiled = CompileCache().get("int f(int n) { return n; } void main(void) { int i; i = 0; while (1 == 1) { output(f(i)); i = i + 1; } }")
+    result = Simulator().run(compiled.generateAssembly(stepBudget=7))
+    
+    # each iteration calls f and takes the back edge, and main's entry counts as well
+    assert result.stdout.endswith(b"step budget exceeded\n")
+    assert parse_spim_output(result.stdout[:-len(b"step budget exceeded\n")]) == [0, 1, 2]